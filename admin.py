@@ -12,7 +12,9 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command
 
 from config import Config
-from database import db
+from database import adb
+from broadcast import broadcaster
+from backup import backups
 from keyboards import main as kb_main
 from keyboards import inline as kb_inline
 from handlers.utils import (
@@ -39,21 +41,21 @@ class AdminStates(StatesGroup):
 
 # ==================== ПРОВЕРКА ДОСТУПА ====================
 
-def check_admin_access(user_id: int) -> bool:
+async def check_admin_access(user_id: int) -> bool:
     """Проверка доступа пользователя к админ-панели"""
-    return db.is_admin_user(user_id)
+    return await adb.is_admin_user(user_id)
 
 async def require_admin(message: Message = None, callback: CallbackQuery = None):
     """Декоратор для проверки прав администратора"""
     user_id = message.from_user.id if message else callback.from_user.id
     
-    if not check_admin_access(user_id):
+    if not await check_admin_access(user_id):
         if message:
             await message.answer(
                 "❌ <b>Доступ запрещен!</b>\n\n"
                 "У вас нет прав администратора.\n\n"
                 "Используйте команду /admin для входа в админ-панель.",
-                reply_markup=kb_main.get_main_menu(telegram_id=user_id, db_instance=db)
+                reply_markup=kb_main.get_main_menu(telegram_id=user_id, is_admin=await adb.is_admin_user(user_id))
             )
         else:
             await callback.answer("❌ Нет доступа к админ-панели")
@@ -69,10 +71,10 @@ async def admin_panel(message: Message):
         return
     
     # Получаем статистику
-    stats = db.get_system_stats()
+    stats = await adb.get_system_stats()
     
     # Получаем информацию о пользователе
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     
     # Форматируем приветствие
     admin_type = "👑 Постоянный администратор" if user.get('is_admin') else "🔐 Временная админ-сессия"
@@ -80,7 +82,7 @@ async def admin_panel(message: Message):
     # Проверяем сессию
     session_info = ""
     if not user.get('is_admin'):
-        session = db.get_admin_session(user['id'])
+        session = await adb.get_admin_session(user['id'])
         if session:
             expires_at = datetime.fromisoformat(session['expires_at'])
             time_left = expires_at - datetime.now()
@@ -112,8 +114,9 @@ async def admin_statistics(message: Message):
         return
     
     # Получаем статистику
-    stats = db.get_system_stats()
-    period_stats = db.get_statistics(period_days=30)
+    stats = await adb.get_system_stats()
+    period_stats = await adb.get_statistics(period_days=30)
+    last_day_bookings = sum(hour['bookings'] for hour in await adb.get_hourly_stats(hours=24))
     
     # Форматируем детальную статистику
     text = (
@@ -121,8 +124,8 @@ async def admin_statistics(message: Message):
         
         f"<b>👥 Пользователи:</b>\n"
         f"• Всего: {stats.get('total_users', 0)}\n"
-        f"• Администраторов: {len([u for u in db.get_all_users(is_admin=True)])}\n"
-        f"• Заблокированных: {len([u for u in db.get_all_users(is_blocked=True)])}\n"
+        f"• Администраторов: {stats.get('admin_users', 0)}\n"
+        f"• Заблокированных: {stats.get('blocked_users', 0)}\n"
         f"• Новых за месяц: {period_stats.get('new_users', 0)}\n\n"
         
         f"<b>🏠 Парковочные места:</b>\n"
@@ -138,6 +141,7 @@ async def admin_statistics(message: Message):
         f"• Завершенных: {stats.get('completed_bookings', 0)}\n"
         f"• Отмененных: {stats.get('cancelled_bookings', 0)}\n"
         f"• Новых за месяц: {period_stats.get('new_bookings', 0)}\n"
+        f"• Новых за 24 часа: {last_day_bookings}\n"
         f"• Средний чек: {format_price(stats.get('avg_booking_price', 0))} ₽\n"
         f"• Общая выручка: {format_price(stats.get('total_revenue', 0))} ₽\n\n"
         
@@ -147,12 +151,12 @@ async def admin_statistics(message: Message):
         f"• Средняя сумма оплаты: {format_price(period_stats.get('avg_amount', 0))} ₽\n\n"
         
         f"<b>⚠️ Модерация:</b>\n"
-        f"• Активных жалоб: {len([r for r in db.get_reports(status='pending')])}\n"
-        f"• Всего жалоб: {len(db.get_reports())}\n"
-        f"• Отзывов на модерации: {len([r for r in db.get_user_reviews(0, limit=1000) if not r.get('is_approved', True)])}\n\n"
+        f"• Активных жалоб: {stats.get('pending_reports', 0)}\n"
+        f"• Всего жалоб: {stats.get('total_reports', 0)}\n"
+        f"• Отзывов на модерации: {stats.get('pending_reviews', 0)}\n\n"
         
         f"<b>📈 Активность за 30 дней:</b>\n"
-        f"• Активных пользователей: {stats.get('active_users', 0)}\n"
+        f"• Активных пользователей: {period_stats.get('active_users', 0)}\n"
         f"• Всего часов бронирования: {period_stats.get('total_hours_booked', 0)}\n"
         f"• Среднее время бронирования: {period_stats.get('avg_duration', 0):.1f} часов\n"
     )
@@ -202,21 +206,50 @@ async def admin_users(message: Message):
         reply_markup=kb_main.get_admin_users_keyboard()
     )
 
+# Пользователей на странице списка
+USERS_PAGE_SIZE = 20
+
 @router.message(F.text == "👥 Все пользователи")
 async def all_users(message: Message):
     """Список всех пользователей"""
     if not await require_admin(message):
         return
     
-    users = db.get_all_users(limit=20)
-    
-    if not users:
+    page = await users_page()
+    if page is None:
         await message.answer("📭 Нет пользователей")
         return
     
+    text, markup = page
+    await message.answer(text, reply_markup=markup)
+
+@router.callback_query(F.data.startswith("admin_users_"))
+async def all_users_page(callback: CallbackQuery):
+    """Страница списка пользователей по курсору"""
+    if not await require_admin(callback=callback):
+        return
+    
+    cursor = kb_inline.parse_pagination_callback(callback.data, "admin_users")
+    page = await users_page(*cursor) if cursor else None
+    if page is None:
+        await callback.answer("📭 Больше пользователей нет")
+        return
+    
+    text, markup = page
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+async def users_page(page: int = 1, after_id: int = None, before_id: int = None):
+    """Текст и клавиатура страницы списка пользователей; None, если страница пуста"""
+    users = await adb.get_all_users(limit=USERS_PAGE_SIZE, after_id=after_id, before_id=before_id)
+    
+    if not users:
+        return None
+    
+    total_pages = max(1, -(-await adb.count_users() // USERS_PAGE_SIZE))
     text = "👥 <b>Все пользователи</b>\n\n"
     
-    for i, user in enumerate(users, 1):
+    for i, user in enumerate(users, (page - 1) * USERS_PAGE_SIZE + 1):
         status = "👑" if user['is_admin'] else "✅" if not user['is_blocked'] else "🚫"
         text += f"{status} <b>{i}. {user['full_name']}</b>\n"
         text += f"   📱 @{user['username'] or 'нет'}\n" if user['username'] else ""
@@ -224,23 +257,24 @@ async def all_users(message: Message):
         text += f"   📅 {datetime.fromisoformat(user['created_at']).strftime('%d.%m.%Y')}\n"
         text += f"   💰 Баланс: {format_price(user['balance'])} ₽\n\n"
     
-    # Кнопки пагинации
-    keyboard = kb_inline.InlineKeyboardBuilder()
-    keyboard.add(kb_inline.InlineKeyboardButton(
+    # Кнопки пагинации: курсор - крайние пользователи страницы
+    keyboard = kb_inline.InlineKeyboardBuilder.from_markup(kb_inline.get_pagination_keyboard(
+        page, total_pages, "admin_users", first_id=users[0]['id'], last_id=users[-1]['id']
+    ))
+    keyboard.row(kb_inline.InlineKeyboardButton(
         text="🔍 Поиск пользователя",
         callback_data="search_user"
     ))
-    keyboard.add(kb_inline.InlineKeyboardButton(
+    keyboard.row(kb_inline.InlineKeyboardButton(
         text="📋 Экспорт списка",
         callback_data="export_users"
     ))
-    keyboard.add(kb_inline.InlineKeyboardButton(
+    keyboard.row(kb_inline.InlineKeyboardButton(
         text="🔙 Назад",
         callback_data="back_to_users"
     ))
-    keyboard.adjust(1)
     
-    await message.answer(text, reply_markup=keyboard.as_markup())
+    return text, keyboard.as_markup()
 
 @router.message(F.text == "🔍 Поиск пользователя")
 async def search_user_start(message: Message, state: FSMContext):
@@ -254,12 +288,15 @@ async def search_user_start(message: Message, state: FSMContext):
         "Введите:\n"
         "• ID пользователя\n"
         "• Номер телефона\n"
-        "• Имя пользователя\n"
-        "• Email\n\n"
+        "• Имя или username\n"
+        "• Email или номер автомобиля\n\n"
         "Или отправьте /cancel для отмены",
         reply_markup=kb_main.get_cancel_keyboard()
     )
 
+# Сколько найденных пользователей показывать списком
+USER_SEARCH_PAGE_SIZE = 10
+
 @router.message(AdminStates.searching_user)
 async def search_user_process(message: Message, state: FSMContext):
     """Обработка поиска пользователя"""
@@ -271,28 +308,28 @@ async def search_user_process(message: Message, state: FSMContext):
         
         # По ID
         if search_term.isdigit():
-            user = db.get_user(user_id=int(search_term))
+            user = await adb.get_user(user_id=int(search_term))
             if not user:
-                user = db.get_user(telegram_id=int(search_term))
-        
-        # По телефону
-        if not user:
-            user = db.get_user_by_phone(search_term)
-        
-        # По username (без @)
-        if not user and search_term.startswith('@'):
-            search_term = search_term[1:]
+                user = await adb.get_user(telegram_id=int(search_term))
         
-        # Ищем в базе по имени или email
+        # По имени, username, телефону, email и номеру авто
         if not user:
-            # Ищем по имени
-            all_users = db.get_all_users(limit=1000)
-            for u in all_users:
-                if (search_term.lower() in u['full_name'].lower() or 
-                    (u['email'] and search_term.lower() in u['email'].lower()) or
-                    (u['username'] and search_term.lower() in u['username'].lower())):
-                    user = u
-                    break
+            users = await adb.search_users(search_term, limit=USER_SEARCH_PAGE_SIZE + 1)
+            if len(users) == 1:
+                user = users[0]
+            elif users:
+                text = f"🔍 <b>Найдено несколько пользователей:</b>\n\n"
+                for u in users[:USER_SEARCH_PAGE_SIZE]:
+                    text += f"• <code>{u['id']}</code> {u['full_name']}"
+                    if u.get('username'):
+                        text += f" (@{u['username']})"
+                    text += f", {u['phone']}\n"
+                if len(users) > USER_SEARCH_PAGE_SIZE:
+                    text += f"\n<i>Показаны первые {USER_SEARCH_PAGE_SIZE}, уточните запрос</i>\n"
+                text += "\nОтправьте ID пользователя или уточните запрос."
+                # Состояние поиска сохраняется для следующего запроса
+                await message.answer(text, reply_markup=kb_main.get_cancel_keyboard())
+                return
         
         if not user:
             await message.answer(
@@ -307,16 +344,7 @@ async def search_user_process(message: Message, state: FSMContext):
         user_info = format_user_info(user)
         
         # Получаем статистику пользователя
-        cursor = db.connection.cursor()
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_bookings,
-                SUM(total_price) as total_spent
-            FROM bookings 
-            WHERE user_id = ?
-        ''', (user['id'],))
-        
-        booking_stats = cursor.fetchone()
+        booking_stats = await adb.get_user_booking_totals(user['id'])
         
         stats_text = "📊 <b>Статистика пользователя:</b>\n"
         if booking_stats:
@@ -386,14 +414,14 @@ async def admin_spots(message: Message):
         return
     
     # Статистика по местам
-    spots = db.get_all_spots(limit=10)
+    spots = await adb.get_all_spots(limit=10)
     
     text = "🏠 <b>Управление парковочными местами</b>\n\n"
     
     if spots:
         text += "<b>Последние добавленные места:</b>\n\n"
         for spot in spots:
-            owner = db.get_user(user_id=spot['owner_id'])
+            owner = await adb.get_user(user_id=spot['owner_id'])
             owner_name = owner['full_name'] if owner else "Неизвестно"
             
             text += f"📍 <b>#{spot['spot_number']}</b>\n"
@@ -406,8 +434,8 @@ async def admin_spots(message: Message):
         text += "📭 Нет добавленных мест\n\n"
     
     # Общая статистика
-    total_spots = db.count_spots()
-    active_spots = db.count_spots(is_active=True)
+    total_spots = await adb.count_spots()
+    active_spots = await adb.count_spots(is_active=True)
     
     text += f"<b>Общая статистика:</b>\n"
     text += f"• Всего мест: {total_spots}\n"
@@ -451,7 +479,7 @@ async def admin_bookings(message: Message):
         return
     
     # Активные бронирования
-    active_bookings = db.get_active_bookings()
+    active_bookings = await adb.get_active_bookings()
     
     text = "📋 <b>Управление бронированиями</b>\n\n"
     
@@ -470,10 +498,10 @@ async def admin_bookings(message: Message):
         text += "✅ Нет активных бронирований\n\n"
     
     # Статистика
-    total_bookings = db.count_bookings()
-    active_bookings_count = db.count_bookings(status='active')
-    completed_bookings = db.count_bookings(status='completed')
-    cancelled_bookings = db.count_bookings(status='cancelled')
+    total_bookings = await adb.count_bookings()
+    active_bookings_count = await adb.count_bookings(status='active')
+    completed_bookings = await adb.count_bookings(status='completed')
+    cancelled_bookings = await adb.count_bookings(status='cancelled')
     
     text += f"<b>Общая статистика:</b>\n"
     text += f"• Всего бронирований: {total_bookings}\n"
@@ -518,7 +546,7 @@ async def admin_reports(message: Message):
         return
     
     # Новые жалобы
-    new_reports = db.get_reports(status='pending', limit=5)
+    new_reports = await adb.get_reports(status='pending', limit=5)
     
     text = "⚠️ <b>Управление жалобами</b>\n\n"
     
@@ -533,10 +561,10 @@ async def admin_reports(message: Message):
         text += "✅ Нет новых жалоб\n\n"
     
     # Статистика
-    pending_reports = len(db.get_reports(status='pending'))
-    investigating_reports = len(db.get_reports(status='investigating'))
-    resolved_reports = len(db.get_reports(status='resolved'))
-    rejected_reports = len(db.get_reports(status='rejected'))
+    pending_reports = len(await adb.get_reports(status='pending'))
+    investigating_reports = len(await adb.get_reports(status='investigating'))
+    resolved_reports = len(await adb.get_reports(status='resolved'))
+    rejected_reports = len(await adb.get_reports(status='rejected'))
     
     text += f"<b>Статистика жалоб:</b>\n"
     text += f"• Ожидают: {pending_reports}\n"
@@ -558,7 +586,7 @@ async def new_reports_list(message: Message):
     if not await require_admin(message):
         return
     
-    reports = db.get_reports(status='pending', limit=20)
+    reports = await adb.get_reports(status='pending', limit=20)
     
     if not reports:
         await message.answer(
@@ -613,7 +641,7 @@ async def view_report_detail(callback: CallbackQuery):
     report_id = int(callback.data.split("_")[2])
     
     # Ищем отчет по ID
-    all_reports = db.get_reports(limit=1000)
+    all_reports = await adb.get_reports(limit=1000)
     report = None
     for r in all_reports:
         if r['id'] == report_id:
@@ -676,11 +704,11 @@ async def resolve_report(callback: CallbackQuery):
     report_id = int(callback.data.split("_")[2])
     
     # Обновляем статус
-    success = db.update_report_status(
+    success = await adb.update_report_status(
         report_id,
         status='resolved',
         admin_notes=f"Решено администратором {callback.from_user.username or callback.from_user.id}",
-        resolved_by=db.get_user(telegram_id=callback.from_user.id)['id']
+        resolved_by=(await adb.get_user(telegram_id=callback.from_user.id))['id']
     )
     
     if success:
@@ -697,8 +725,8 @@ async def resolve_report(callback: CallbackQuery):
         )
         
         # Логируем действие
-        log_user_action(
-            db.get_user(telegram_id=callback.from_user.id)['id'],
+        await log_user_action(
+            (await adb.get_user(telegram_id=callback.from_user.id))['id'],
             "report_resolved",
             f"Жалоба #{report_id} решена"
         )
@@ -716,19 +744,7 @@ async def admin_finance(message: Message):
         return
     
     # Получаем финансовую статистику
-    cursor = db.connection.cursor()
-    cursor.execute('''
-        SELECT 
-            COUNT(*) as total_payments,
-            SUM(amount) as total_amount,
-            AVG(amount) as avg_amount,
-            SUM(CASE WHEN status = 'completed' THEN amount ELSE 0 END) as completed_amount,
-            SUM(CASE WHEN status = 'pending' THEN amount ELSE 0 END) as pending_amount
-        FROM payments
-        WHERE created_at > ?
-    ''', (datetime.now() - timedelta(days=30),))
-    
-    payment_stats = cursor.fetchone()
+    payment_stats = await adb.get_payment_stats(datetime.now() - timedelta(days=30))
     
     text = "💰 <b>Финансовая статистика</b>\n\n"
     
@@ -740,15 +756,7 @@ async def admin_finance(message: Message):
     text += f"• Ожидающих платежей: {format_price(payment_stats.get('pending_amount', 0))} ₽\n\n"
     
     # Получаем последние платежи
-    cursor.execute('''
-        SELECT p.*, u.full_name as user_name, b.booking_code
-        FROM payments p
-        LEFT JOIN users u ON p.user_id = u.id
-        LEFT JOIN bookings b ON p.booking_id = b.id
-        ORDER BY p.created_at DESC
-        LIMIT 5
-    ''')
-    recent_payments = [dict(row) for row in cursor.fetchall()]
+    recent_payments = await adb.get_recent_payments(limit=5)
     
     if recent_payments:
         text += "<b>Последние платежи:</b>\n\n"
@@ -775,7 +783,7 @@ async def system_settings(message: Message):
         return
     
     # Получаем текущие настройки
-    settings = db.get_all_settings()
+    settings = await adb.get_all_settings()
     
     text = "⚙️ <b>Настройки системы</b>\n\n"
     
@@ -793,11 +801,11 @@ async def system_settings(message: Message):
     text += f"• Новые жалобы: {'✅' if settings.get('notification_new_report', '1') == '1' else '❌'}\n\n"
     
     # Информация о пароле админки
-    current_user = db.get_user(telegram_id=message.from_user.id)
+    current_user = await adb.get_user(telegram_id=message.from_user.id)
     if current_user and current_user.get('is_admin'):
         text += "<b>🔐 Управление доступом:</b>\n"
         text += "• Пароль для входа в админку: *******\n"
-        text += f"• Постоянных админов: {len(db.get_all_users(is_admin=True))}\n\n"
+        text += f"• Постоянных админов: {len(await adb.get_all_users(is_admin=True))}\n\n"
     
     text += "👇 <b>Выберите настройку для изменения:</b>"
     
@@ -812,7 +820,7 @@ async def commission_settings(message: Message, state: FSMContext):
     if not await require_admin(message):
         return
     
-    current_commission = db.get_setting('commission_rate', '0')
+    current_commission = await adb.get_setting('commission_rate', '0')
     
     await state.set_state(AdminStates.system_settings)
     await state.update_data(setting_key='commission_rate')
@@ -836,7 +844,7 @@ async def change_admin_password_start(message: Message, state: FSMContext):
         return
     
     # Проверяем, является ли пользователь постоянным админом
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user or not user.get('is_admin'):
         await message.answer(
             "❌ <b>Недостаточно прав!</b>\n\n"
@@ -874,7 +882,7 @@ async def change_admin_password_process(message: Message, state: FSMContext):
             return
         
         # Сохраняем пароль
-        success = db.set_admin_password(new_password)
+        success = await adb.set_admin_password(new_password)
         
         if success:
             await message.answer(
@@ -887,8 +895,8 @@ async def change_admin_password_process(message: Message, state: FSMContext):
             )
             
             # Логируем смену пароля
-            log_user_action(
-                db.get_user(telegram_id=message.from_user.id)['id'],
+            await log_user_action(
+                (await adb.get_user(telegram_id=message.from_user.id))['id'],
                 "admin_password_changed",
                 "Пароль для входа в админку изменен"
             )
@@ -946,7 +954,7 @@ async def process_system_setting(message: Message, state: FSMContext):
                 return
         
         # Сохраняем настройку
-        success = db.set_setting(setting_key, new_value)
+        success = await adb.set_setting(setting_key, new_value)
         
         if success:
             setting_names = {
@@ -968,8 +976,8 @@ async def process_system_setting(message: Message, state: FSMContext):
             )
             
             # Логируем действие
-            log_user_action(
-                db.get_user(telegram_id=message.from_user.id)['id'],
+            await log_user_action(
+                (await adb.get_user(telegram_id=message.from_user.id))['id'],
                 "system_setting_changed",
                 f"{setting_key} изменено на: {new_value}"
             )
@@ -998,42 +1006,33 @@ async def backup_database(message: Message):
     if not await require_admin(message):
         return
     
-    import os
-    from datetime import datetime
-    
-    # Создаем имя файла с датой
-    backup_dir = "backups"
-    os.makedirs(backup_dir, exist_ok=True)
+    await message.answer("⏳ Создаю резервную копию...")
     
-    backup_filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-    backup_path = os.path.join(backup_dir, backup_filename)
+    # Копия снимается в отдельном потоке, бот продолжает отвечать
+    backup = await backups.create()
     
-    # Создаем резервную копию
-    success = db.backup_database(backup_path)
-    
-    if success:
-        # Получаем размер файла
-        file_size = os.path.getsize(backup_path) / 1024 / 1024  # в MB
-        
+    if backup:
         await message.answer(
             f"✅ <b>Резервная копия создана!</b>\n\n"
-            f"📁 Файл: {backup_filename}\n"
-            f"📦 Размер: {file_size:.2f} MB\n"
-            f"📅 Дата: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n\n"
-            f"<i>Файл сохранен в директории /backups</i>",
+            f"📁 Файл: {backup['name']}\n"
+            f"📦 Размер: {backup['size'] / 1024 / 1024:.2f} MB, "
+            f"сжатая {backup['compressed_size'] / 1024 / 1024:.2f} MB\n"
+            f"⏱ Время: {backup['duration']:.1f} с, целостность проверена\n"
+            f"📅 Дата: {backup['created_at'].strftime('%d.%m.%Y %H:%M:%S')}\n\n"
+            f"<i>Хранится копий: {len(backups.list_backups())} в директории {Config.BACKUP_DIR}</i>",
             reply_markup=kb_main.get_admin_settings_keyboard()
         )
         
         # Логируем действие
-        log_user_action(
-            db.get_user(telegram_id=message.from_user.id)['id'],
+        await log_user_action(
+            (await adb.get_user(telegram_id=message.from_user.id))['id'],
             "backup_created",
-            f"Создана резервная копия: {backup_filename}"
+            f"Создана резервная копия: {backup['name']}"
         )
     else:
         await message.answer(
             "❌ <b>Ошибка создания резервной копии!</b>\n\n"
-            "Проверьте права доступа к директории.",
+            "Подробности в журнале бота.",
             reply_markup=kb_main.get_admin_settings_keyboard()
         )
 
@@ -1059,10 +1058,10 @@ async def broadcast_message_start(message: Message, state: FSMContext):
 async def broadcast_message_process(message: Message, state: FSMContext):
     """Обработка рассылки"""
     try:
-        broadcast_text = message.text
-        users = db.get_all_users(limit=1000)  # Получаем всех пользователей
+        broadcast_text = message.html_text
+        recipients_count = await adb.count_broadcast_recipients()
         
-        if not users:
+        if not recipients_count:
             await message.answer("❌ Нет пользователей для рассылки")
             await state.clear()
             return
@@ -1071,7 +1070,7 @@ async def broadcast_message_process(message: Message, state: FSMContext):
         keyboard = kb_inline.InlineKeyboardBuilder()
         keyboard.add(kb_inline.InlineKeyboardButton(
             text="✅ Начать рассылку",
-            callback_data=f"confirm_broadcast_{len(users)}"
+            callback_data="confirm_broadcast"
         ))
         keyboard.add(kb_inline.InlineKeyboardButton(
             text="❌ Отмена",
@@ -1086,7 +1085,7 @@ async def broadcast_message_process(message: Message, state: FSMContext):
             f"📢 <b>Подтверждение рассылки</b>\n\n"
             f"<b>Сообщение:</b>\n"
             f"{broadcast_text[:500]}...\n\n"
-            f"<b>Получатели:</b> {len(users)} пользователей\n\n"
+            f"<b>Получатели:</b> {recipients_count} пользователей\n\n"
             f"<i>Нажмите 'Начать рассылку' для подтверждения</i>",
             reply_markup=keyboard.as_markup()
         )
@@ -1096,6 +1095,104 @@ async def broadcast_message_process(message: Message, state: FSMContext):
         await message.answer("❌ Ошибка при подготовке рассылки")
         await state.clear()
 
+def get_broadcast_keyboard(broadcast_id: int):
+    """Кнопки управления идущей рассылкой"""
+    keyboard = kb_inline.InlineKeyboardBuilder()
+    keyboard.add(kb_inline.InlineKeyboardButton(
+        text="🔄 Прогресс",
+        callback_data=f"broadcast_status_{broadcast_id}"
+    ))
+    keyboard.add(kb_inline.InlineKeyboardButton(
+        text="⛔ Остановить",
+        callback_data=f"broadcast_stop_{broadcast_id}"
+    ))
+    keyboard.adjust(2)
+    return keyboard.as_markup()
+
+@router.callback_query(F.data == "confirm_broadcast")
+async def confirm_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Запуск подтвержденной рассылки"""
+    if not await require_admin(callback=callback):
+        return
+    
+    data = await state.get_data()
+    await state.clear()
+    broadcast_text = data.get('broadcast_text')
+    if not broadcast_text:
+        await callback.answer("❌ Текст рассылки не найден, начните заново")
+        return
+    
+    broadcast_id = await adb.create_broadcast(callback.from_user.id, broadcast_text)
+    if not broadcast_id:
+        await callback.answer("❌ Ошибка создания рассылки")
+        return
+    
+    broadcaster.launch(broadcast_id)
+    
+    user = await adb.get_user(telegram_id=callback.from_user.id)
+    if user:
+        await log_user_action(user['id'], "broadcast_started", f"Рассылка #{broadcast_id}")
+    
+    await callback.message.edit_text(
+        f"📢 <b>Рассылка #{broadcast_id} запущена</b>\n\n"
+        f"Сообщения отправляются в фоне, по завершении придет отчет.",
+        reply_markup=get_broadcast_keyboard(broadcast_id)
+    )
+    await callback.answer()
+
+@router.callback_query(F.data == "cancel_broadcast")
+async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Отмена рассылки до запуска"""
+    await state.clear()
+    await callback.message.edit_text("❌ Рассылка отменена")
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("broadcast_status_"))
+async def broadcast_status(callback: CallbackQuery):
+    """Прогресс рассылки"""
+    if not await require_admin(callback=callback):
+        return
+    
+    broadcast_id = int(callback.data.split("_")[2])
+    stats = await broadcaster.stats(broadcast_id)
+    if not stats:
+        await callback.answer("❌ Рассылка не найдена")
+        return
+    
+    status_names = {'running': '⏳ Идет', 'completed': '✅ Завершена', 'cancelled': '⛔ Остановлена'}
+    text = (
+        f"📢 <b>Рассылка #{broadcast_id}</b>\n\n"
+        f"Статус: {status_names.get(stats['status'], stats['status'])}\n"
+        f"Обработано: {stats['processed']} из {stats['total']} ({stats['percent']:.0f}%)\n"
+        f"✅ Доставлено: {stats['sent']}\n"
+        f"🚫 Заблокировали бота: {stats['blocked']}\n"
+        f"❌ Ошибок: {stats['failed']}\n"
+    )
+    if broadcaster.is_running(broadcast_id):
+        text += f"⚡ Скорость: {stats['rate']:.1f} сообщ./с\n"
+    
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=get_broadcast_keyboard(broadcast_id) if stats['status'] == 'running' else None
+        )
+    except Exception:
+        pass  # текст не изменился
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("broadcast_stop_"))
+async def broadcast_stop(callback: CallbackQuery):
+    """Остановка рассылки"""
+    if not await require_admin(callback=callback):
+        return
+    
+    broadcast_id = int(callback.data.split("_")[2])
+    if await broadcaster.cancel(broadcast_id):
+        await callback.message.edit_text(f"⛔ Рассылка #{broadcast_id} остановлена")
+        await callback.answer()
+    else:
+        await callback.answer("Рассылка уже завершена")
+
 # ==================== ОБРАБОТКА КОЛБЭКОВ ====================
 
 @router.callback_query(F.data == "back_to_admin")
@@ -1134,15 +1231,15 @@ async def make_user_admin(callback: CallbackQuery):
     user_id = int(callback.data.split("_")[2])
     
     # Проверяем, является ли текущий пользователь постоянным админом
-    current_user = db.get_user(telegram_id=callback.from_user.id)
+    current_user = await adb.get_user(telegram_id=callback.from_user.id)
     if not current_user or not current_user.get('is_admin'):
         await callback.answer("❌ Только постоянные администраторы могут назначать других админов")
         return
     
-    success = db.set_admin(user_id, is_admin=True)
+    success = await adb.set_admin(user_id, is_admin=True)
     
     if success:
-        user = db.get_user(user_id=user_id)
+        user = await adb.get_user(user_id=user_id)
         
         await callback.message.edit_text(
             f"✅ <b>Пользователь назначен администратором!</b>\n\n"
@@ -1166,7 +1263,7 @@ async def make_user_admin(callback: CallbackQuery):
             "Теперь у вас есть доступ к админ-панели без ввода пароля."
         )
         
-        log_user_action(
+        await log_user_action(
             current_user['id'],
             "user_made_admin",
             f"Пользователь {user['full_name']} назначен постоянным админом"
@@ -1176,13 +1273,33 @@ async def make_user_admin(callback: CallbackQuery):
     
     await callback.answer()
 
+# ==================== КОМАНДА /REBUILD_STATS ====================
+
+@router.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: Message):
+    """Пересчет счетчиков и агрегатов статистики по истории"""
+    if not await require_admin(message):
+        return
+    
+    await message.answer("⏳ Пересчитываю статистику...")
+    counters_ok = await adb.rebuild_stats_counters()
+    rollups_ok = await adb.rebuild_rollups()
+    
+    if counters_ok and rollups_ok:
+        await message.answer("✅ Статистика пересчитана")
+        user = await adb.get_user(telegram_id=message.from_user.id)
+        if user:
+            await log_user_action(user['id'], "stats_rebuilt", "Пересчет статистики")
+    else:
+        await message.answer("❌ Ошибка пересчета статистики, подробности в логах")
+
 # ==================== КОМАНДА /ADMIN_INFO ====================
 
 @router.message(Command("admin_info"))
 async def cmd_admin_info(message: Message):
     """Информация о текущей админ-сессии"""
     try:
-        user = db.get_user(telegram_id=message.from_user.id)
+        user = await adb.get_user(telegram_id=message.from_user.id)
         if not user:
             await message.answer("❌ Вы не зарегистрированы.")
             return
@@ -1196,11 +1313,11 @@ async def cmd_admin_info(message: Message):
                 "• Можете назначать других администраторов\n"
                 "• Можете менять пароль для входа в админку\n"
                 "• Ваши права не ограничены по времени",
-                reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, db_instance=db)
+                reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, is_admin=await adb.is_admin_user(message.from_user.id))
             )
         else:
             # Проверяем активную сессию
-            session = db.get_admin_session(user['id'])
+            session = await adb.get_admin_session(user['id'])
             if session and datetime.fromisoformat(session['expires_at']) > datetime.now():
                 expires_at = datetime.fromisoformat(session['expires_at'])
                 time_left = expires_at - datetime.now()
@@ -1214,13 +1331,13 @@ async def cmd_admin_info(message: Message):
                     "• Нельзя назначать других администраторов\n"
                     "• Нельзя менять пароль для входа\n"
                     "• Доступ прекратится после истечения времени",
-                    reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, db_instance=db)
+                    reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, is_admin=await adb.is_admin_user(message.from_user.id))
                 )
             else:
                 await message.answer(
                     "ℹ️ <b>У вас нет активной админ-сессии</b>\n\n"
                     "Используйте команду /admin для входа в админ-панель.",
-                    reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, db_instance=db)
+                    reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, is_admin=await adb.is_admin_user(message.from_user.id))
                 )
         
     except Exception as e:
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Буферизованная запись журнала действий
+"""
+import logging
+import threading
+from collections import deque
+from time import monotonic
+from typing import Callable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Не чаще одного предупреждения о потерях за этот интервал
+DROP_WARNING_INTERVAL = 60
+
+class AuditLogBuffer:
+    """Кольцевой буфер записей журнала с фоновой записью пачками.
+    
+    Записи пишутся функцией writer(entries) -> bool из отдельного потока
+    каждые flush_interval_ms миллисекунд или сразу по накоплении
+    flush_size записей. Потери ограничены: при переполнении буфера
+    вытесняются самые старые записи (счетчик dropped), при аварийном
+    завершении теряется не больше одного интервала записи.
+    """
+    
+    def __init__(self, writer: Callable[[List[tuple]], bool], capacity: int = 10000,
+                 flush_interval_ms: int = 500, flush_size: int = 200):
+        self.writer = writer
+        self.capacity = capacity
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_size = flush_size
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._last_drop_warning = 0.0
+        self.appended = 0
+        self.dropped = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def extend(self, entries: Iterable[tuple]):
+        """Добавление записей в буфер"""
+        with self._lock:
+            for entry in entries:
+                if len(self._entries) == self.capacity:
+                    self.dropped += 1
+                self._entries.append(entry)
+                self.appended += 1
+            size = len(self._entries)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self._thread.start()
+        
+        if size >= self.flush_size:
+            self._wakeup.set()
+        self._warn_dropped()
+    
+    def append(self, entry: tuple):
+        """Добавление записи в буфер"""
+        self.extend((entry,))
+    
+    def _warn_dropped(self):
+        if self.dropped and monotonic() - self._last_drop_warning > DROP_WARNING_INTERVAL:
+            self._last_drop_warning = monotonic()
+            logger.warning(f"⚠️ Буфер журнала переполнен, потеряно записей: {self.dropped}")
+    
+    def flush(self) -> int:
+        """Запись всех накопленных записей; возвращает количество записанных"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._entries:
+                    return 0
+                batch = list(self._entries)
+                self._entries.clear()
+            
+            try:
+                written = self.writer(batch)
+            except Exception as e:
+                # Ошибка вне writer: блокировка БД при BEGIN или сбой COMMIT
+                logger.error(f"❌ Ошибка записи журнала ({len(batch)} записей): {e}")
+                written = False
+            if written:
+                self.written += len(batch)
+                self.flushes += 1
+                return len(batch)
+            
+            # Запись не удалась: возвращаем пачку в начало буфера в пределах емкости
+            self.failures += 1
+            with self._lock:
+                combined = batch + list(self._entries)
+                overflow = max(0, len(combined) - self.capacity)
+                self.dropped += overflow
+                self._entries = deque(combined[overflow:], maxlen=self.capacity)
+            return 0
+    
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи журнала: {e}")
+    
+    def close(self) -> int:
+        """Остановка фонового потока и запись остатка"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        return self.flush()
+    
+    def stats(self) -> dict:
+        """Счетчики буфера"""
+        return {
+            'buffered': len(self._entries),
+            'appended': self.appended,
+            'written': self.written,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'failures': self.failures
+        }
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Индекс занятости парковочных мест
+"""
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Iterable, Iterator, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Статусы бронирований, занимающих место: заявка ожидает подтверждения
+# владельца и тоже держит время, иначе его можно подтвердить дважды
+BUSY_STATUSES = ('pending', 'confirmed', 'active')
+
+def to_datetime(value: Union[str, datetime]) -> datetime:
+    """Приведение значения из БД к datetime"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def parse_time(value: Union[str, time, None]) -> Optional[time]:
+    """Приведение времени расписания к time"""
+    if value is None or isinstance(value, time):
+        return value
+    return time.fromisoformat(value)
+
+def open_windows(day: date, schedule: Optional[Dict] = None,
+                 exception: Optional[Dict] = None) -> List[Tuple[datetime, datetime]]:
+    """Интервалы дня, в которые место открыто по расписанию и исключениям.
+    
+    Исключение на дату важнее недельного расписания. Строка расписания с
+    is_available = 1 задает окно работы, с is_available = 0 - перерыв;
+    пустые start_time/end_time означают весь день.
+    """
+    day_start = datetime.combine(day, time.min)
+    day_end = day_start + timedelta(days=1)
+    
+    if exception is not None:
+        return [(day_start, day_end)] if exception['is_available'] else []
+    if schedule is None:
+        return [(day_start, day_end)]
+    
+    start = parse_time(schedule['start_time'])
+    end = parse_time(schedule['end_time'])
+    window_start = datetime.combine(day, start) if start else day_start
+    window_end = datetime.combine(day, end) if end else day_end
+    # '23:59' в расписании означает конец суток
+    if window_end <= window_start or (end and end >= time(23, 59)):
+        window_end = day_end
+    
+    if schedule['is_available']:
+        return [(window_start, window_end)]
+    if start is None and end is None:
+        return []
+    return [(s, e) for s, e in ((day_start, window_start), (window_end, day_end)) if s < e]
+
+def subtract_busy(windows: List[Tuple[datetime, datetime]],
+                  busy: List[Tuple[datetime, datetime]],
+                  min_duration: timedelta = timedelta(0)) -> Iterator[Tuple[datetime, datetime]]:
+    """Свободные части окон за один проход по отсортированным спискам"""
+    first = 0
+    for window_start, window_end in windows:
+        # Интервалы, закончившиеся до окна, не понадобятся и следующим окнам
+        while first < len(busy) and busy[first][1] <= window_start:
+            first += 1
+        
+        cursor = window_start
+        i = first
+        while i < len(busy) and busy[i][0] < window_end:
+            busy_start, busy_end = busy[i]
+            if busy_start > cursor and busy_start - cursor >= min_duration:
+                yield cursor, busy_start
+            if busy_end > cursor:
+                cursor = busy_end
+            i += 1
+        
+        if cursor < window_end and window_end - cursor >= min_duration:
+            yield cursor, window_end
+
+class SpotIntervals:
+    """Занятые интервалы одного места, отсортированные по началу.
+    
+    max_ends[i] хранит максимум окончаний среди первых i + 1 интервалов,
+    поэтому проверка пересечения - один бинарный поиск.
+    """
+    
+    __slots__ = ('starts', 'ends', 'booking_ids', 'max_ends')
+    
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        self.booking_ids: List[int] = []
+        self.max_ends: List[datetime] = []
+    
+    def __len__(self) -> int:
+        return len(self.starts)
+    
+    def _rebuild_max_ends(self, position: int):
+        """Пересчет префиксных максимумов начиная с позиции"""
+        del self.max_ends[position:]
+        current = self.max_ends[-1] if self.max_ends else None
+        for end in self.ends[position:]:
+            current = end if current is None or end > current else current
+            self.max_ends.append(current)
+    
+    def add(self, booking_id: int, start: datetime, end: datetime):
+        """Добавление интервала"""
+        position = bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+        self.booking_ids.insert(position, booking_id)
+        self._rebuild_max_ends(position)
+    
+    def remove(self, booking_id: int, start: datetime) -> bool:
+        """Удаление интервала брони"""
+        position = bisect_left(self.starts, start)
+        while position < len(self.starts) and self.starts[position] == start:
+            if self.booking_ids[position] == booking_id:
+                del self.starts[position]
+                del self.ends[position]
+                del self.booking_ids[position]
+                self._rebuild_max_ends(position)
+                return True
+            position += 1
+        return False
+    
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """Есть ли занятый интервал, пересекающийся с [start, end)"""
+        # Кандидаты - интервалы, начавшиеся до конца запрошенного периода
+        position = bisect_left(self.starts, end)
+        return position > 0 and self.max_ends[position - 1] > start
+    
+    def busy_between(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Занятые интервалы, пересекающиеся с [start, end), по возрастанию начала"""
+        position = bisect_left(self.starts, end)
+        result = []
+        for i in range(position - 1, -1, -1):
+            if self.max_ends[i] <= start:
+                break
+            if self.ends[i] > start:
+                result.append((self.starts[i], self.ends[i]))
+        result.reverse()
+        return result
+
+class AvailabilityIndex:
+    """Индекс занятости всех мест в памяти.
+    
+    Заполняется из БД при первом обращении, затем обновляется
+    после каждого зафиксированного изменения бронирований.
+    """
+    
+    def __init__(self):
+        self._spots: Dict[int, SpotIntervals] = {}
+        # booking_id -> (spot_id, start_time) для снятия брони из индекса
+        self._bookings: Dict[int, Tuple[int, datetime]] = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+    
+    def load(self, rows: Iterable):
+        """Полная загрузка индекса из строк (id, spot_id, start_time, end_time)"""
+        grouped: Dict[int, List[Tuple[datetime, datetime, int]]] = {}
+        for row in rows:
+            grouped.setdefault(row['spot_id'], []).append(
+                (to_datetime(row['start_time']), to_datetime(row['end_time']), row['id'])
+            )
+        
+        with self._lock:
+            self._spots = {}
+            self._bookings = {}
+            for spot_id, items in grouped.items():
+                # Сортируем один раз и строим префиксные максимумы за один проход
+                items.sort()
+                intervals = SpotIntervals()
+                intervals.starts = [start for start, _, _ in items]
+                intervals.ends = [end for _, end, _ in items]
+                intervals.booking_ids = [booking_id for _, _, booking_id in items]
+                intervals._rebuild_max_ends(0)
+                self._spots[spot_id] = intervals
+                for start, _, booking_id in items:
+                    self._bookings[booking_id] = (spot_id, start)
+            self.loaded = True
+            logger.info(f"✅ Индекс занятости загружен: {len(self._bookings)} броней")
+    
+    def reset(self):
+        """Сброс индекса: он будет загружен заново при следующем обращении"""
+        with self._lock:
+            self._spots = {}
+            self._bookings = {}
+            self.loaded = False
+    
+    def _add(self, booking_id: int, spot_id: int, start: datetime, end: datetime):
+        if booking_id in self._bookings:
+            self._remove(booking_id)
+        self._spots.setdefault(spot_id, SpotIntervals()).add(booking_id, start, end)
+        self._bookings[booking_id] = (spot_id, start)
+    
+    def _remove(self, booking_id: int):
+        entry = self._bookings.pop(booking_id, None)
+        if entry is None:
+            return
+        spot_id, start = entry
+        intervals = self._spots.get(spot_id)
+        if intervals is not None:
+            intervals.remove(booking_id, start)
+            if not intervals:
+                del self._spots[spot_id]
+    
+    def apply(self, booking_id: int, spot_id: int, start_time, end_time, status: str):
+        """Учет нового состояния брони"""
+        if not self.loaded:
+            return
+        with self._lock:
+            if status in BUSY_STATUSES:
+                self._add(booking_id, spot_id, to_datetime(start_time), to_datetime(end_time))
+            else:
+                self._remove(booking_id)
+    
+    def discard(self, booking_ids: Iterable[int]):
+        """Удаление броней из индекса"""
+        with self._lock:
+            for booking_id in booking_ids:
+                self._remove(booking_id)
+    
+    def is_free(self, spot_id: int, start: datetime, end: datetime) -> bool:
+        """Свободно ли место на период [start, end)"""
+        with self._lock:
+            intervals = self._spots.get(spot_id)
+            return intervals is None or not intervals.overlaps(start, end)
+    
+    def filter_free(self, spot_ids: Iterable[int], start: datetime, end: datetime,
+                    limit: Optional[int] = None) -> List[int]:
+        """Места из списка, свободные на период, в исходном порядке"""
+        result = []
+        with self._lock:
+            for spot_id in spot_ids:
+                intervals = self._spots.get(spot_id)
+                if intervals is None or not intervals.overlaps(start, end):
+                    result.append(spot_id)
+                    if limit and len(result) >= limit:
+                        break
+        return result
+    
+    def busy_intervals(self, spot_id: int, start: datetime,
+                       end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Занятые интервалы места в пределах периода"""
+        with self._lock:
+            intervals = self._spots.get(spot_id)
+            return intervals.busy_between(start, end) if intervals else []
+    
+    def stats(self) -> Dict[str, int]:
+        """Размер индекса"""
+        with self._lock:
+            return {'spots': len(self._spots), 'bookings': len(self._bookings)}
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Резервные копии базы данных: онлайн-копия, сжатие, проверка, ротация и восстановление.
+
+Копии создаются ботом по расписанию (BACKUP_INTERVAL_HOURS) и кнопкой
+администратора. Восстановление - только при остановленном боте:
+
+    python backup.py list
+    python backup.py create
+    python backup.py verify backups/backup_20240101_030000.db.gz
+    python backup.py restore backups/backup_20240101_030000.db.gz
+
+Холодный слой (архив броней) копируется рядом, в backup_<время>.archive.db.gz,
+и восстанавливается вместе с основной копией.
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from database import ARCHIVE_SCHEMA, Database, db
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "backup_"
+BACKUP_SUFFIX = ".db.gz"
+ARCHIVE_SUFFIX = ".archive.db.gz"
+BACKUP_NAME_FORMAT = "%Y%m%d_%H%M%S"
+
+# Размер блока при сжатии и распаковке
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def compress_file(source: Path, target: Path, level: int = 6):
+    """Сжатие файла gzip через временный файл: недописанная копия не попадет в ротацию"""
+    partial = target.with_name(target.name + ".part")
+    with open(source, "rb") as src, gzip.open(partial, "wb", compresslevel=level) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    os.replace(partial, target)
+
+def decompress_file(source: Path, target: Path):
+    """Распаковка копии gzip"""
+    with gzip.open(source, "rb") as src, open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+def check_integrity(path: Path) -> Optional[str]:
+    """Проверка целостности файла БД; возвращает описание ошибки или None"""
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute("PRAGMA integrity_check").fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        return str(e)
+    if [row[0] for row in rows] != ["ok"]:
+        return "; ".join(row[0] for row in rows[:5])
+    return None
+
+def verify_backup(path: Path) -> Optional[str]:
+    """Проверка сжатой копии: распаковка во временный файл и проверка целостности"""
+    unpacked = path.with_name(path.name + ".verify")
+    try:
+        decompress_file(path, unpacked)
+        return check_integrity(unpacked)
+    except (OSError, EOFError) as e:
+        return str(e)
+    finally:
+        unpacked.unlink(missing_ok=True)
+
+def backup_time(path: Path) -> Optional[datetime]:
+    """Время создания копии по имени файла"""
+    stamp = path.name[len(BACKUP_PREFIX):-len(BACKUP_SUFFIX)]
+    try:
+        return datetime.strptime(stamp, BACKUP_NAME_FORMAT)
+    except ValueError:
+        return None
+
+def archive_companion(path: Path) -> Path:
+    """Копия холодного слоя, снятая вместе с основной"""
+    return path.with_name(path.name[:-len(BACKUP_SUFFIX)] + ARCHIVE_SUFFIX)
+
+class BackupManager:
+    """Создание копий и хранение по политике ротации.
+    
+    Копия снимается backup API SQLite порциями страниц в отдельном
+    потоке, поэтому не блокирует ни цикл событий, ни поток БД. Снимок
+    проверяется integrity_check до сжатия: в каталог попадают только
+    целые копии. Хранятся keep_last последних копий и по одной, самой
+    поздней, за каждый из keep_days последних дней.
+    
+    Холодный слой копируется после основной базы: бронь, перенесенная
+    между снимками, окажется в обеих копиях, но не пропадет.
+    """
+    
+    def __init__(self, database: Database, directory: str = None,
+                 keep_last: int = None, keep_days: int = None, compression_level: int = None):
+        self.database = database
+        self.directory = Path(directory or Config.BACKUP_DIR)
+        self.keep_last = Config.BACKUP_KEEP_LAST if keep_last is None else keep_last
+        self.keep_days = Config.BACKUP_KEEP_DAYS if keep_days is None else keep_days
+        self.compression_level = compression_level or Config.BACKUP_COMPRESSION_LEVEL
+        self._lock = asyncio.Lock()
+        self.created = 0
+        self.failed = 0
+        self.removed = 0
+        self.last: Optional[Dict[str, Any]] = None
+    
+    # ==================== СОЗДАНИЕ ====================
+    
+    async def create(self) -> Optional[Dict[str, Any]]:
+        """Создание копии; одновременно выполняется не больше одной"""
+        async with self._lock:
+            result = await asyncio.to_thread(self._create)
+        if result is None:
+            self.failed += 1
+        else:
+            self.created += 1
+            self.last = result
+        return result
+    
+    def _create(self) -> Optional[Dict[str, Any]]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        now = datetime.now()
+        path = self.directory / f"{BACKUP_PREFIX}{now.strftime(BACKUP_NAME_FORMAT)}{BACKUP_SUFFIX}"
+        parts = [("main", path), (ARCHIVE_SCHEMA, archive_companion(path))]
+        result = {
+            'path': str(path),
+            'name': path.name,
+            'created_at': now,
+            'size': 0,
+            'compressed_size': 0,
+            'copy_seconds': 0.0,
+            'check_seconds': 0.0,
+            'compress_seconds': 0.0
+        }
+        started = monotonic()
+        for schema, target in parts:
+            if not self._snapshot(schema, target, result):
+                # Копия без холодного слоя неполна: удаляем и основную
+                for _, written in parts:
+                    written.unlink(missing_ok=True)
+                return None
+        result['duration'] = monotonic() - started
+        
+        logger.info(f"💾 Резервная копия {path.name}: {result['size'] / 1024 / 1024:.1f} MB -> "
+                    f"{result['compressed_size'] / 1024 / 1024:.1f} MB за {result['duration']:.1f} с "
+                    f"(копия {result['copy_seconds']:.1f} с, проверка {result['check_seconds']:.1f} с, "
+                    f"сжатие {result['compress_seconds']:.1f} с)")
+        self.rotate()
+        return result
+    
+    def _snapshot(self, schema: str, target: Path, result: Dict[str, Any]) -> bool:
+        """Снимок одной базы, проверка и сжатие; размеры и время добавляются в result"""
+        snapshot = self.directory / f".{target.name[:-len('.gz')]}.tmp"
+        started = monotonic()
+        try:
+            if not self.database.backup_database(str(snapshot), schema=schema):
+                return False
+            copied = monotonic()
+            
+            error = check_integrity(snapshot)
+            if error:
+                logger.error(f"❌ Резервная копия {schema} не прошла проверку целостности: {error}")
+                return False
+            checked = monotonic()
+            
+            compress_file(snapshot, target, self.compression_level)
+            result['size'] += snapshot.stat().st_size
+            result['compressed_size'] += target.stat().st_size
+            result['copy_seconds'] += copied - started
+            result['check_seconds'] += checked - copied
+            result['compress_seconds'] += monotonic() - checked
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания резервной копии {schema}: {e}")
+            return False
+        finally:
+            snapshot.unlink(missing_ok=True)
+    
+    def is_due(self, interval_hours: float = None) -> bool:
+        """Пора ли делать плановую копию: по времени последней копии в каталоге"""
+        interval_hours = Config.BACKUP_INTERVAL_HOURS if interval_hours is None else interval_hours
+        if interval_hours <= 0:
+            return False
+        backups = self.list_backups()
+        if not backups:
+            return True
+        return datetime.now() - backups[0]['created_at'] >= timedelta(hours=interval_hours)
+    
+    # ==================== РОТАЦИЯ ====================
+    
+    def list_backups(self) -> List[Dict[str, Any]]:
+        """Копии в каталоге, новые первыми"""
+        if not self.directory.is_dir():
+            return []
+        backups = []
+        for path in self.directory.glob(f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}"):
+            created_at = backup_time(path)
+            if created_at is not None:
+                backups.append({'path': path, 'name': path.name, 'created_at': created_at,
+                                'compressed_size': path.stat().st_size})
+        backups.sort(key=lambda item: item['created_at'], reverse=True)
+        return backups
+    
+    def rotate(self) -> int:
+        """Удаление копий вне политики хранения; возвращает количество удаленных"""
+        backups = self.list_backups()
+        keep = {item['path'] for item in backups[:self.keep_last]}
+        
+        # Самая поздняя копия каждого из последних keep_days дней
+        first_day = datetime.now().date() - timedelta(days=self.keep_days - 1)
+        days = set()
+        for item in backups:
+            day = item['created_at'].date()
+            if day >= first_day and day not in days:
+                days.add(day)
+                keep.add(item['path'])
+        
+        removed = 0
+        for item in backups:
+            if item['path'] in keep:
+                continue
+            try:
+                item['path'].unlink()
+                archive_companion(item['path']).unlink(missing_ok=True)
+                removed += 1
+            except OSError as e:
+                logger.error(f"Ошибка удаления старой копии {item['name']}: {e}")
+        if removed:
+            logger.info(f"🧹 Удалено старых резервных копий: {removed}")
+        self.removed += removed
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики и метрики последней копии"""
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'removed': self.removed,
+            'last_duration': self.last['duration'] if self.last else None,
+            'last_size': self.last['size'] if self.last else None,
+            'last_compressed_size': self.last['compressed_size'] if self.last else None
+        }
+
+# ==================== ВОССТАНОВЛЕНИЕ ====================
+
+def restore_backup(path: Path, db_path: Path, archive_path: Path = None) -> Optional[Path]:
+    """Замена файла БД копией; бот должен быть остановлен.
+    
+    Копия распаковывается рядом с БД и проверяется до замены. Текущий
+    файл сохраняется с суффиксом .before-restore-<время>, файлы WAL и
+    SHM удаляются: они относятся к заменяемой базе. Если передан
+    archive_path и рядом с копией есть копия холодного слоя, она
+    восстанавливается так же и проверяется до замены основной базы.
+    Возвращает путь к сохраненному файлу или None, если базы не было.
+    """
+    pairs = [(path, db_path)]
+    companion = archive_companion(path)
+    if archive_path is not None and companion.exists():
+        pairs.append((companion, archive_path))
+    
+    unpacked = []
+    try:
+        for source, target in pairs:
+            unpacked.append(target.with_name(target.name + ".restore"))
+            decompress_file(source, unpacked[-1])
+            error = check_integrity(unpacked[-1])
+            if error:
+                raise ValueError(f"копия {source.name} повреждена: {error}")
+    except Exception:
+        for file in unpacked:
+            file.unlink(missing_ok=True)
+        raise
+    
+    previous = None
+    for file, (_, target) in zip(unpacked, pairs):
+        saved = _replace_database(file, target)
+        if target == db_path:
+            previous = saved
+    return previous
+
+def _replace_database(unpacked: Path, db_path: Path) -> Optional[Path]:
+    """Замена файла БД проверенной распакованной копией с сохранением прежнего"""
+    previous = None
+    if db_path.exists():
+        # Переносим журнал WAL в основной файл, чтобы сохраненная база была полной
+        connection = sqlite3.connect(db_path)
+        try:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            connection.close()
+        previous = db_path.with_name(f"{db_path.name}.before-restore-{datetime.now().strftime(BACKUP_NAME_FORMAT)}")
+        os.replace(db_path, previous)
+    for suffix in ("-wal", "-shm"):
+        db_path.with_name(db_path.name + suffix).unlink(missing_ok=True)
+    os.replace(unpacked, db_path)
+    return previous
+
+backups = BackupManager(db)
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии базы данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="список копий")
+    commands.add_parser("create", help="создать копию")
+    verify = commands.add_parser("verify", help="проверить копию")
+    verify.add_argument("path")
+    restore = commands.add_parser("restore", help="восстановить БД из копии (бот должен быть остановлен)")
+    restore.add_argument("path")
+    args = parser.parse_args()
+    
+    if args.command == "list":
+        for item in backups.list_backups():
+            print(f"{item['name']}  {item['compressed_size'] / 1024 / 1024:.2f} MB")
+    elif args.command == "create":
+        result = asyncio.run(backups.create())
+        if result is None:
+            raise SystemExit("Не удалось создать копию")
+        print(f"{result['path']}: {result['size']} -> {result['compressed_size']} байт "
+              f"за {result['duration']:.2f} с")
+    elif args.command == "verify":
+        error = verify_backup(Path(args.path))
+        if error:
+            raise SystemExit(f"Копия повреждена: {error}")
+        print("Копия в порядке")
+    elif args.command == "restore":
+        # Соединения этого процесса закрываются до замены файла
+        db.close()
+        try:
+            previous = restore_backup(Path(args.path), Path(Config.DATABASE_PATH), db.archive_path)
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"Восстановление не выполнено: {e}")
+        print(f"База восстановлена из {args.path}")
+        if previous:
+            print(f"Прежняя база сохранена в {previous}")
+
+if __name__ == "__main__":
+    main()
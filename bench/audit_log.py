@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Журнал действий: запись по строке и буфер audit_log с записью пачками.
+
+    python bench/audit_log.py --entries 5000
+"""
+import argparse
+from time import perf_counter
+
+import common
+from database import db
+
+def per_row(entries: int) -> float:
+    """INSERT и коммит на каждую запись"""
+    started = perf_counter()
+    for n in range(entries):
+        with db.transaction() as connection:
+            connection.execute('''
+                INSERT INTO logs (user_id, action, details) VALUES (?, ?, ?)
+            ''', (None, "bench", f"запись {n}"))
+    return perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=5000)
+    args = parser.parse_args()
+    
+    common.rate("по строке", args.entries, per_row(args.entries))
+    
+    started = perf_counter()
+    for n in range(args.entries):
+        db.add_log(None, "bench", f"запись {n}")
+    enqueued = perf_counter() - started
+    db.flush_logs()
+    total = perf_counter() - started
+    common.rate("add_log: постановка в буфер", args.entries, enqueued)
+    common.rate("add_log: вместе с записью буфера", args.entries, total)
+    print(f"буфер: {db.audit_log.stats()}")
+
+if __name__ == "__main__":
+    main()
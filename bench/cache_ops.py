@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Микрозамер кэша: операции TTLCache и get_user с кэшем и без.
+
+    python bench/cache_ops.py --operations 200000 --users 10000
+"""
+import argparse
+from time import perf_counter
+
+import common
+from cache import TTLCache
+from database import db, Database
+
+def cache_operations(operations: int, size: int):
+    """set/get/вытеснение/сброс по тегу в TTLCache"""
+    store = TTLCache(max_size=size, ttl=300, name="bench")
+    keys = [("get_user", ("id", n)) for n in range(size)]
+    
+    started = perf_counter()
+    for n in range(operations):
+        store.set(keys[n % size], {'id': n}, tags=(f"user:{n % size}",))
+    common.rate("set", operations, perf_counter() - started)
+    
+    started = perf_counter()
+    for n in range(operations):
+        store.get(keys[n % size])
+    common.rate("get: попадание", operations, perf_counter() - started)
+    
+    started = perf_counter()
+    for n in range(operations):
+        store.get(("missing", n))
+    common.rate("get: промах", operations, perf_counter() - started)
+    
+    started = perf_counter()
+    for n in range(operations):
+        store.set(("overflow", n), n)
+    common.rate("set с вытеснением LRU", operations, perf_counter() - started)
+    
+    store = TTLCache(max_size=size, ttl=300, name="bench")
+    for n in range(size):
+        store.set(keys[n], {'id': n}, tags=(f"user:{n}",))
+    started = perf_counter()
+    for n in range(size):
+        store.invalidate_tag(f"user:{n}")
+    common.rate("invalidate_tag", size, perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--operations", type=int, default=200000)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    
+    cache_operations(args.operations, args.size)
+    
+    users = common.seeded("пользователи", common.seed_users, db, args.users)
+    lookups = [users[n * 7919 % len(users)] for n in range(args.lookups)]
+    uncached = Database.get_user.uncached
+    common.report("get_user без кэша", common.timings(lambda i: uncached(db, lookups[i]), args.lookups))
+    for user_id in set(lookups):
+        db.get_user(user_id)
+    common.report("get_user из кэша", common.timings(lambda i: db.get_user(lookups[i]), args.lookups))
+    print(f"кэш БД: {db.cache.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Общая часть замеров: временная база, наполнение данными и статистика.
+
+Импортируется первым, до database: глобальный db создается при импорте
+модуля, поэтому пути к базе заранее направляются во временный каталог.
+Рабочая база и архив не затрагиваются.
+"""
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, List
+
+BENCH_DIR = tempfile.mkdtemp(prefix="parking_bench_")
+atexit.register(shutil.rmtree, BENCH_DIR, True)
+os.environ["DATABASE_PATH"] = os.path.join(BENCH_DIR, "bench.db")
+os.environ["ARCHIVE_DATABASE_PATH"] = os.path.join(BENCH_DIR, "bench_archive.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from availability import BUSY_STATUSES
+
+# Ошибки модулей бота видны, служебные сообщения не мешают выводу замеров
+logging.basicConfig(level=logging.WARNING)
+
+SEED_BATCH = 10000
+
+# ==================== СТАТИСТИКА ====================
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль отсортированного списка"""
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def timings(func: Callable, repeat: int) -> List[float]:
+    """Время repeat вызовов func в секундах, по возрастанию"""
+    result = []
+    for i in range(repeat):
+        started = perf_counter()
+        func(i)
+        result.append(perf_counter() - started)
+    return sorted(result)
+
+def report(title: str, values: List[float]):
+    """Печать p50/p99/max в миллисекундах"""
+    values = sorted(values)
+    print(f"{title:<48} p50 {percentile(values, 0.5) * 1000:8.3f} ms   "
+          f"p99 {percentile(values, 0.99) * 1000:8.3f} ms   max {values[-1] * 1000:8.3f} ms")
+
+def rate(title: str, count: int, seconds: float):
+    """Печать числа операций в секунду"""
+    print(f"{title:<48} {count / seconds:12,.0f} /s   ({count} за {seconds:.3f} s)")
+
+# ==================== НАПОЛНЕНИЕ ====================
+
+def seed_users(database, count: int, start: int = 1) -> List[int]:
+    """Пользователи с заполненными полями поиска"""
+    first_names = ["Иван", "Петр", "Анна", "Мария", "Олег", "Елена", "Сергей", "Ольга"]
+    last_names = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев"]
+    letters = "ABEKMHOPCTYX"
+    with database.writer() as connection:
+        first_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM users").fetchone()[0]
+        for offset in range(0, count, SEED_BATCH):
+            rows = []
+            for n in range(start + offset, start + min(count, offset + SEED_BATCH)):
+                rows.append((
+                    7000000000 + n,
+                    f"user{n}",
+                    f"{first_names[n % len(first_names)]} {last_names[n // 8 % len(last_names)]}",
+                    f"+7 (9{n // 10000000 % 100:02d}) {n // 10000 % 1000:03d}-{n % 10000:04d}",
+                    f"user{n}@example.com",
+                    f"{letters[n % 12]}{n % 1000:03d}{letters[n // 12 % 12]}{letters[n // 144 % 12]}{n // 1728 % 1000:03d}",
+                ))
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany('''
+                INSERT INTO users (telegram_id, username, full_name, phone, email, car_plate)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            connection.execute("COMMIT")
+    return list(range(first_id, first_id + count))
+
+def seed_spots(database, owners: List[int], count: int) -> List[int]:
+    """Места владельцев owners по кругу с разными ценами"""
+    with database.writer() as connection:
+        first_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM parking_spots").fetchone()[0]
+        rows = [(owners[n % len(owners)], f"A{n}", f"Улица {n % 500}, {n}", 50 + n % 200, 500 + n % 2000)
+                for n in range(count)]
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany('''
+            INSERT INTO parking_spots (owner_id, spot_number, address, price_per_hour, price_per_day)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        connection.execute("COMMIT")
+    return list(range(first_id, first_id + count))
+
+def seed_bookings(database, renters: List[int], spots: List[int], count: int,
+                  days: int = 30, busy_share: float = 0.5) -> datetime:
+    """Брони без пересечений по местам за days дней вокруг текущего момента.
+    
+    Доля busy_share броней занимает место (pending/confirmed/active),
+    остальные завершены или отменены. Возвращает начало периода.
+    """
+    origin = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=days // 2)
+    per_spot = max(1, count // len(spots))
+    step = timedelta(hours=days * 24 / per_spot)
+    def rows(first: int, last: int):
+        for n in range(first, last):
+            start = origin + step * (n // len(spots))
+            end = start + step * 0.75
+            busy = (n * 2654435761) % 4294967296 % 1000 < busy_share * 1000
+            status = BUSY_STATUSES[n % 3] if busy else ('completed', 'cancelled')[n % 2]
+            hours = (end - start).total_seconds() / 3600
+            yield (f"BENCH{n}", renters[n % len(renters)], spots[n % len(spots)],
+                   start, end, hours, hours * 100, status)
+    
+    with database.writer() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        for offset in range(0, count, SEED_BATCH):
+            connection.executemany('''
+                INSERT INTO bookings (booking_code, user_id, spot_id, start_time, end_time,
+                                      total_hours, total_price, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows(offset, min(count, offset + SEED_BATCH)))
+        connection.execute("COMMIT")
+    database.availability.reset()
+    return origin
+
+def seeded(title: str, func: Callable, *args, **kwargs):
+    """Наполнение с печатью затраченного времени"""
+    started = perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{title}: {perf_counter() - started:.1f} s", flush=True)
+    return result
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Задержка цикла событий при запросах к БД: прямой вызов Database и AsyncDatabase.
+
+Обработчики одновременно читают брони пользователей, фоновая задача
+просыпается каждую миллисекунду и замеряет, насколько цикл событий
+опоздал ее разбудить. Прямой вызов Database держит цикл на все время
+запроса; через adb запрос уходит в поток БД.
+
+    python bench/event_loop.py --users 5000 --bookings 200000 --requests 2000
+"""
+import argparse
+import asyncio
+from time import perf_counter
+from typing import List
+
+import common
+from database import db, adb
+
+async def watch_loop(lags: List[float], stop: asyncio.Event, interval: float = 0.001):
+    """Опоздание пробуждений цикла событий"""
+    while not stop.is_set():
+        started = perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, perf_counter() - started - interval))
+
+async def run(mode: str, users: List[int], requests: int, concurrency: int):
+    """requests обработчиков по concurrency одновременно; задержки обработчиков и цикла"""
+    latencies: List[float] = []
+    lags: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def handler(n: int):
+        async with semaphore:
+            user_id = users[n * 7919 % len(users)]
+            started = perf_counter()
+            if mode == "adb":
+                await adb.get_user_bookings(user_id)
+                await adb.get_user_spots(user_id)
+            else:
+                db.get_user_bookings(user_id)
+                db.get_user_spots(user_id)
+            latencies.append(perf_counter() - started)
+            # Остальная работа обработчика: ответ пользователю
+            await asyncio.sleep(0)
+    
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(lags, stop))
+    started = perf_counter()
+    await asyncio.gather(*(handler(n) for n in range(requests)))
+    elapsed = perf_counter() - started
+    stop.set()
+    await watcher
+    
+    print(f"--- {mode}: {requests} обработчиков, {concurrency} одновременно")
+    common.report("запрос обработчика", latencies)
+    common.report("опоздание цикла событий", lags or [0.0])
+    common.rate("обработчиков", requests, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--spots", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    
+    users = common.seeded("пользователи", common.seed_users, db, args.users)
+    spots = common.seeded("места", common.seed_spots, db, users, args.spots)
+    common.seeded("брони", common.seed_bookings, db, users, spots, args.bookings)
+    
+    for mode in ("sync", "adb"):
+        asyncio.run(run(mode, users, args.requests, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Хранилище FSM: MemoryStorage и SQLiteStorage с записью пачками.
+
+Цикл обработчика - get_state, set_state и update_data для одного ключа.
+Для SQLiteStorage отдельно замеряется первое обращение к ключу, когда
+состояние читается из базы, и повторное, из памяти.
+
+    python bench/fsm_storage.py --keys 20000
+"""
+import argparse
+import asyncio
+from time import perf_counter
+from typing import List
+
+import common
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsmstorage import SQLiteStorage
+
+async def cycles(storage, keys: List[StorageKey]) -> List[float]:
+    """Время цикла обработчика по каждому ключу"""
+    result = []
+    for n, key in enumerate(keys):
+        started = perf_counter()
+        await storage.get_state(key)
+        await storage.set_state(key, f"Registration:step{n % 5}")
+        await storage.update_data(key, {'step': n, 'phone': f"+7900{n:07d}"})
+        result.append(perf_counter() - started)
+    return result
+
+async def run(count: int):
+    keys = [StorageKey(bot_id=1, chat_id=n, user_id=n) for n in range(1, count + 1)]
+    
+    memory = MemoryStorage()
+    await cycles(memory, keys)
+    common.report("MemoryStorage", await cycles(memory, keys))
+    
+    # Первый проход создает строки в fsm_states
+    storage = SQLiteStorage()
+    await cycles(storage, keys)
+    started = perf_counter()
+    await storage.close()
+    print(f"запись {count} ключей при остановке: {(perf_counter() - started) * 1000:.1f} ms")
+    
+    storage = SQLiteStorage()
+    common.report("SQLiteStorage: первое обращение (чтение из БД)", await cycles(storage, keys))
+    common.report("SQLiteStorage: ключ в памяти", await cycles(storage, keys))
+    await storage.close()
+    print(f"хранилище: {storage.stats()}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--keys", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.keys))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Поиск свободных мест: индекс занятости в памяти и подзапрос по bookings.
+
+По умолчанию 10k мест и 1M броней за 30 дней (около полутора минут на
+наполнение). Для каждого случайного периода ответ индекса сверяется
+с ответом SQL по всем местам.
+
+    python bench/spot_search.py --spots 10000 --bookings 1000000 --queries 200
+"""
+import argparse
+import random
+from datetime import timedelta
+from time import perf_counter
+
+import common
+from database import db, BUSY_CONDITION
+
+SQL_FREE_SPOTS = f'''
+    SELECT ps.id FROM parking_spots ps
+    WHERE ps.is_active = 1
+    AND ps.id NOT IN (
+        SELECT b.spot_id FROM bookings b
+        WHERE {BUSY_CONDITION.replace('status', 'b.status')}
+        AND b.start_time < ? AND b.end_time > ?
+    )
+    ORDER BY ps.price_per_hour
+'''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--spots", type=int, default=10000)
+    parser.add_argument("--bookings", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    
+    users = common.seeded("пользователи", common.seed_users, db, args.users)
+    spots = common.seeded("места", common.seed_spots, db, users, args.spots)
+    origin = common.seeded("брони", common.seed_bookings, db, users, spots, args.bookings, days=args.days)
+    
+    started = perf_counter()
+    db._ensure_availability()
+    print(f"загрузка индекса: {perf_counter() - started:.2f} s, {db.availability.stats()}")
+    
+    random_ = random.Random(42)
+    periods = []
+    for _ in range(args.queries):
+        start = origin + timedelta(minutes=random_.randrange(args.days * 24 * 60))
+        periods.append((start, start + timedelta(hours=random_.choice((1, 2, 4, 24)))))
+    spot_ids = [spots[random_.randrange(len(spots))] for _ in range(args.queries)]
+    
+    common.report("is_spot_available",
+                  common.timings(lambda i: db.is_spot_available(spot_ids[i], *periods[i]), args.queries))
+    common.report("get_available_spots (50)",
+                  common.timings(lambda i: db.get_available_spots(*periods[i]), args.queries))
+    
+    # Сверка: все свободные места по индексу и по SQL
+    mismatches = 0
+    sql_times = []
+    with db.reader() as connection:
+        for start, end in periods:
+            started = perf_counter()
+            expected = {row['id'] for row in connection.execute(SQL_FREE_SPOTS, (end, start))}
+            sql_times.append(perf_counter() - started)
+            if set(db.availability.filter_free(spots, start, end)) != expected:
+                mismatches += 1
+    common.report("SQL: все свободные места", sql_times)
+    print(f"расхождений индекса с SQL: {mismatches} из {len(periods)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Поиск пользователей: индекс FTS5 (trigram) и перебор через LIKE.
+
+По умолчанию 1M пользователей (около двух минут на наполнение); индекс
+заполняется триггерами. Перебор через LIKE на миллионе строк медленный,
+поэтому для него запросов меньше.
+
+    python bench/user_search.py --users 1000000 --repeat 50 --like-repeat 3
+"""
+import argparse
+
+import common
+from database import db
+
+QUERIES = [
+    ("имя и фамилия", "Анна Смирнов"),
+    ("фрагмент имени", "Ольг"),
+    ("username", "@user1234"),
+    ("фрагмент телефона", "234-5"),
+    ("телефон полностью", "+7 (900) 000-1234"),
+    ("email", "user9876@example"),
+    ("номер авто", "P567CP"),
+    ("нет совпадений", "Зигмунд"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--like-repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    
+    if not db.user_search_fts:
+        print("FTS5 с trigram недоступен: замеряется только LIKE")
+    common.seeded("пользователи", common.seed_users, db, args.users)
+    
+    modes = [("fts", True, args.repeat), ("like", False, args.like_repeat)] if db.user_search_fts \
+        else [("like", False, args.like_repeat)]
+    for mode, fts, repeat in modes:
+        db.user_search_fts = fts
+        print(f"--- {mode}")
+        for title, query in QUERIES:
+            found = len(db.search_users(query, limit=args.limit))
+            common.report(f"{title} ({found})",
+                          common.timings(lambda i: db.search_users(query, limit=args.limit), repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность записи: коммит на каждый запрос и единица работы.
+
+Операция - пополнение баланса: UPDATE users и INSERT в balance_transactions.
+Сравниваются коммит после каждого запроса (как до transaction()), один
+коммит на операцию (update_user_balance) и несколько операций в одной
+внешней транзакции. Цена коммита зависит от DB_SYNCHRONOUS: с FULL
+каждый коммит ждет fsync.
+
+    DB_SYNCHRONOUS=FULL python bench/write_throughput.py --operations 5000 --batch 100
+"""
+import argparse
+from time import perf_counter
+
+import common
+from database import db
+
+def per_statement(users, operations: int) -> float:
+    """Коммит после каждого запроса"""
+    started = perf_counter()
+    with db.writer() as connection:
+        for n in range(operations):
+            user_id = users[n % len(users)]
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("UPDATE users SET balance = balance + ? WHERE id = ?", (10, user_id))
+            connection.execute("COMMIT")
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute('''
+                INSERT INTO balance_transactions (user_id, amount, transaction_type, description)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, 10, "deposit", "bench"))
+            connection.execute("COMMIT")
+    return perf_counter() - started
+
+def per_operation(users, operations: int) -> float:
+    """Один коммит на операцию"""
+    started = perf_counter()
+    for n in range(operations):
+        db.update_user_balance(users[n % len(users)], 10, "deposit", "bench")
+    return perf_counter() - started
+
+def batched(users, operations: int, batch: int) -> float:
+    """batch операций в одной внешней транзакции"""
+    started = perf_counter()
+    for offset in range(0, operations, batch):
+        with db.transaction():
+            for n in range(offset, min(operations, offset + batch)):
+                db.update_user_balance(users[n % len(users)], 10, "deposit", "bench")
+    return perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--operations", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+    
+    users = common.seeded("пользователи", common.seed_users, db, args.users)
+    
+    common.rate("коммит на каждый запрос", args.operations, per_statement(users, args.operations))
+    common.rate("коммит на операцию", args.operations, per_operation(users, args.operations))
+    common.rate(f"{args.batch} операций в транзакции", args.operations,
+                batched(users, args.operations, args.batch))
+    db.flush_logs()
+
+if __name__ == "__main__":
+    main()
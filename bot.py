@@ -9,17 +9,27 @@ import os
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import List, Optional
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
 
 # Импорт конфигурации и базы данных
 from config import Config
-from database import db
+from database import db, adb
+from scheduler import scheduler, COMPLETE, AUTO_CANCEL
+from broadcast import broadcaster
+from outbox import outbox, HIGH
+from notifications import dispatcher
+from fsmstorage import SQLiteStorage
+from backup import backups
+from retention import retention
+from webhook import run_webhook
 
 # Импорт всех обработчиков
 from handlers.start import router as start_router
@@ -44,25 +54,73 @@ logger = logging.getLogger(__name__)
 # Создаем необходимые директории
 def create_directories():
     """Создание необходимых директорий"""
-    directories = ["logs", "backups", "data"]
+    directories = ["logs", Config.BACKUP_DIR, "data"]
     
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
         logger.info(f"📁 Создана директория: {directory}")
 
-async def on_startup(bot: Bot):
-    """Действия при запуске бота"""
+# Фоновые задачи ведущего процесса
+background_task: Optional[asyncio.Task] = None
+
+async def start_leader_services(bot: Bot):
+    """Запуск служб, которые работают только в одном процессе"""
+    global background_task
+    
+    # Доставка уведомлений, сроки бронирований и рассылки
+    await dispatcher.start()
+    await scheduler.start()
+    await broadcaster.start(bot)
+    
+    background_task = asyncio.create_task(background_tasks())
+
+async def stop_leader_services():
+    """Остановка служб ведущего процесса"""
+    global background_task
+    
+    if background_task:
+        background_task.cancel()
+        await asyncio.gather(background_task, return_exceptions=True)
+        background_task = None
+    
+    await broadcaster.stop()
+    await scheduler.stop()
+    await dispatcher.stop()
+
+async def on_startup(bot: Bot, election=None, worker_index: int = 0):
+    """Действия при запуске бота.
+    
+    В режиме нескольких процессов (cluster.py) передается election: службы
+    ведущего процесса запускает он, и только в процессе, выигравшем выборы.
+    """
     logger.info("🤖 Бот запущен и готов к работе!")
     
     # Очищаем истекшие админ-сессии при запуске
     try:
-        cursor = db.connection.cursor()
-        cursor.execute('DELETE FROM admin_sessions WHERE expires_at < ?', (datetime.now(),))
-        db.connection.commit()
+        await adb.cleanup_expired_admin_sessions()
         logger.info("🧹 Очищены истекшие админ-сессии")
     except Exception as e:
         logger.error(f"Ошибка очистки админ-сессий: {e}")
     
+    # Запускаем очередь исходящих сообщений
+    outbox.start(bot)
+    
+    if election is None:
+        await start_leader_services(bot)
+    else:
+        await election.start()
+    
+    if worker_index:
+        return
+    
+    # Горячие запросы должны идти по индексам
+    try:
+        for regression in await adb.check_query_plans():
+            logger.warning(f"⚠️ Запрос «{regression['query']}» без индекса: "
+                           f"{regression['error'] or '; '.join(regression['plan'])}")
+    except Exception as e:
+        logger.error(f"Ошибка проверки планов запросов: {e}")
+    
     # Отправляем уведомление админу
     try:
         await bot.send_message(
@@ -70,128 +128,79 @@ async def on_startup(bot: Bot):
             text=f"✅ <b>Бот запущен!</b>\n\n"
                  f"Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
                  f"Версия: 1.0.0\n"
-                 f"Пользователей в базе: {db.count_users()}"
+                 f"Пользователей в базе: {await adb.count_users()}"
         )
     except Exception as e:
         logger.warning(f"Не удалось отправить уведомление админу: {e}")
     
     logger.info("🎉 Бот успешно запущен!")
 
-async def on_shutdown(bot: Bot):
+async def on_shutdown(bot: Bot, election=None, worker_index: int = 0):
     """Действия при остановке бота"""
     logger.info("🛑 Остановка бота...")
     
     # Отправляем уведомление админу
-    try:
-        await bot.send_message(
-            chat_id=Config.ADMIN_ID,
-            text=f"🛑 <b>Бот остановлен!</b>\n\n"
-                 f"Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
-        )
-    except Exception as e:
-        logger.warning(f"Не удалось отправить уведомление админу: {e}")
+    if not worker_index:
+        try:
+            await bot.send_message(
+                chat_id=Config.ADMIN_ID,
+                text=f"🛑 <b>Бот остановлен!</b>\n\n"
+                     f"Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отправить уведомление админу: {e}")
     
-    # Закрываем соединение с базой данных
-    db.close()
+    # Останавливаем рассылки, планировщик и закрываем соединение с базой данных
+    if election is None:
+        await stop_leader_services()
+    else:
+        await election.stop()
+    await outbox.stop()
+    
+    # Дописываем буфер журнала действий
+    flushed = await adb.flush_logs()
+    logger.info(f"📝 Журнал действий сброшен на диск: {flushed} записей")
+    await adb.close()
     logger.info("✅ Соединение с БД закрыто")
 
-async def check_expired_bookings():
-    """Проверка и завершение истекших бронирований"""
+async def complete_expired_bookings(booking_ids: List[int]) -> Optional[List[int]]:
+    """Завершение бронирований, время которых истекло; возвращает id завершенных"""
     try:
-        cursor = db.connection.cursor()
-        cursor.execute('''
-            SELECT b.*, ps.spot_number, u.full_name as user_name
-            FROM bookings b
-            JOIN parking_spots ps ON b.spot_id = ps.id
-            JOIN users u ON b.user_id = u.id
-            WHERE b.status = 'active'
-            AND b.end_time < ?
-        ''', (datetime.now(),))
-        
-        expired_bookings = cursor.fetchall()
+        # Одна транзакция на всю пачку: статусы, уведомления и логи
+        completed = await adb.complete_expired_bookings(booking_ids)
+        if completed is None:
+            return None
         
-        for booking in expired_bookings:
-            # Завершаем бронирование
-            success = db.update_booking_status(booking['id'], 'completed')
-            
-            if success:
-                logger.info(f"✅ Бронирование #{booking['booking_code']} завершено (время истекло)")
-                
-                # Отправляем уведомление пользователю
-                try:
-                    user = db.get_user(user_id=booking['user_id'])
-                    if user:
-                        db.add_notification(
-                            user['id'],
-                            "booking_completed",
-                            "Бронирование завершено",
-                            f"Ваше бронирование #{booking['booking_code']} завершено.\n"
-                            f"Место: #{booking['spot_number']}\n"
-                            f"Время истекло: {datetime.fromisoformat(booking['end_time']).strftime('%d.%m.%Y %H:%M')}",
-                        )
-                except Exception as e:
-                    logger.error(f"Ошибка уведомления пользователя: {e}")
-        
-        if expired_bookings:
-            logger.info(f"📊 Завершено {len(expired_bookings)} истекших бронирований")
+        if completed:
+            logger.info(f"📊 Завершено {len(completed)} истекших бронирований: "
+                       f"{', '.join('#' + b['booking_code'] for b in completed[:10])}")
+        return [booking['id'] for booking in completed]
             
     except Exception as e:
-        logger.error(f"❌ Ошибка проверки истекших бронирований: {e}")
+        logger.error(f"❌ Ошибка завершения истекших бронирований: {e}")
+        return None
 
-async def auto_cancel_unpaid_bookings():
-    """Автоматическая отмена неоплаченных бронирований"""
+async def cancel_unpaid_bookings(booking_ids: List[int]) -> Optional[List[int]]:
+    """Автоматическая отмена неоплаченных бронирований; возвращает id отмененных"""
     try:
         auto_cancel_hours = int(Config.AUTO_CANCEL_HOURS)
-        cutoff_time = datetime.now() - timedelta(hours=auto_cancel_hours)
-        
-        cursor = db.connection.cursor()
-        cursor.execute('''
-            SELECT b.*, ps.spot_number, u.full_name as user_name
-            FROM bookings b
-            JOIN parking_spots ps ON b.spot_id = ps.id
-            JOIN users u ON b.user_id = u.id
-            WHERE b.status = 'pending'
-            AND b.payment_status = 'pending'
-            AND b.created_at < ?
-        ''', (cutoff_time,))
-        
-        unpaid_bookings = cursor.fetchall()
         
-        for booking in unpaid_bookings:
-            # Отменяем бронирование
-            success = db.update_booking_status(
-                booking['id'],
-                'cancelled',
-                cancelled_by=None,
-                reason=f"Автоматическая отмена: не оплачено в течение {auto_cancel_hours} часов"
-            )
-            
-            if success:
-                logger.info(f"❌ Бронирование #{booking['booking_code']} отменено (не оплачено)")
-                
-                # Освобождаем период
-                if booking['period_id']:
-                    db.release_period(booking['period_id'])
-                
-                # Отправляем уведомление пользователю
-                try:
-                    user = db.get_user(user_id=booking['user_id'])
-                    if user:
-                        db.add_notification(
-                            user['id'],
-                            "booking_cancelled",
-                            "Бронирование отменено",
-                            f"Ваше бронирование #{booking['booking_code']} отменено.\n"
-                            f"Причина: не было оплачено в течение {auto_cancel_hours} часов.",
-                        )
-                except Exception as e:
-                    logger.error(f"Ошибка уведомления пользователя: {e}")
+        # Индекс занятости освобождает периоды после коммита сам
+        cancelled = await adb.cancel_unpaid_bookings(
+            booking_ids,
+            reason=f"Автоматическая отмена: не оплачено в течение {auto_cancel_hours} часов"
+        )
+        if cancelled is None:
+            return None
         
-        if unpaid_bookings:
-            logger.info(f"📊 Отменено {len(unpaid_bookings)} неоплаченных бронирований")
+        if cancelled:
+            logger.info(f"📊 Отменено {len(cancelled)} неоплаченных бронирований: "
+                       f"{', '.join('#' + b['booking_code'] for b in cancelled[:10])}")
+        return [booking['id'] for booking in cancelled]
             
     except Exception as e:
         logger.error(f"❌ Ошибка автоматической отмены бронирований: {e}")
+        return None
 
 async def background_tasks():
     """Фоновые задачи бота"""
@@ -202,23 +211,23 @@ async def background_tasks():
             # Выполняем задачи каждые 5 минут
             await asyncio.sleep(300)  # 5 минут
             
-            # 1. Очистка старых данных (раз в день)
-            now = datetime.now()
-            if now.hour == 3 and now.minute < 5:  # Каждый день в 3:00
+            # 1. Очистка старых данных (раз в RETENTION_INTERVAL_HOURS, порциями)
+            if await retention.is_due():
                 logger.info("🧹 Запуск очистки старых данных...")
-                success = db.cleanup_old_data(days=90)
-                if success:
-                    logger.info("✅ Очистка старых данных выполнена")
-                else:
-                    logger.error("❌ Ошибка очистки старых данных")
+                await retention.run()
+                
+                # Снимок счетчиков статистики для истории
+                await adb.save_stats_snapshot()
             
-            # 2. Проверка истекших бронирований
-            await check_expired_bookings()
+            # Плановая резервная копия
+            if backups.is_due():
+                await backups.create()
             
-            # 3. Автоотмена неоплаченных бронирований
-            await auto_cancel_unpaid_bookings()
+            # Сроки бронирований обрабатывает scheduler; сверка с БД
+            # возвращает сроки, потерянные после сбоев обработчиков
+            await scheduler.resync()
             
-            # 4. Проверка системного здоровья
+            # 2. Проверка системного здоровья
             await check_system_health()
             
         except Exception as e:
@@ -228,26 +237,48 @@ async def check_system_health():
     """Проверка здоровья системы"""
     try:
         # Проверка базы данных
-        if not db.check_connection():
+        if not await adb.check_connection():
             logger.error("❌ Потеряно соединение с базой данных!")
             
             # Пытаемся переподключиться
-            db.connect()
+            await adb.connect()
             
-            if db.check_connection():
+            if await adb.check_connection():
                 logger.info("✅ Соединение с базой данных восстановлено")
             else:
                 logger.critical("❌ Не удалось восстановить соединение с базой данных!")
                 return
         
         # Проверка количества пользователей
-        user_count = db.count_users()
+        user_count = await adb.count_users()
         logger.info(f"👥 Пользователей в системе: {user_count}")
         
         # Проверка активных бронирований
-        active_bookings = db.count_bookings(status='active')
+        active_bookings = await adb.count_bookings(status='active')
         logger.info(f"📋 Активных бронирований: {active_bookings}")
         
+        # Эффективность кэша пользователей
+        cache = await adb.cache_stats()
+        logger.info(f"🗄 Кэш пользователей: {cache['size']} записей, "
+                   f"попаданий {cache['hit_rate']:.0%}")
+        
+        # Очередь исходящих сообщений
+        queue = outbox.stats()
+        logger.info(f"📨 Очередь сообщений: отправлено {queue['sent']} "
+                   f"(объединено {queue['coalesced']}), в очереди {queue['pending']}, "
+                   f"ошибок {queue['failed']}")
+        audit = await adb.run(db.audit_log.stats)
+        if audit['dropped']:
+            logger.warning(f"⚠️ Журнал действий: потеряно {audit['dropped']} записей при переполнении буфера")
+        
+        notifications = dispatcher.stats()
+        logger.info(f"🔔 Уведомлений доставлено {notifications['delivered']}, "
+                   f"сводок {notifications['digests']}")
+        
+        backup = backups.stats()
+        if backup['failed']:
+            logger.warning(f"⚠️ Резервные копии: ошибок {backup['failed']}, создано {backup['created']}")
+        
         # Проверка свободного места (если возможно)
         try:
             import shutil
@@ -270,18 +301,65 @@ async def error_handler(exception: Exception, bot: Bot, message: Message = None)
     logger.error(f"❌ Необработанное исключение: {exception}")
     
     try:
-        # Отправляем уведомление админу об ошибке
-        await bot.send_message(
-            chat_id=Config.ADMIN_ID,
-            text=f"⚠️ <b>Произошла ошибка в боте!</b>\n\n"
-                 f"<code>{str(exception)[:1000]}</code>\n\n"
-                 f"Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
+        # Уведомление админу через очередь: серия ошибок уйдет одним сообщением
+        outbox.send(
+            Config.ADMIN_ID,
+            f"⚠️ <b>Произошла ошибка в боте!</b>\n\n"
+            f"<code>{str(exception)[:1000]}</code>\n\n"
+            f"Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}",
+            priority=HIGH
         )
     except Exception as e:
         logger.error(f"❌ Не удалось отправить уведомление об ошибке: {e}")
     
     return True
 
+def create_bot() -> Bot:
+    """Создание бота; TELEGRAM_API_URL направляет запросы на другой сервер Bot API"""
+    session = None
+    if Config.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(Config.TELEGRAM_API_URL))
+    return Bot(
+        token=Config.BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми обработчиками"""
+    # Состояния FSM переживают перезапуск: хранятся в БД, пишутся в фоне.
+    # Dispatcher закрывает хранилище при остановке раньше on_shutdown,
+    # поэтому последние изменения успевают записаться до закрытия БД
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    
+    # Регистрация всех роутеров
+    routers = [
+        start_router,
+        spots_router,
+        booking_router,
+        profile_router,
+        admin_router,
+        utils_router
+    ]
+    
+    for router in routers:
+        dp.include_router(router)
+    
+    logger.info("✅ Все обработчики зарегистрированы")
+    
+    # Обработчики сроков бронирований
+    scheduler.register(COMPLETE, complete_expired_bookings)
+    scheduler.register(AUTO_CANCEL, cancel_unpaid_bookings)
+    
+    # Регистрация обработчиков ошибок
+    dp.errors.register(error_handler)
+    
+    # Установка обработчиков запуска и остановки
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
 async def main():
     """Основная функция запуска бота"""
     
@@ -300,46 +378,20 @@ async def main():
             return
         
         # Проверка соединения с базой данных
-        if not db.check_connection():
+        if not await adb.check_connection():
             logger.error("❌ Ошибка подключения к базе данных!")
             return
         
         logger.info("✅ База данных подключена")
         
         # Инициализация бота и диспетчера
-        bot = Bot(
-            token=Config.BOT_TOKEN,
-            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-        )
+        bot = create_bot()
+        dp = create_dispatcher()
         
-        # Используем MemoryStorage для состояний
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
-        
-        # Регистрация всех роутеров
-        routers = [
-            start_router,
-            spots_router,
-            booking_router,
-            profile_router,
-            admin_router,
-            utils_router
-        ]
-        
-        for router in routers:
-            dp.include_router(router)
-        
-        logger.info("✅ Все обработчики зарегистрированы")
-        
-        # Регистрация обработчиков ошибок
-        dp.errors.register(error_handler)
-        
-        # Установка обработчиков запуска и остановки
-        dp.startup.register(on_startup)
-        dp.shutdown.register(on_shutdown)
-        
-        # Запускаем фоновые задачи
-        asyncio.create_task(background_tasks())
+        if Config.BOT_MODE == "webhook":
+            # Обновления приходят сами, без цикла getUpdates
+            await run_webhook(bot, dp)
+            return
         
         # Запуск поллинга
         logger.info("🔄 Запуск поллинга...")
@@ -352,7 +404,12 @@ async def main():
 def run_bot():
     """Запуск бота с обработкой KeyboardInterrupt"""
     try:
-        asyncio.run(main())
+        if Config.CLUSTER_WORKERS:
+            # Несколько процессов-обработчиков за приемником webhook
+            from cluster import run_cluster
+            run_cluster()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("🛑 Бот остановлен пользователем (Ctrl+C)")
     except Exception as e:
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Массовая рассылка сообщений с ограничением частоты и продолжением после перезапуска
+"""
+import asyncio
+import logging
+from collections import Counter
+from time import monotonic
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+
+from config import Config
+from database import adb
+from ratelimit import TokenBucket, telegram_bucket
+
+logger = logging.getLogger(__name__)
+
+# Результаты доставки одному получателю
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"  # пользователь остановил бота или удалил аккаунт
+
+# Сколько ждать завершения текущей порции при остановке бота
+STOP_TIMEOUT_SECONDS = 10
+
+class Broadcaster:
+    """Движок рассылок.
+    
+    Получатели читаются порциями по возрастанию users.id; после каждой
+    порции курсор и счетчики сохраняются в таблицу broadcasts. После
+    перезапуска рассылка продолжается с курсора, повторно сообщение
+    может получить не больше одной порции.
+    """
+    
+    def __init__(self, rate: float = None, concurrency: int = None, batch_size: int = None):
+        # Без запаса токенов: сообщения идут равномерно, без всплеска на старте
+        self.bucket = TokenBucket(rate or Config.BROADCAST_RATE, capacity=1)
+        self.concurrency = concurrency or Config.BROADCAST_CONCURRENCY
+        self.batch_size = batch_size or Config.BROADCAST_BATCH_SIZE
+        self.bot: Optional[Bot] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._progress: Dict[int, Dict] = {}
+        self._stopping = False
+        self.retry_after_hits = 0
+    
+    async def start(self, bot: Bot):
+        """Привязка к боту и продолжение незавершенных рассылок"""
+        self.bot = bot
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopping = False
+        await self.resume()
+    
+    async def resume(self):
+        """Запуск незавершенных рассылок, которые не идут в этом процессе"""
+        for broadcast in await adb.get_running_broadcasts():
+            if broadcast['id'] in self._tasks:
+                continue
+            logger.info(f"📢 Продолжение рассылки #{broadcast['id']} с пользователя {broadcast['last_user_id']}")
+            self.launch(broadcast['id'])
+    
+    async def stop(self):
+        """Остановка: текущие порции дописываются, рассылки продолжатся при запуске"""
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=STOP_TIMEOUT_SECONDS)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.bot = None
+    
+    def launch(self, broadcast_id: int):
+        """Запуск рассылки в фоне"""
+        if broadcast_id in self._tasks:
+            return
+        if self.bot is None:
+            # Процесс не ведущий: рассылку из БД запустит ведущий (resume)
+            return
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+    
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Отмена рассылки"""
+        cancelled = await adb.finish_broadcast(broadcast_id, 'cancelled')
+        task = self._tasks.get(broadcast_id)
+        if task:
+            task.cancel()
+        return cancelled
+    
+    def is_running(self, broadcast_id: int) -> bool:
+        """Идет ли рассылка в этом процессе"""
+        return broadcast_id in self._tasks
+    
+    async def stats(self, broadcast_id: int) -> Optional[Dict]:
+        """Прогресс рассылки и скорость отправки в текущем запуске"""
+        broadcast = await adb.get_broadcast(broadcast_id)
+        if not broadcast:
+            return None
+        
+        processed = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+        progress = self._progress.get(broadcast_id)
+        rate = 0.0
+        if progress:
+            elapsed = monotonic() - progress['started']
+            rate = progress['processed'] / elapsed if elapsed > 0 else 0.0
+        
+        return {
+            **broadcast,
+            'processed': processed,
+            'percent': min(100.0, processed * 100 / broadcast['total']) if broadcast['total'] else 100.0,
+            'rate': rate,
+            'retry_after_hits': self.retry_after_hits
+        }
+    
+    async def _deliver(self, chat_id: int, text: str) -> str:
+        """Доставка одному получателю с повторами"""
+        async with self._semaphore:
+            for attempt in range(Config.BROADCAST_MAX_ATTEMPTS):
+                await self.bucket.acquire()
+                await telegram_bucket.acquire()
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+                    return SENT
+                except TelegramRetryAfter as e:
+                    # Лимит общий для бота: останавливаем все отправки
+                    self.retry_after_hits += 1
+                    self.bucket.pause(e.retry_after)
+                    telegram_bucket.pause(e.retry_after)
+                    logger.warning(f"⏳ Flood control, пауза рассылки {e.retry_after} с")
+                except TelegramForbiddenError:
+                    return BLOCKED
+                except TelegramBadRequest as e:
+                    logger.debug(f"Сообщение рассылки не доставлено {chat_id}: {e}")
+                    return FAILED
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    logger.warning(f"⚠️ Ошибка отправки {chat_id}, попытка {attempt + 1}: {e}")
+                    await asyncio.sleep(min(30, 2 ** attempt))
+                except Exception as e:
+                    logger.error(f"❌ Ошибка отправки сообщения рассылки {chat_id}: {e}")
+                    return FAILED
+            return FAILED
+    
+    async def _run(self, broadcast_id: int):
+        """Рассылка порциями до конца списка получателей"""
+        try:
+            broadcast = await adb.get_broadcast(broadcast_id)
+            if not broadcast or broadcast['status'] != 'running':
+                return
+            
+            cursor = broadcast['last_user_id']
+            progress = self._progress[broadcast_id] = {'started': monotonic(), 'processed': 0}
+            
+            while not self._stopping:
+                recipients = await adb.get_broadcast_recipients(cursor, self.batch_size)
+                if not recipients:
+                    break
+                
+                results = Counter(await asyncio.gather(*(
+                    self._deliver(recipient['telegram_id'], broadcast['text'])
+                    for recipient in recipients
+                )))
+                cursor = recipients[-1]['id']
+                progress['processed'] += len(recipients)
+                if not await adb.save_broadcast_progress(
+                    broadcast_id, cursor,
+                    sent=results[SENT], failed=results[FAILED], blocked=results[BLOCKED]
+                ):
+                    # Рассылку остановили, возможно из другого процесса
+                    logger.info(f"⛔ Рассылка #{broadcast_id} остановлена на пользователе {cursor}")
+                    return
+            
+            if self._stopping:
+                logger.info(f"⏸ Рассылка #{broadcast_id} приостановлена на пользователе {cursor}")
+                return
+            
+            await adb.finish_broadcast(broadcast_id)
+            stats = await self.stats(broadcast_id)
+            logger.info(f"✅ Рассылка #{broadcast_id} завершена: отправлено {stats['sent']}, "
+                        f"ошибок {stats['failed']}, заблокировали бота {stats['blocked']}, "
+                        f"{stats['rate']:.1f} сообщ./с")
+            await self._report(stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка рассылки #{broadcast_id}: {e}")
+        finally:
+            self._progress.pop(broadcast_id, None)
+    
+    async def _report(self, stats: Dict):
+        """Итоговый отчет администратору, запустившему рассылку"""
+        try:
+            await self.bot.send_message(
+                chat_id=stats['admin_chat_id'],
+                text=f"📢 <b>Рассылка #{stats['id']} завершена</b>\n\n"
+                     f"✅ Доставлено: {stats['sent']}\n"
+                     f"🚫 Заблокировали бота: {stats['blocked']}\n"
+                     f"❌ Ошибок: {stats['failed']}\n"
+                     f"⚡ Скорость: {stats['rate']:.1f} сообщ./с"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отправить отчет о рассылке: {e}")
+
+broadcaster = Broadcaster()
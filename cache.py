@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Кэш в памяти: LRU с временем жизни записей и инвалидацией по тегам
+"""
+import functools
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+_MISSING = object()
+
+def _copy(value: Any) -> Any:
+    """Поверхностная копия: вызывающий код может менять полученные словари"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    return value
+
+class TTLCache:
+    """Ограниченный LRU-кэш с ленивым истечением записей.
+    
+    Просроченная запись удаляется при чтении, при переполнении
+    вытесняется самая давно использованная. Теги позволяют сбросить
+    группу записей сразу, например все записи места "spot:42".
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 300, name: str = "cache"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        # Поколение растет при каждой инвалидации: значение, вычисленное
+        # до нее, не будет сохранено поверх более свежих данных
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение по ключу или default"""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] < monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: Hashable, value: Any, ttl: float = None,
+            tags: Iterable[str] = (), generation: int = None):
+        """Сохранение значения; generation - поколение на момент чтения из источника"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._items:
+                self._remove(key)
+            tags = tuple(tags)
+            self._items[key] = (monotonic() + (self.ttl if ttl is None else ttl), value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._items) > self.max_size:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+    
+    def _remove(self, key: Hashable):
+        entry = self._items.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+    
+    def delete(self, key: Hashable):
+        """Удаление записи"""
+        with self._lock:
+            self.generation += 1
+            self._remove(key)
+    
+    def invalidate_tag(self, *tags: str) -> int:
+        """Удаление всех записей с указанными тегами"""
+        removed = 0
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+        return removed
+    
+    def clear(self):
+        """Полная очистка"""
+        with self._lock:
+            self.generation += 1
+            self._items.clear()
+            self._tags.clear()
+    
+    def clear_expired(self) -> int:
+        """Удаление всех просроченных записей"""
+        now = monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._items.items() if entry[0] < now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+def cached(ttl: float = None, key: Callable = None, tags: Callable = None,
+           cache_attr: str = "cache"):
+    """Кэширование результата метода в TTLCache объекта.
+    
+    key(*args, **kwargs) строит ключ из аргументов, tags(result, *args, **kwargs)
+    возвращает теги записи. None не кэшируется, как и результаты, прочитанные
+    внутри открытой транзакции записи (объект сообщает это через in_transaction()).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            store: TTLCache = getattr(self, cache_attr)
+            if key is not None:
+                cache_key = (method.__name__, key(*args, **kwargs))
+            else:
+                cache_key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            
+            value = store.get(cache_key, _MISSING)
+            if value is not _MISSING:
+                return _copy(value)
+            
+            generation = store.generation
+            value = method(self, *args, **kwargs)
+            in_transaction = getattr(self, "in_transaction", None)
+            if value is not None and not (in_transaction and in_transaction()):
+                entry_tags = tags(value, *args, **kwargs) if tags else ()
+                store.set(cache_key, _copy(value), ttl=ttl, tags=entry_tags, generation=generation)
+            return value
+        
+        wrapper.uncached = method
+        return wrapper
+    return decorator
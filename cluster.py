@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Режим нескольких процессов: прием webhook и распределение обновлений по процессам
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Awaitable, Callable, List, Optional
+
+from aiohttp import web
+
+from config import Config
+from database import db, adb
+from broadcast import broadcaster
+from ratelimit import telegram_bucket
+from webhook import SECRET_HEADER, UpdateRunner, update_chat_id
+from bot import create_bot, create_dispatcher, start_leader_services, stop_leader_services
+
+logger = logging.getLogger(__name__)
+
+# Аренда, которую держит процесс с фоновыми задачами
+LEADER_LEASE = "background"
+
+# Сколько хранить журнал изменений: процесс, отставший сильнее, сбрасывает кэш целиком
+CHANGE_LOG_MAX_AGE_SECONDS = 600
+
+# Как часто ведущий процесс подбирает рассылки, запущенные в других процессах
+BROADCAST_RESUME_SECONDS = 5
+
+# Сколько ждать обработки принятых обновлений при остановке
+STOP_TIMEOUT_SECONDS = 10
+
+# Сколько ждать запуска обработчиков перед регистрацией webhook
+STARTUP_TIMEOUT_SECONDS = 60
+
+def process_name() -> str:
+    """Имя процесса для журнала изменений и аренды"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class LeaderElection:
+    """Выбор единственного ведущего процесса арендой в БД.
+    
+    Аренда продлевается каждую треть срока. Процесс, не сумевший продлить
+    аренду, останавливает службы ведущего; другой процесс захватит ее не
+    раньше, чем истечет срок, так что службы двух процессов пересекаются
+    не дольше одного интервала продления.
+    """
+    
+    def __init__(self, on_elected: Callable[[], Awaitable], on_demoted: Callable[[], Awaitable],
+                 name: str = LEADER_LEASE, lease_seconds: float = None):
+        self.name = name
+        self.holder = process_name()
+        self.lease_seconds = lease_seconds or Config.CLUSTER_LEASE_SECONDS
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Запуск участия в выборах"""
+        self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        while True:
+            try:
+                acquired = await adb.acquire_lease(self.name, self.holder, self.lease_seconds)
+                if acquired and not self.is_leader:
+                    self.is_leader = True
+                    logger.info(f"👑 Процесс {self.holder} стал ведущим")
+                    await self.on_elected()
+                elif not acquired and self.is_leader:
+                    self.is_leader = False
+                    logger.warning(f"⚠️ Процесс {self.holder} потерял аренду ведущего")
+                    await self.on_demoted()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка выбора ведущего процесса: {e}")
+            await asyncio.sleep(self.lease_seconds / 3)
+    
+    async def stop(self):
+        """Выход из выборов: аренда освобождается сразу, не дожидаясь срока"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_demoted()
+            await adb.release_lease(self.name, self.holder)
+
+class UpdateWorker:
+    """Процесс-обработчик обновлений своей доли чатов.
+    
+    Обновления обрабатывает UpdateRunner: по очереди внутри чата,
+    параллельно между чатами. Перед каждым обновлением применяются
+    изменения других процессов: сброс кэша и индекса занятости.
+    Состояния FSM согласованы без синхронизации: ключ состояния
+    содержит chat_id, и каждым чатом владеет один процесс.
+    """
+    
+    def __init__(self, index: int, count: int, updates: multiprocessing.Queue,
+                 ready: multiprocessing.Queue):
+        self.index = index
+        self.count = count
+        self.updates = updates
+        self.ready = ready
+        # Чтение межпроцессной очереди блокирует поток, поэтому отдельный поток
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="updates")
+    
+    async def _sync(self, election: LeaderElection):
+        """Опрос изменений других процессов; ведущий еще чистит журнал и подбирает рассылки"""
+        next_prune = next_resume = monotonic()
+        while True:
+            try:
+                await asyncio.sleep(Config.CLUSTER_SYNC_MS / 1000)
+                await adb.sync_external_changes()
+                if election.is_leader and monotonic() >= next_resume:
+                    next_resume = monotonic() + BROADCAST_RESUME_SECONDS
+                    await broadcaster.resume()
+                if election.is_leader and monotonic() >= next_prune:
+                    next_prune = monotonic() + CHANGE_LOG_MAX_AGE_SECONDS / 2
+                    await adb.prune_change_log(CHANGE_LOG_MAX_AGE_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка синхронизации процессов: {e}")
+    
+    async def run(self):
+        """Обработка обновлений до получения None из очереди"""
+        loop = asyncio.get_running_loop()
+        db.enable_change_log(process_name())
+        # Лимит Telegram общий на бота: делим его между процессами
+        telegram_bucket.rate = Config.TELEGRAM_GLOBAL_RATE / self.count
+        
+        bot = create_bot()
+        dp = create_dispatcher()
+        election = LeaderElection(on_elected=lambda: start_leader_services(bot),
+                                  on_demoted=stop_leader_services)
+        workflow = {'election': election, 'worker_index': self.index}
+        runner = UpdateRunner(dp, bot, before_update=adb.sync_external_changes)
+        await dp.emit_startup(bot=bot, dispatcher=dp, **workflow)
+        sync_task = asyncio.create_task(self._sync(election))
+        self.ready.put(self.index)
+        logger.info(f"⚙️ Обработчик {self.index + 1}/{self.count} запущен (pid {os.getpid()})")
+        
+        try:
+            while True:
+                item = await loop.run_in_executor(self._reader, self.updates.get)
+                if item is None:
+                    break
+                chat_id, update = item
+                await runner.submit(update, chat_id)
+            
+            # Дорабатываем принятые обновления
+            await runner.drain(STOP_TIMEOUT_SECONDS)
+        finally:
+            sync_task.cancel()
+            await asyncio.gather(sync_task, return_exceptions=True)
+            await dp.emit_shutdown(bot=bot, dispatcher=dp, **workflow)
+            await bot.session.close()
+            self._reader.shutdown(wait=False)
+            logger.info(f"✅ Обработчик {self.index + 1} остановлен, обновлений: {runner.processed}")
+
+def worker_main(index: int, count: int, updates: multiprocessing.Queue, ready: multiprocessing.Queue):
+    """Точка входа процесса-обработчика"""
+    # Ctrl+C получает вся группа процессов: обработчики останавливает приемник
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(UpdateWorker(index, count, updates, ready).run())
+
+class ClusterReceiver:
+    """Приемник webhook: раздает обновления процессам-обработчикам по chat_id"""
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        # spawn: дочерний процесс не наследует открытые соединения SQLite
+        self._context = multiprocessing.get_context("spawn")
+        self.queues: List[multiprocessing.Queue] = [self._context.Queue() for _ in range(workers)]
+        self._ready = self._context.Queue()
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._stopping = False
+        self.received = 0
+    
+    def _spawn(self, index: int):
+        process = self._context.Process(target=worker_main, args=(index, self.workers, self.queues[index], self._ready),
+                                        name=f"bot-worker-{index}", daemon=False)
+        process.start()
+        self.processes[index] = process
+    
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Прием обновления от Telegram"""
+        if Config.WEBHOOK_SECRET and \
+                request.headers.get(SECRET_HEADER) != Config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = await request.json()
+        chat_id = update_chat_id(update)
+        self.queues[chat_id % self.workers].put((chat_id, update))
+        self.received += 1
+        return web.Response()
+    
+    async def _monitor(self):
+        """Перезапуск упавших обработчиков: их очередь сохраняется"""
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive() and not self._stopping:
+                    logger.error(f"❌ Обработчик {index + 1} завершился (код {process.exitcode}), перезапуск")
+                    self._spawn(index)
+    
+    async def run(self):
+        """Запуск обработчиков и приема webhook до сигнала остановки"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        
+        for index in range(self.workers):
+            self._spawn(index)
+        # Telegram начнет слать обновления сразу после регистрации webhook
+        try:
+            for _ in range(self.workers):
+                await loop.run_in_executor(None, self._ready.get, True, STARTUP_TIMEOUT_SECONDS)
+        except queue.Empty:
+            logger.warning("⚠️ Не все обработчики запустились, обновления подождут в очередях")
+        
+        app = web.Application()
+        app.router.add_post(Config.WEBHOOK_PATH, self.handle_update)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT).start()
+        monitor = asyncio.create_task(self._monitor())
+        
+        bot = create_bot()
+        try:
+            await bot.set_webhook(
+                url=Config.WEBHOOK_URL + Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET or None,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=create_dispatcher().resolve_used_update_types()
+            )
+            logger.info(f"🌐 Прием webhook на порту {Config.WEBHOOK_PORT}, обработчиков: {self.workers}")
+            await stop.wait()
+        finally:
+            logger.info("🛑 Остановка приема обновлений...")
+            self._stopping = True
+            monitor.cancel()
+            # Сначала перестаем принимать, затем обработчики дорабатывают свои очереди
+            await runner.cleanup()
+            for updates in self.queues:
+                updates.put(None)
+            for process in self.processes:
+                if process is None:
+                    continue
+                await loop.run_in_executor(None, process.join, STOP_TIMEOUT_SECONDS * 2)
+                if process.is_alive():
+                    logger.warning(f"⚠️ Обработчик {process.name} не остановился, завершаем принудительно")
+                    process.terminate()
+            await bot.session.close()
+            logger.info(f"✅ Прием остановлен, принято обновлений: {self.received}")
+
+def run_cluster():
+    """Запуск бота в режиме нескольких процессов"""
+    asyncio.run(ClusterReceiver(Config.CLUSTER_WORKERS).run())
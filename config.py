@@ -12,6 +12,47 @@ class Config:
     
     # Настройки базы данных
     DATABASE_PATH = os.getenv("DATABASE_PATH", "data/parking_bot.db")
+    ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH", "")  # холодный слой; по умолчанию рядом с БД
+    DB_READER_CONNECTIONS = int(os.getenv("DB_READER_CONNECTIONS", 4))  # соединений-читателей в пуле
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+    DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))  # на каждое соединение
+    DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 256 * 1024 * 1024))
+    CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", 10000))  # записей в кэше БД
+    CACHE_TTL = int(os.getenv("CACHE_TTL", 300))  # секунд
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))  # секунд
+    
+    # Журнал действий пишется пачками: не чаще раза в AUDIT_LOG_FLUSH_MS или по
+    # накоплении AUDIT_LOG_FLUSH_ENTRIES записей; при переполнении буфера
+    # теряются самые старые записи
+    AUDIT_LOG_BUFFER_SIZE = int(os.getenv("AUDIT_LOG_BUFFER_SIZE", 10000))
+    AUDIT_LOG_FLUSH_MS = int(os.getenv("AUDIT_LOG_FLUSH_MS", 500))
+    AUDIT_LOG_FLUSH_ENTRIES = int(os.getenv("AUDIT_LOG_FLUSH_ENTRIES", 200))
+    
+    # Состояния FSM хранятся в БД: изменения пишутся пачкой раз в FSM_FLUSH_MS,
+    # состояния без изменений дольше FSM_STATE_TTL_HOURS удаляются
+    FSM_FLUSH_MS = int(os.getenv("FSM_FLUSH_MS", 500))
+    FSM_STATE_TTL_HOURS = float(os.getenv("FSM_STATE_TTL_HOURS", 24))
+    FSM_CACHE_IDLE_SECONDS = float(os.getenv("FSM_CACHE_IDLE_SECONDS", 600))  # сколько держать в памяти
+    
+    # Получение обновлений: polling (getUpdates) или webhook (webhook.py)
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))  # запросов от Telegram одновременно
+    WEBHOOK_RECORD_PATH = os.getenv("WEBHOOK_RECORD_PATH", "")  # запись обновлений для replay.py
+    
+    # Режим нескольких процессов (cluster.py): CLUSTER_WORKERS > 0 включает прием
+    # обновлений через webhook и их распределение по процессам по chat_id
+    CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", 0))
+    CLUSTER_SYNC_MS = int(os.getenv("CLUSTER_SYNC_MS", 500))  # опрос изменений других процессов
+    CLUSTER_LEASE_SECONDS = float(os.getenv("CLUSTER_LEASE_SECONDS", 15))  # аренда ведущего процесса
+    UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", 32))  # обновлений в работе на процесс
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 256))  # принятых и еще не обработанных
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # внешний адрес, например https://bot.example.com
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")  # свой сервер Bot API или faketelegram.py
     
     # Настройки времени
     TIMEZONE = "Europe/Moscow"
@@ -24,6 +65,44 @@ class Config:
     MAX_BOOKING_DAYS = 30
     AUTO_CANCEL_HOURS = 24
     
+    # Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+    TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+    OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))  # одновременных отправок очереди
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+    
+    # Доставка уведомлений из БД
+    NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 500))
+    NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", 30))  # страховочный опрос
+    NOTIFICATION_DIGEST_WINDOW = float(os.getenv("NOTIFICATION_DIGEST_WINDOW", 1))  # секунд на сбор сводки
+    NOTIFICATION_DIGEST_ITEMS = int(os.getenv("NOTIFICATION_DIGEST_ITEMS", 10))  # уведомлений в тексте сводки
+    
+    # Рассылки идут медленнее общего лимита, оставляя запас для ответов пользователям
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))  # сообщений в секунду
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 10))  # одновременных запросов
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 50))  # получателей между сохранениями прогресса
+    BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", 5))
+    
+    # Резервные копии: онлайн-копия порциями страниц, сжатие gzip и ротация
+    BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", 24))  # 0 - только вручную
+    BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", 1000))  # страниц за шаг копирования
+    BACKUP_STEP_PAUSE_MS = int(os.getenv("BACKUP_STEP_PAUSE_MS", 5))  # пауза между шагами для записей
+    BACKUP_COMPRESSION_LEVEL = int(os.getenv("BACKUP_COMPRESSION_LEVEL", 6))
+    BACKUP_KEEP_LAST = int(os.getenv("BACKUP_KEEP_LAST", 7))  # последних копий
+    BACKUP_KEEP_DAYS = int(os.getenv("BACKUP_KEEP_DAYS", 30))  # дней, за которые хранится по копии в день
+    
+    # Хранение данных: сроки по таблицам (0 - хранить всегда), очистка порциями
+    RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", 24))  # 0 - только вручную
+    RETENTION_LOGS_DAYS = int(os.getenv("RETENTION_LOGS_DAYS", 90))
+    RETENTION_NOTIFICATIONS_DAYS = int(os.getenv("RETENTION_NOTIFICATIONS_DAYS", 90))  # прочитанные и доставленные
+    RETENTION_BOOKINGS_DAYS = int(os.getenv("RETENTION_BOOKINGS_DAYS", 90))  # завершенные переводятся в архив
+    RETENTION_SNAPSHOTS_DAYS = int(os.getenv("RETENTION_SNAPSHOTS_DAYS", 365))
+    RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", 500))  # строк в одной транзакции
+    RETENTION_PAUSE_MS = int(os.getenv("RETENTION_PAUSE_MS", 10))  # пауза между порциями
+    RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "")  # сжатый архив удаленных строк; пусто - без архива
+    RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", 256))  # страниц за шаг incremental_vacuum
+    RETENTION_VACUUM_MIN_PAGES = int(os.getenv("RETENTION_VACUUM_MIN_PAGES", 1000))  # свободных страниц для запуска
+    
     # Комиссия системы (%)
     COMMISSION_RATE = float(os.getenv("COMMISSION_RATE", 0))
     
@@ -33,7 +112,7 @@ class Config:
     
     # Пути к файлам
     LOGS_DIR = "logs"
-    BACKUP_DIR = "backups"
+    BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
     
     # Режим отладки
     DEBUG = os.getenv("DEBUG", "False").lower() == "true"
@@ -5,33 +5,676 @@
 import sqlite3
 import logging
 import json
-from datetime import datetime, timedelta
+import re
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Tuple
 import secrets
+from time import sleep
+
+from config import Config
+from cache import TTLCache, cached
+from auditlog import AuditLogBuffer
+from availability import AvailabilityIndex, BUSY_STATUSES, open_windows, subtract_busy
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Размер порции для массовых операций (лимит параметров SQLite)
+BULK_CHUNK_SIZE = 500
+
+# Счетчики статистики, которые поддерживают триггеры:
+# таблица -> (столбцы, при изменении которых пересчитывать, [(имя, вклад строки)]).
+# {r} заменяется на NEW/OLD в триггерах и на строку таблицы при полном пересчете
+STATS_COUNTERS = {
+    'users': (('is_admin', 'is_blocked'), [
+        ("'users_total'", "1"),
+        ("'users_admins'", "(COALESCE({r}.is_admin, 0) != 0)"),
+        ("'users_blocked'", "(COALESCE({r}.is_blocked, 0) != 0)"),
+    ]),
+    'parking_spots': (('is_active', 'price_per_hour', 'rating'), [
+        ("'spots_total'", "1"),
+        ("'spots_active'", "(COALESCE({r}.is_active, 0) != 0)"),
+        ("'spots_active_price_sum'", "(COALESCE({r}.is_active, 0) != 0) * {r}.price_per_hour"),
+        ("'spots_active_rating_sum'", "(COALESCE({r}.is_active, 0) != 0) * COALESCE({r}.rating, 0)"),
+    ]),
+    'bookings': (('status', 'payment_status', 'total_price'), [
+        ("'bookings_total'", "1"),
+        ("'bookings_status:' || COALESCE({r}.status, '')", "1"),
+        ("'bookings_price_sum'", "{r}.total_price"),
+        ("'bookings_paid'", "({r}.payment_status = 'paid')"),
+        ("'bookings_revenue'", "({r}.payment_status = 'paid') * {r}.total_price"),
+    ]),
+    'reports': (('status',), [
+        ("'reports_total'", "1"),
+        ("'reports_status:' || COALESCE({r}.status, '')", "1"),
+    ]),
+    'reviews': (('is_approved',), [
+        ("'reviews_total'", "1"),
+        ("'reviews_pending'", "(COALESCE({r}.is_approved, 1) = 0)"),
+    ]),
+}
+
+# Вклад брони в суточные и часовые агрегаты. Бронь учитывается в дне своего
+# создания, поэтому смена статуса или оплаты правит уже существующую строку.
+# Архивная бронь - завершенная, которую перевела в архив очистка старых данных
+ROLLUP_BOOKING_METRICS = [
+    ('bookings', "1"),
+    ('paid_bookings', "({r}.payment_status = 'paid')"),
+    ('completed', "({r}.status IN ('completed', 'archived'))"),
+    ('cancellations', "({r}.status = 'cancelled')"),
+    ('amount', "COALESCE({r}.total_price, 0)"),
+    ('revenue', "({r}.payment_status = 'paid') * COALESCE({r}.total_price, 0)"),
+    ('hours', "COALESCE({r}.total_hours, 0)"),
+]
+
+ROLLUP_DAY = ('day', "DATE({r}.created_at)")
+
+# Таблица агрегата -> столбцы первичного ключа
+ROLLUP_TABLES = {
+    'rollup_daily': ('day',),
+    'rollup_spot_daily': ('day', 'spot_id'),
+    'rollup_hourly': ('hour',),
+}
+
+# (таблица агрегата, исходная таблица, [(столбец, выражение ключа)], метрики)
+ROLLUPS = [
+    ('rollup_daily', 'users', [ROLLUP_DAY], [('new_users', "1")]),
+    ('rollup_daily', 'parking_spots', [ROLLUP_DAY], [('new_spots', "1")]),
+    ('rollup_daily', 'bookings', [ROLLUP_DAY], ROLLUP_BOOKING_METRICS),
+    ('rollup_spot_daily', 'bookings', [
+        ROLLUP_DAY,
+        ('spot_id', "{r}.spot_id"),
+        ('owner_id', "(SELECT owner_id FROM parking_spots WHERE id = {r}.spot_id)"),
+    ], ROLLUP_BOOKING_METRICS),
+    ('rollup_hourly', 'bookings', [('hour', "STRFTIME('%Y-%m-%d %H:00', {r}.created_at)")],
+     ROLLUP_BOOKING_METRICS),
+]
+
+# Столбцы броней, от которых зависят метрики агрегатов
+ROLLUP_BOOKING_COLUMNS = ('status', 'payment_status', 'total_price', 'total_hours')
+
+# Поля поиска пользователей: (столбец индекса, выражение по строке users).
+# Телефон индексируется только цифрами, чтобы находить его по фрагменту
+USER_SEARCH_COLUMNS = [
+    ('full_name', "{r}.full_name"),
+    ('username', "{r}.username"),
+    ('phone', "REPLACE(REPLACE(REPLACE(REPLACE(REPLACE({r}.phone, '+', ''), ' ', ''), "
+              "'-', ''), '(', ''), ')', '')"),
+    ('email', "{r}.email"),
+    ('car_plate', "{r}.car_plate"),
+]
+
+# Веса полей в ранжировании bm25, в порядке USER_SEARCH_COLUMNS
+USER_SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 3.0, 5.0)
+
+# Триграммный индекс не находит фрагменты короче трех символов
+USER_SEARCH_MIN_TERM = 3
+
+# Поля брони в журнале изменений: по ним другие процессы обновляют индекс
+# занятости и сроки планировщика
+CHANGE_BOOKING_FIELDS = ('id', 'spot_id', 'start_time', 'end_time', 'status',
+                         'payment_status', 'created_at')
+
+# Последний выданный id журнала изменений (AUTOINCREMENT): не уменьшается
+# при очистке журнала, даже если он опустел
+CHANGE_LOG_SEQUENCE = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)"
+
+# Условие занятых броней литералами: частичный индекс idx_bookings_busy
+# подходит только запросу с тем же условием, параметры его не включают
+BUSY_CONDITION = f"status IN ({', '.join(repr(status) for status in BUSY_STATUSES)})"
+
+# Холодный слой: архивные брони и их платежи лежат в отдельном файле БД,
+# подключенном к каждому соединению как схема cold. Временные представления
+# *_all объединяют слои для истории и статистики
+ARCHIVE_SCHEMA = "cold"
+ARCHIVE_VIEWS = {
+    'bookings': 'bookings_all',
+    'payments': 'payments_all',
+}
+ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS cold.idx_bookings_user_created ON bookings(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS cold.idx_bookings_spot_created ON bookings(spot_id, created_at)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS cold.idx_bookings_code ON bookings(booking_code)",
+    "CREATE INDEX IF NOT EXISTS cold.idx_payments_booking ON payments(booking_id)",
+    "CREATE INDEX IF NOT EXISTS cold.idx_payments_created ON payments(created_at)",
+]
+
+# Какие брони переносятся в холодный слой. На брони с отзывами, жалобами и
+# операциями баланса ссылаются внешние ключи, которые не видят другой файл,
+# поэтому они остаются в горячей таблице
+ARCHIVE_BOOKING_CONDITION = (
+    "status = 'archived' "
+    "AND NOT EXISTS (SELECT 1 FROM reviews WHERE reviews.booking_id = bookings.id) "
+    "AND NOT EXISTS (SELECT 1 FROM reports WHERE reports.booking_id = bookings.id) "
+    "AND NOT EXISTS (SELECT 1 FROM balance_transactions bt WHERE bt.booking_id = bookings.id "
+    "OR bt.payment_id IN (SELECT id FROM payments WHERE payments.booking_id = bookings.id))"
+)
+
+# Сколько перезапусков копирования из-за записей других процессов допустимо
+# до перехода на копию одним шагом
+BACKUP_MAX_RESTARTS = 3
+
+class BackupRestartedError(Exception):
+    """Копирование порциями не успевает за записями других процессов"""
+
+def user_search_terms(query: str) -> List[str]:
+    """Разбор поискового запроса на фрагменты для индекса"""
+    query = query.strip()
+    # Запрос из цифр и знаков телефона ищется как один фрагмент номера
+    if re.fullmatch(r'[\d\s+\-()]+', query):
+        digits = re.sub(r'\D', '', query)
+        if len(digits) == 11 and digits[0] in '78':
+            digits = digits[1:]  # 8 и +7 в начале номера равнозначны
+        return [digits] if digits else []
+    return [term.lstrip('@') for term in query.split() if term.lstrip('@')]
+
+def _counter_upsert(name: str, delta: str, source: str = "VALUES ({name}, {delta})") -> str:
+    """Оператор прибавления к счетчику статистики"""
+    return (f"INSERT INTO stats_counters (name, value) {source.format(name=name, delta=delta)} "
+            f"ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;")
+
+def _rollup_upsert(table: str, keys: List[Tuple[str, str]], metrics: List[Tuple[str, str]],
+                   row: str = "NEW", negate: bool = False, source: str = None) -> str:
+    """Оператор прибавления вклада строки к агрегату.
+    
+    С source вклад считается сразу по всем строкам исходной таблицы,
+    созданным не раньше параметра запроса (полный пересчет).
+    """
+    key_values = [expr.format(r=row) for _, expr in keys]
+    deltas = [expr.format(r=row) for _, expr in metrics]
+    if negate:
+        deltas = [f"-({delta})" for delta in deltas]
+    
+    if source is None:
+        values = f"VALUES ({', '.join(key_values + deltas)})"
+    else:
+        sums = [f"SUM({delta})" for delta in deltas]
+        group_by = ", ".join(str(i + 1) for i in range(len(keys)))
+        values = (f"SELECT {', '.join(key_values + sums)} FROM {source} AS {row} "
+                  f"WHERE {row}.created_at >= ? GROUP BY {group_by}")
+    
+    columns = [name for name, _ in keys] + [name for name, _ in metrics]
+    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name, _ in metrics)
+    return (f"INSERT INTO {table} ({', '.join(columns)}) {values} "
+            f"ON CONFLICT({', '.join(ROLLUP_TABLES[table])}) DO UPDATE SET {updates};")
+
+def both_tiers(select: str) -> str:
+    """Запрос по горячему и холодному слоям: {bookings} и {payments} в тексте
+    заменяются таблицами каждого слоя, части объединяются UNION ALL.
+    
+    Нужен для соединений: условие соединения не проталкивается внутрь
+    представления *_all, и оно читалось бы целиком. Параметры запроса
+    передаются дважды.
+    """
+    return " UNION ALL ".join(
+        select.format(bookings=f"{schema}.bookings", payments=f"{schema}.payments")
+        for schema in ("main", ARCHIVE_SCHEMA)
+    )
+
+def keyset_page(rows: List[Dict], before_id: Optional[int]) -> List[Dict]:
+    """Строки страницы новыми первыми: страница назад выбирается по возрастанию"""
+    return rows[::-1] if before_id is not None else rows
+
+# Горячие запросы для check_query_plans: название, текст и пример
+# параметров. Полный обход таблицы в плане любого из них - регрессия
+# индексов. Новый запрос к большой таблице добавляется сюда вместе
+# с индексом под него
+PLAN_TIME = "2024-01-01 00:00:00"
+HOT_QUERIES = [
+    ("create_booking: пересечение броней места",
+     f"SELECT 1 FROM bookings WHERE spot_id = ? AND {BUSY_CONDITION} AND start_time < ? AND end_time > ? LIMIT 1",
+     (1, PLAN_TIME, PLAN_TIME)),
+    ("индекс занятости",
+     f"SELECT id, spot_id, start_time, end_time FROM bookings WHERE {BUSY_CONDITION}",
+     ()),
+    ("get_user_spots: активные брони места",
+     "SELECT COUNT(*) FROM bookings b WHERE b.spot_id = ? AND b.status IN ('confirmed', 'active')",
+     (1,)),
+    ("get_active_bookings",
+     "SELECT b.* FROM bookings b JOIN parking_spots ps ON b.spot_id = ps.id JOIN users u ON b.user_id = u.id "
+     "WHERE b.status IN ('confirmed', 'active') AND b.end_time > ? ORDER BY b.start_time",
+     (PLAN_TIME,)),
+    ("get_booking_deadlines",
+     f"SELECT id FROM bookings WHERE {BUSY_CONDITION}",
+     ()),
+    ("get_booking по коду",
+     "SELECT * FROM bookings_all WHERE booking_code = ?",
+     ("P-1",)),
+    ("get_user_bookings: страница по курсору",
+     "SELECT b.* FROM bookings_all b WHERE b.user_id = ? AND (b.created_at, b.id) < (?, ?) "
+     "ORDER BY b.created_at DESC, b.id DESC LIMIT ?",
+     (1, PLAN_TIME, 1, 20)),
+    ("get_owner_bookings: страница по курсору",
+     both_tiers("SELECT b.* FROM {bookings} b JOIN parking_spots ps ON b.spot_id = ps.id "
+                "WHERE ps.owner_id = ? AND (b.created_at, b.id) < (?, ?)")
+     + " ORDER BY created_at DESC, id DESC LIMIT ?",
+     (1, PLAN_TIME, 1) * 2 + (20,)),
+    ("get_recent_payments",
+     both_tiers("SELECT p.* FROM {payments} p") + " ORDER BY created_at DESC LIMIT ?",
+     (5,)),
+    ("очистка: завершенные брони",
+     "SELECT id FROM bookings WHERE id > ? AND (status = 'completed' AND end_time < ?) ORDER BY id LIMIT ?",
+     (0, PLAN_TIME, 500)),
+    ("count_unread_notifications",
+     "SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = 0",
+     (1,)),
+    ("get_user_notifications: непрочитанные",
+     "SELECT * FROM notifications WHERE user_id = ? AND is_read = 0 ORDER BY created_at DESC, id DESC LIMIT ?",
+     (1, 20)),
+    ("get_undelivered_notifications",
+     "SELECT n.id FROM notifications n JOIN users u ON u.id = n.user_id "
+     "WHERE n.delivered_at IS NULL AND n.id > ? ORDER BY n.id LIMIT ?",
+     (0, 500)),
+    ("get_spot_reviews",
+     "SELECT r.* FROM reviews r JOIN users u ON r.reviewer_id = u.id "
+     "WHERE r.spot_id = ? AND r.is_approved = 1 ORDER BY r.created_at DESC LIMIT ?",
+     (1, 20)),
+    ("update_spot_rating",
+     "SELECT AVG(rating), COUNT(*) FROM reviews WHERE spot_id = ? AND is_approved = 1",
+     (1,)),
+    ("расписание места на день недели",
+     "SELECT a.* FROM availability a WHERE a.spot_id = ? AND a.day_of_week = ?",
+     (1, 0)),
+    ("активная админ-сессия",
+     "SELECT * FROM admin_sessions WHERE user_id = ? AND expires_at > ? ORDER BY created_at DESC LIMIT 1",
+     (1, PLAN_TIME)),
+    ("get_all_users: страница по курсору",
+     "SELECT * FROM users WHERE 1=1 AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+     (PLAN_TIME, 1, 20)),
+    ("get_reports по статусу",
+     "SELECT r.* FROM reports r WHERE 1=1 AND r.status = ? ORDER BY r.created_at DESC, r.id DESC LIMIT ?",
+     ("pending", 20)),
+    ("get_logs пользователя",
+     "SELECT * FROM logs WHERE 1=1 AND user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+     (1, 100)),
+]
+
+def booking_check_digit(digits: str) -> str:
+    """Контрольная цифра по алгоритму Луна"""
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if i % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+def make_booking_code(sequence: int, day: datetime = None) -> str:
+    """Код брони: дата, порядковый номер и контрольная цифра"""
+    digits = f"{(day or datetime.now()).strftime('%y%m%d')}{sequence:04d}"
+    return f"BK{digits}{booking_check_digit(digits)}"
+
+def reads(method):
+    """Выполнение метода на соединении-читателе из пула"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Вложенный вызов использует уже выбранное потоком соединение
+        if getattr(self._local, 'connection', None) is not None:
+            return method(self, *args, **kwargs)
+        with self.reader():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def writes(method):
+    """Выполнение метода в транзакции на единственном соединении-писателе"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class Database:
-    def __init__(self, db_path: str = "data/parking_bot.db"):
+    def __init__(self, db_path: str = "data/parking_bot.db", readers: int = None):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(exist_ok=True, parents=True)
-        self.connection = None
+        self.archive_path = Path(Config.ARCHIVE_DATABASE_PATH) if Config.ARCHIVE_DATABASE_PATH else \
+            self.db_path.with_name(f"{self.db_path.stem}_archive{self.db_path.suffix}")
+        self.readers_count = Config.DB_READER_CONNECTIONS if readers is None else readers
+        self._writer = None
+        self._readers = queue.Queue()
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self.availability = AvailabilityIndex()
+        self._booking_listeners: List[Callable[[Dict], Any]] = []
+        self._notification_listeners: List[Callable[[], Any]] = []
+        self.cache = TTLCache(Config.CACHE_MAX_SIZE, Config.CACHE_TTL, name="database")
+        # Журнал изменений для других процессов бота: включается enable_change_log()
+        self.change_origin: Optional[str] = None
+        self._change_cursor = 0
+        self._data_version = None
+        self.audit_log = AuditLogBuffer(self._write_logs, Config.AUDIT_LOG_BUFFER_SIZE,
+                                        Config.AUDIT_LOG_FLUSH_MS, Config.AUDIT_LOG_FLUSH_ENTRIES)
         self.connect()
         self.init_database()
-        
+    
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока: читатель внутри reader(), иначе писатель"""
+        return getattr(self._local, 'connection', None) or self._writer
+    
+    def _open_connection(self, read_only: bool = False) -> sqlite3.Connection:
+        """Открытие соединения с настройками производительности"""
+        connection = sqlite3.connect(
+            self.db_path,
+            timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            # Транзакциями писателя управляет transaction()
+            isolation_level=None
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute(f"PRAGMA busy_timeout = {Config.DB_BUSY_TIMEOUT_MS}")
+        connection.execute(f"PRAGMA synchronous = {Config.DB_SYNCHRONOUS}")
+        connection.execute(f"PRAGMA cache_size = -{Config.DB_CACHE_SIZE_KB}")
+        connection.execute(f"PRAGMA mmap_size = {Config.DB_MMAP_SIZE}")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        # Холодный слой; таблицы в нем создает init_database
+        connection.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(self.archive_path),))
+        for table, view in ARCHIVE_VIEWS.items():
+            connection.execute(f"CREATE TEMP VIEW IF NOT EXISTS {view} AS "
+                               f"SELECT * FROM main.{table} UNION ALL SELECT * FROM {ARCHIVE_SCHEMA}.{table}")
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+    
     def connect(self):
-        """Установка соединения с БД"""
+        """Установка соединений с БД: один писатель и пул читателей"""
         try:
-            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.connection.row_factory = sqlite3.Row
-            self.connection.execute("PRAGMA foreign_keys = ON")
-            logger.info(f"✅ База данных подключена: {self.db_path}")
+            self._close_connections()
+            
+            self._writer = self._open_connection()
+            # Для новой БД: свободные страницы возвращает retention.py порциями.
+            # Существующую БД переводит только VACUUM (enable_incremental_vacuum)
+            self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # WAL позволяет читателям работать параллельно с записью
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            
+            self._readers = queue.Queue()
+            for _ in range(self.readers_count):
+                self._readers.put(self._open_connection(read_only=True))
+            
+            logger.info(f"✅ База данных подключена: {self.db_path} "
+                       f"(читателей: {self.readers_count})")
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к БД: {e}")
             raise
-            
+    
+    @contextmanager
+    def reader(self):
+        """Соединение-читатель из пула на время блока"""
+        if not self.readers_count:
+            with self.writer() as connection:
+                yield connection
+            return
+        
+        connection = self._readers.get()
+        self._local.connection = connection
+        try:
+            yield connection
+        finally:
+            self._local.connection = None
+            self._readers.put(connection)
+    
+    @contextmanager
+    def writer(self):
+        """Соединение-писатель под блокировкой: записи выполняются по очереди"""
+        with self._write_lock:
+            previous = getattr(self._local, 'connection', None)
+            self._local.connection = self._writer
+            try:
+                yield self._writer
+            finally:
+                self._local.connection = previous
+    
+    @contextmanager
+    def transaction(self):
+        """Единица работы: вложенные вызовы присоединяются к внешней транзакции,
+        коммит выполняется один раз при выходе из самого внешнего блока"""
+        with self.writer() as connection:
+            depth = getattr(self._local, 'tx_depth', 0)
+            if depth == 0:
+                # IMMEDIATE сразу берет блокировку записи, в том числе
+                # от других процессов: проверка и вставка идут атомарно
+                connection.execute("BEGIN IMMEDIATE")
+                self._local.tx_failed = False
+                self._local.tx_callbacks = []
+            self._local.tx_depth = depth + 1
+            try:
+                yield connection
+            except Exception:
+                self._local.tx_failed = True
+                raise
+            finally:
+                self._local.tx_depth = depth
+                if depth == 0:
+                    callbacks, self._local.tx_callbacks = self._local.tx_callbacks, []
+                    if self._local.tx_failed:
+                        connection.execute("ROLLBACK")
+                    else:
+                        try:
+                            connection.execute("COMMIT")
+                        except Exception:
+                            connection.execute("ROLLBACK")
+                            raise
+                        for callback in callbacks:
+                            try:
+                                callback()
+                            except Exception as e:
+                                logger.error(f"Ошибка обработчика после коммита: {e}")
+    
+    def _rollback_only(self):
+        """Пометка текущей транзакции: при выходе она будет отменена"""
+        if getattr(self._local, 'tx_depth', 0):
+            self._local.tx_failed = True
+    
+    def after_commit(self, callback: Callable):
+        """Вызов функции после успешного коммита текущей транзакции"""
+        if getattr(self._local, 'tx_depth', 0):
+            self._local.tx_callbacks.append(callback)
+        else:
+            callback()
+    
+    def _ensure_availability(self):
+        """Загрузка индекса занятости при первом обращении"""
+        if self.availability.loaded:
+            return
+        # Под блокировкой писателя: ни один коммит не пройдет мимо индекса
+        with self.writer() as connection:
+            if self.availability.loaded:
+                return
+            cursor = connection.cursor()
+            cursor.execute(f'''
+                SELECT id, spot_id, start_time, end_time FROM bookings
+                WHERE {BUSY_CONDITION}
+            ''')
+            self.availability.load(cursor)
+    
+    def in_transaction(self) -> bool:
+        """Открыта ли транзакция записи в текущем потоке"""
+        return bool(getattr(self._local, 'tx_depth', 0))
+    
+    def invalidate(self, *tags: str):
+        """Сброс записей кэша по тегам сейчас и еще раз после коммита"""
+        self.cache.invalidate_tag(*tags)
+        self.after_commit(functools.partial(self.cache.invalidate_tag, *tags))
+        self._publish_change('tags', list(tags))
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        return self.cache.stats()
+    
+    def add_notification_listener(self, callback: Callable[[], Any]):
+        """Подписка на появление новых уведомлений (вызывается после коммита)"""
+        self._notification_listeners.append(callback)
+    
+    def remove_notification_listener(self, callback: Callable[[], Any]):
+        """Отписка от новых уведомлений"""
+        if callback in self._notification_listeners:
+            self._notification_listeners.remove(callback)
+    
+    def _notifications_added(self):
+        for listener in self._notification_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Ошибка подписчика уведомлений: {e}")
+    
+    def _track_notifications(self):
+        """Оповещение подписчиков о новых уведомлениях после коммита"""
+        self.after_commit(self._notifications_added)
+        self._publish_change('notifications')
+    
+    def add_booking_listener(self, callback: Callable[[Dict], Any]):
+        """Подписка на зафиксированные изменения бронирований"""
+        self._booking_listeners.append(callback)
+    
+    def remove_booking_listener(self, callback: Callable[[Dict], Any]):
+        """Отписка от изменений бронирований"""
+        if callback in self._booking_listeners:
+            self._booking_listeners.remove(callback)
+    
+    def _booking_changed(self, booking: Dict):
+        self.availability.apply(booking['id'], booking['spot_id'], booking['start_time'],
+                                booking['end_time'], booking['status'])
+        for listener in self._booking_listeners:
+            try:
+                listener(booking)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика бронирований: {e}")
+    
+    def _track_booking(self, booking: Dict):
+        """Обновление индекса занятости и подписчиков после коммита изменения брони"""
+        self.after_commit(functools.partial(self._booking_changed, booking))
+        self._publish_change('booking', {field: booking.get(field) for field in CHANGE_BOOKING_FIELDS})
+    
+    # ==================== НЕСКОЛЬКО ПРОЦЕССОВ ====================
+    
+    def enable_change_log(self, origin: str):
+        """Публикация своих изменений в change_log и чтение чужих (режим нескольких процессов)"""
+        with self.writer() as connection:
+            self._data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+            self._change_cursor = connection.execute(CHANGE_LOG_SEQUENCE).fetchone()[0]
+        self.change_origin = origin
+    
+    def _publish_change(self, kind: str, payload: Any = None):
+        """Запись изменения для других процессов в текущей транзакции"""
+        if self.change_origin is None:
+            return
+        with self.transaction() as connection:
+            connection.execute('''
+                INSERT INTO change_log (origin, kind, payload, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (self.change_origin, kind,
+                  None if payload is None else json.dumps(payload, default=str),
+                  datetime.now().timestamp()))
+    
+    def sync_external_changes(self) -> int:
+        """Применение изменений, зафиксированных другими процессами.
+        
+        PRAGMA data_version соединения-писателя меняется только от чужих
+        коммитов, поэтому без чужих изменений проверка не читает таблиц.
+        Возвращает количество примененных изменений.
+        """
+        if self.change_origin is None:
+            return 0
+        try:
+            with self.writer() as connection:
+                version = connection.execute("PRAGMA data_version").fetchone()[0]
+                if version == self._data_version:
+                    return 0
+                self._data_version = version
+                
+                # Коммиты без записей в журнал (аренда, FSM, журнал действий) тоже
+                # меняют data_version: новые изменения видны только по счетчику id
+                last = connection.execute(CHANGE_LOG_SEQUENCE).fetchone()[0]
+                if last == self._change_cursor:
+                    return 0
+                first = connection.execute("SELECT MIN(id) FROM change_log").fetchone()[0]
+                # Счетчик начат заново или новые записи удалены до чтения: изменения потеряны
+                missed = last < self._change_cursor or first is None or first > self._change_cursor + 1
+                rows = []
+                if last > self._change_cursor:
+                    rows = connection.execute('''
+                        SELECT kind, payload FROM change_log
+                        WHERE id > ? AND id <= ? AND origin != ?
+                        ORDER BY id
+                    ''', (self._change_cursor, last, self.change_origin)).fetchall()
+                self._change_cursor = last
+            
+            if missed:
+                # Сбрасываем все целиком: кэш и индекс загрузятся из БД заново
+                logger.warning("⚠️ Пропущены изменения других процессов, кэш и индекс занятости сброшены")
+                self.cache.clear()
+                self.availability.reset()
+            
+            notifications = False
+            for row in rows:
+                payload = json.loads(row['payload']) if row['payload'] else None
+                if row['kind'] == 'tags':
+                    self.cache.invalidate_tag(*payload)
+                elif row['kind'] == 'booking':
+                    self._booking_changed(payload)
+                elif row['kind'] == 'notifications':
+                    notifications = True
+            # Среди пропущенных могли быть новые уведомления
+            if notifications or missed:
+                self._notifications_added()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Ошибка чтения изменений других процессов: {e}")
+            return 0
+    
+    @writes
+    def prune_change_log(self, max_age_seconds: float) -> int:
+        """Удаление прочитанной части журнала изменений"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('DELETE FROM change_log WHERE created_at < ?',
+                           (datetime.now().timestamp() - max_age_seconds,))
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки журнала изменений: {e}")
+            return 0
+    
+    @writes
+    def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """Захват или продление аренды: удается, если аренда своя или истекла"""
+        try:
+            now = datetime.now().timestamp()
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            ''', (name, holder, now + ttl_seconds, now))
+            cursor.execute('SELECT holder FROM leases WHERE name = ?', (name,))
+            return cursor.fetchone()['holder'] == holder
+        except Exception as e:
+            logger.error(f"Ошибка захвата аренды {name}: {e}")
+            self._rollback_only()
+            return False
+    
+    @writes
+    def release_lease(self, name: str, holder: str) -> bool:
+        """Освобождение своей аренды"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Ошибка освобождения аренды {name}: {e}")
+            return False
+    
+    @writes
     def init_database(self):
         """Инициализация всех таблиц"""
         try:
@@ -169,6 +812,7 @@ class Database:
                     is_read BOOLEAN DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     read_at TIMESTAMP,
+                    delivered_at TIMESTAMP, -- отправлено в Telegram
                     data TEXT, -- JSON данные
                     FOREIGN KEY (user_id) REFERENCES users(id)
                 )
@@ -270,26 +914,144 @@ class Database:
                 )
             ''')
             
+            # Таблица рассылок: last_user_id - курсор по users.id, до которого
+            # получатели уже обработаны; с него рассылка продолжается после перезапуска
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    admin_chat_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    status TEXT DEFAULT 'running', -- running, completed, cancelled
+                    total INTEGER DEFAULT 0,
+                    last_user_id INTEGER DEFAULT 0,
+                    sent INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    blocked INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            
+            # Таблица состояний FSM: key - ключ aiogram, data - JSON,
+            # updated_at - unix-время изменения для удаления брошенных состояний
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            
+            # Журнал изменений для других процессов бота: по нему они
+            # сбрасывают кэш и обновляют индекс занятости
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS change_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT NOT NULL,
+                    kind TEXT NOT NULL, -- tags, booking, notifications
+                    payload TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            
+            # Аренды для выбора ведущего процесса
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            
+            # Таблица счетчиков для уникальных кодов
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sequences (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                INSERT OR IGNORE INTO sequences (name, value)
+                SELECT 'booking', COALESCE(MAX(id), 0) FROM bookings
+            ''')
+            
+            # Доставка уведомлений появилась позже таблицы: старые уведомления
+            # считаем доставленными, чтобы не разослать их разом
+            if self._add_column(cursor, 'notifications', 'delivered_at', 'TIMESTAMP'):
+                cursor.execute('UPDATE notifications SET delivered_at = created_at')
+            
             # Создаем индексы для производительности
             indexes = [
                 "CREATE INDEX IF NOT EXISTS idx_users_telegram ON users(telegram_id)",
                 "CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)",
+                "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
                 "CREATE INDEX IF NOT EXISTS idx_spots_owner ON parking_spots(owner_id)",
                 "CREATE INDEX IF NOT EXISTS idx_spots_active ON parking_spots(is_active)",
-                "CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings(user_id)",
-                "CREATE INDEX IF NOT EXISTS idx_bookings_spot ON bookings(spot_id)",
-                "CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status)",
-                "CREATE INDEX IF NOT EXISTS idx_bookings_dates ON bookings(start_time, end_time)",
-                "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, is_read)",
+                # Списки по курсору (created_at, id): id входит в индекс как rowid.
+                # Индексы по одному user_id / spot_id заменены составными
+                "DROP INDEX IF EXISTS idx_bookings_user",
+                "DROP INDEX IF EXISTS idx_bookings_spot",
+                "CREATE INDEX IF NOT EXISTS idx_bookings_user_created ON bookings(user_id, created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_bookings_spot_created ON bookings(spot_id, created_at)",
+                # Составные индексы под горячие запросы (HOT_QUERIES): одиночные
+                # по status и (start_time, end_time) заменены, второй ни один
+                # запрос не использовал
+                "DROP INDEX IF EXISTS idx_bookings_status",
+                "DROP INDEX IF EXISTS idx_bookings_dates",
+                "DROP INDEX IF EXISTS idx_notifications_user",
+                "DROP INDEX IF EXISTS idx_admin_sessions_user",
+                # Занятые брони: пересечение по месту, индекс занятости, сроки.
+                # Частичный - растет с числом текущих броней, а не с историей
+                f"CREATE INDEX IF NOT EXISTS idx_bookings_busy ON bookings(spot_id, start_time) WHERE {BUSY_CONDITION}",
+                # Активные брони мест в списке мест владельца
+                "CREATE INDEX IF NOT EXISTS idx_bookings_spot_status ON bookings(spot_id, status)",
+                # Брони по статусу и сроку: активные, очистка
+                "CREATE INDEX IF NOT EXISTS idx_bookings_status_end ON bookings(status, end_time)",
+                "CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at)",
+                # Частичные: непрочитанные уведомления и одобренные отзывы -
+                # малая доля строк, индекс не растет с историей
+                "CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user_id, created_at) WHERE is_read = 0",
+                "CREATE INDEX IF NOT EXISTS idx_reviews_spot_approved ON reviews(spot_id, created_at) WHERE is_approved = 1",
+                "CREATE INDEX IF NOT EXISTS idx_reviews_reviewer_approved ON reviews(reviewer_id, created_at) WHERE is_approved = 1",
+                "CREATE INDEX IF NOT EXISTS idx_availability_spot_day ON availability(spot_id, day_of_week, start_time)",
+                "CREATE INDEX IF NOT EXISTS idx_payments_created ON payments(created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_reports_created ON reports(created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_reports_status_created ON reports(status, created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_logs_created ON logs(created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_logs_user_created ON logs(user_id, created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_logs_action_created ON logs(action, created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_notifications_undelivered ON notifications(id) WHERE delivered_at IS NULL",
                 "CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status)",
-                "CREATE INDEX IF NOT EXISTS idx_admin_sessions_user ON admin_sessions(user_id)",
+                # Проверка внешних ключей при переносе броней в холодный слой
+                "CREATE INDEX IF NOT EXISTS idx_payments_booking ON payments(booking_id)",
+                "CREATE INDEX IF NOT EXISTS idx_reviews_booking ON reviews(booking_id)",
+                "CREATE INDEX IF NOT EXISTS idx_reports_booking ON reports(booking_id)",
+                "CREATE INDEX IF NOT EXISTS idx_balance_transactions_booking ON balance_transactions(booking_id)",
+                "CREATE INDEX IF NOT EXISTS idx_balance_transactions_payment ON balance_transactions(payment_id)",
+                "CREATE INDEX IF NOT EXISTS idx_admin_sessions_user_expires ON admin_sessions(user_id, expires_at)",
                 "CREATE INDEX IF NOT EXISTS idx_admin_sessions_token ON admin_sessions(session_token)",
                 "CREATE INDEX IF NOT EXISTS idx_admin_sessions_expires ON admin_sessions(expires_at)",
+                "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at)",
             ]
             
             for index in indexes:
                 cursor.execute(index)
             
+            # Холодный слой: до счетчиков, их пересчет читает оба слоя
+            self._create_archive_tables(cursor)
+            
+            # Счетчики статистики и их триггеры
+            self._create_stats_counters(cursor)
+            
+            # Суточные и часовые агрегаты
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_daily'")
+            rollups_exist = cursor.fetchone() is not None
+            rollups_outdated = self._create_rollups(cursor)
+            
+            # Полнотекстовый поиск пользователей
+            self._create_user_search(cursor)
+            
             # Вставляем дефолтные настройки
             default_settings = [
                 ('system_name', 'Parking Bot', 'Название системы'),
@@ -322,15 +1084,278 @@ class Database:
                 ''', (admin_telegram_id, 'Администратор системы', '+79990000000', 1))
                 logger.info("✅ Создан администратор по умолчанию")
             
-            self.connection.commit()
+            # Первый запуск со счетчиками: заполняем их по существующим данным
+            cursor.execute("SELECT 1 FROM stats_counters WHERE name = 'initialized'")
+            if not cursor.fetchone():
+                self.rebuild_stats_counters()
+            
+            # Агрегаты только что созданы или изменились их метрики: заполняем по истории
+            if not rollups_exist or rollups_outdated:
+                self.rebuild_rollups()
+            
             logger.info("✅ База данных инициализирована")
             
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации БД: {e}")
             raise
     
+    def _add_column(self, cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> bool:
+        """Добавление столбца в существующую таблицу; True, если столбец добавлен"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if any(row['name'] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"✅ Добавлен столбец {table}.{column}")
+        return True
+    
+    def _create_archive_tables(self, cursor: sqlite3.Cursor):
+        """Таблицы холодного слоя со столбцами горячих.
+        
+        Столбцы, добавленные в горячую таблицу миграцией, добавляются и в
+        холодную в том же порядке: представления *_all объединяют слои
+        через SELECT *. Внешних ключей и ограничений, кроме первичного
+        ключа, в холодном слое нет.
+        """
+        for table in ARCHIVE_VIEWS:
+            columns = cursor.execute(f"PRAGMA main.table_info({table})").fetchall()
+            existing = {row['name'] for row in cursor.execute(
+                f"PRAGMA {ARCHIVE_SCHEMA}.table_info({table})").fetchall()}
+            if not existing:
+                definitions = ", ".join("id INTEGER PRIMARY KEY" if row['name'] == 'id'
+                                        else f"{row['name']} {row['type']}" for row in columns)
+                cursor.execute(f"CREATE TABLE {ARCHIVE_SCHEMA}.{table} ({definitions})")
+                continue
+            for row in columns:
+                if row['name'] not in existing:
+                    cursor.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {row['name']} {row['type']}")
+        
+        for index in ARCHIVE_INDEXES:
+            cursor.execute(index)
+    
+    def _create_stats_counters(self, cursor: sqlite3.Cursor):
+        """Создание таблиц статистики и триггеров, поддерживающих счетчики"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Снимки счетчиков для истории
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data TEXT NOT NULL, -- JSON со значениями счетчиков
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        for table, (columns, counters) in STATS_COUNTERS.items():
+            added = "".join(_counter_upsert(name.format(r="NEW"), delta.format(r="NEW"))
+                            for name, delta in counters)
+            removed = "".join(_counter_upsert(name.format(r="OLD"), f"-({delta.format(r='OLD')})")
+                              for name, delta in counters)
+            
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_insert "
+                           f"AFTER INSERT ON {table} BEGIN {added} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_delete "
+                           f"AFTER DELETE ON {table} BEGIN {removed} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_update "
+                           f"AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN {removed}{added} END")
+    
+    @writes
+    def rebuild_stats_counters(self) -> bool:
+        """Полный пересчет счетчиков статистики по таблицам"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM stats_counters")
+            
+            for table, (_, counters) in STATS_COUNTERS.items():
+                for name, delta in counters:
+                    cursor.execute(_counter_upsert(
+                        name.format(r="t"), delta.format(r="t"),
+                        f"SELECT {{name}}, COALESCE(SUM({{delta}}), 0) FROM {ARCHIVE_VIEWS.get(table, table)} AS t "
+                        f"WHERE true GROUP BY 1"
+                    ))
+            
+            cursor.execute("INSERT INTO stats_counters (name, value) VALUES ('initialized', 1)")
+            logger.info("✅ Счетчики статистики пересчитаны")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчета счетчиков статистики: {e}")
+            self._rollback_only()
+            return False
+    
+    def _create_trigger(self, cursor: sqlite3.Cursor, name: str, definition: str) -> bool:
+        """Создание триггера; триггер с другим определением пересоздается (True)"""
+        sql = f"CREATE TRIGGER {name} {definition}"
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,))
+        row = cursor.fetchone()
+        if row and row['sql'] == sql:
+            return False
+        if row:
+            cursor.execute(f"DROP TRIGGER {name}")
+        cursor.execute(sql)
+        return row is not None
+    
+    def _create_rollups(self, cursor: sqlite3.Cursor) -> bool:
+        """Создание таблиц агрегатов и триггеров, обновляющих их при изменениях.
+        
+        Удаление строк из исходных таблиц агрегаты не уменьшает: они хранят
+        историю и после очистки старых данных. True - триггеры существовали
+        с другими метриками, агрегаты нужно пересчитать.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                day TEXT PRIMARY KEY, -- YYYY-MM-DD
+                new_users INTEGER NOT NULL DEFAULT 0,
+                new_spots INTEGER NOT NULL DEFAULT 0,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                paid_bookings INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                cancellations INTEGER NOT NULL DEFAULT 0,
+                amount REAL NOT NULL DEFAULT 0, -- сумма всех броней
+                revenue REAL NOT NULL DEFAULT 0, -- сумма оплаченных броней
+                hours REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_spot_daily (
+                day TEXT NOT NULL,
+                spot_id INTEGER NOT NULL,
+                owner_id INTEGER,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                paid_bookings INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                cancellations INTEGER NOT NULL DEFAULT 0,
+                amount REAL NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                hours REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, spot_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rollup_spot_daily_owner
+            ON rollup_spot_daily(owner_id, day)
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_hourly (
+                hour TEXT PRIMARY KEY, -- YYYY-MM-DD HH:00
+                bookings INTEGER NOT NULL DEFAULT 0,
+                paid_bookings INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                cancellations INTEGER NOT NULL DEFAULT 0,
+                amount REAL NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                hours REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Пользователи, создававшие брони в этот день (активные пользователи)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_daily_users (
+                day TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (day, user_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        outdated = False
+        for source in ('users', 'parking_spots', 'bookings'):
+            rollups = [(table, keys, metrics) for table, table_source, keys, metrics in ROLLUPS
+                       if table_source == source]
+            added = "".join(_rollup_upsert(table, keys, metrics) for table, keys, metrics in rollups)
+            if source == 'bookings':
+                added += ("INSERT OR IGNORE INTO rollup_daily_users (day, user_id) "
+                          "VALUES (DATE(NEW.created_at), NEW.user_id);")
+            outdated |= self._create_trigger(cursor, f"trg_rollup_{source}_insert",
+                                             f"AFTER INSERT ON {source} BEGIN {added} END")
+        
+        bookings_rollups = [(table, keys, metrics) for table, source, keys, metrics in ROLLUPS
+                            if source == 'bookings']
+        removed = "".join(_rollup_upsert(table, keys, metrics, row="OLD", negate=True)
+                          for table, keys, metrics in bookings_rollups)
+        added = "".join(_rollup_upsert(table, keys, metrics) for table, keys, metrics in bookings_rollups)
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in ROLLUP_BOOKING_COLUMNS)
+        outdated |= self._create_trigger(cursor, "trg_rollup_bookings_update",
+                                         f"AFTER UPDATE OF {', '.join(ROLLUP_BOOKING_COLUMNS)} ON bookings "
+                                         f"WHEN {changed} BEGIN {removed}{added} END")
+        return outdated
+    
+    def _create_user_search(self, cursor: sqlite3.Cursor):
+        """Триграммный FTS5-индекс пользователей и триггеры синхронизации.
+        
+        Без FTS5 или токенизатора trigram (SQLite < 3.34) поиск работает
+        через LIKE по таблице users.
+        """
+        self.user_search_fts = False
+        try:
+            columns = ", ".join(name for name, _ in USER_SEARCH_COLUMNS)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+            index_exists = cursor.fetchone() is not None
+            
+            # Индекс читает строки через представление: в нем телефон уже нормализован
+            source_columns = ", ".join(f"{expr.format(r='users')} AS {name}"
+                                       for name, expr in USER_SEARCH_COLUMNS)
+            cursor.execute(f"CREATE VIEW IF NOT EXISTS users_search_source AS "
+                           f"SELECT id, {source_columns} FROM users")
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+                           f"{columns}, content='users_search_source', content_rowid='id', "
+                           f"tokenize='trigram')")
+            
+            new_values = ", ".join(expr.format(r="NEW") for _, expr in USER_SEARCH_COLUMNS)
+            old_values = ", ".join(expr.format(r="OLD") for _, expr in USER_SEARCH_COLUMNS)
+            added = f"INSERT INTO users_fts (rowid, {columns}) VALUES (NEW.id, {new_values});"
+            removed = (f"INSERT INTO users_fts (users_fts, rowid, {columns}) "
+                       f"VALUES ('delete', OLD.id, {old_values});")
+            
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_users_fts_insert "
+                           f"AFTER INSERT ON users BEGIN {added} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_users_fts_delete "
+                           f"AFTER DELETE ON users BEGIN {removed} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_users_fts_update "
+                           f"AFTER UPDATE OF {columns} ON users BEGIN {removed}{added} END")
+            
+            if not index_exists:
+                cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+                logger.info("✅ Индекс поиска пользователей построен")
+            self.user_search_fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"⚠️ Полнотекстовый поиск недоступен, используется LIKE: {e}")
+    
+    @writes
+    def rebuild_rollups(self, since: date = None) -> bool:
+        """Пересчет агрегатов по истории: полностью или начиная с дня since"""
+        try:
+            cursor = self.connection.cursor()
+            since_value = since.isoformat() if since else ''
+            
+            for table, key_columns in ROLLUP_TABLES.items():
+                cursor.execute(f"DELETE FROM {table} WHERE {key_columns[0]} >= ?", (since_value,))
+            cursor.execute("DELETE FROM rollup_daily_users WHERE day >= ?", (since_value,))
+            
+            for table, source, keys, metrics in ROLLUPS:
+                cursor.execute(_rollup_upsert(table, keys, metrics, row="t",
+                                              source=ARCHIVE_VIEWS.get(source, source)),
+                               (since_value,))
+            cursor.execute('''
+                INSERT OR IGNORE INTO rollup_daily_users (day, user_id)
+                SELECT DISTINCT DATE(created_at), user_id FROM bookings_all
+                WHERE created_at >= ?
+            ''', (since_value,))
+            
+            logger.info(f"✅ Агрегаты статистики пересчитаны{f' с {since_value}' if since else ''}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчета агрегатов статистики: {e}")
+            self._rollback_only()
+            return False
+    
     # ==================== АДМИН СЕССИИ ====================
     
+    @writes
     def create_admin_session(self, user_id: int, expires_hours: int = 24) -> Optional[str]:
         """Создание админ-сессии для пользователя"""
         try:
@@ -352,13 +1377,13 @@ class Database:
                 VALUES (?, ?, ?)
             ''', (user_id, session_token, expires_at))
             
-            self.connection.commit()
             logger.info(f"✅ Создана админ-сессия для пользователя {user_id}")
             return session_token
         except Exception as e:
             logger.error(f"❌ Ошибка создания админ-сессии: {e}")
             return None
     
+    @reads
     def get_admin_session(self, user_id: int) -> Optional[Dict]:
         """Получение активной админ-сессии пользователя"""
         try:
@@ -375,6 +1400,7 @@ class Database:
             logger.error(f"❌ Ошибка получения админ-сессии: {e}")
             return None
     
+    @writes
     def delete_admin_session(self, user_id: int) -> bool:
         """Удаление админ-сессии пользователя"""
         try:
@@ -383,13 +1409,25 @@ class Database:
                 DELETE FROM admin_sessions WHERE user_id = ?
             ''', (user_id,))
             
-            self.connection.commit()
             logger.info(f"✅ Удалена админ-сессия пользователя {user_id}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка удаления админ-сессии: {e}")
             return False
     
+    @writes
+    def cleanup_expired_admin_sessions(self) -> int:
+        """Удаление истекших админ-сессий"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('DELETE FROM admin_sessions WHERE expires_at < ?', (datetime.now(),))
+            
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки админ-сессий: {e}")
+            return 0
+    
+    @reads
     def check_admin_password(self, password: str) -> bool:
         """Проверка пароля для входа в админку"""
         try:
@@ -409,6 +1447,7 @@ class Database:
             logger.error(f"❌ Ошибка проверки пароля админа: {e}")
             return False
     
+    @reads
     def is_admin_user(self, telegram_id: int) -> bool:
         """Проверка, является ли пользователь админом (постоянным или по сессии)"""
         try:
@@ -431,6 +1470,7 @@ class Database:
             logger.error(f"❌ Ошибка проверки прав админа: {e}")
             return False
     
+    @writes
     def set_admin_password(self, new_password: str) -> bool:
         """Установка нового пароля для админ-панели"""
         try:
@@ -439,6 +1479,7 @@ class Database:
             logger.error(f"❌ Ошибка установки пароля админа: {e}")
             return False
     
+    @reads
     def get_admin_session_info(self, telegram_id: int) -> Optional[Dict]:
         """Получение информации об админ-сессии пользователя"""
         try:
@@ -463,6 +1504,7 @@ class Database:
     
     # ==================== ПОЛЬЗОВАТЕЛИ ====================
     
+    @writes
     def register_user(self, telegram_id: int, full_name: str, phone: str, 
                      username: str = None, email: str = None) -> Optional[int]:
         """Регистрация нового пользователя"""
@@ -474,7 +1516,7 @@ class Database:
             ''', (telegram_id, username, full_name, phone, email, datetime.now()))
             
             user_id = cursor.lastrowid
-            self.connection.commit()
+            self.invalidate(f"user:{user_id}")
             
             # Логируем регистрацию
             self.add_log(user_id, "registration", f"Зарегистрирован пользователь: {full_name}")
@@ -491,20 +1533,28 @@ class Database:
                     UPDATE users SET username = ?, full_name = ?, phone = ?, 
                     email = ?, last_active = ? WHERE telegram_id = ?
                 ''', (username, full_name, phone, email, datetime.now(), telegram_id))
-                self.connection.commit()
                 
                 cursor.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
                 user = cursor.fetchone()
+                if user:
+                    self.invalidate(f"user:{user['id']}")
                 return user['id'] if user else None
             elif "UNIQUE constraint failed: users.phone" in str(e):
                 raise ValueError("Этот телефон уже зарегистрирован")
             else:
                 logger.error(f"Ошибка регистрации: {e}")
+                self._rollback_only()
                 return None
         except Exception as e:
             logger.error(f"Ошибка регистрации: {e}")
+            self._rollback_only()
             return None
     
+    @cached(ttl=Config.USER_CACHE_TTL,
+            key=lambda user_id=None, telegram_id=None, phone=None:
+                ('id', user_id) if user_id else ('tg', telegram_id) if telegram_id else ('phone', phone),
+            tags=lambda user, *args, **kwargs: (f"user:{user['id']}",))
+    @reads
     def get_user(self, user_id: int = None, telegram_id: int = None, phone: str = None) -> Optional[Dict]:
         """Получение данных пользователя"""
         try:
@@ -525,19 +1575,19 @@ class Database:
             logger.error(f"Ошибка получения пользователя: {e}")
             return None
     
+    @writes
     def update_user(self, user_id: int, **kwargs) -> bool:
         """Обновление данных пользователя"""
         try:
             cursor = self.connection.cursor()
             set_clause = ", ".join([f"{k} = ?" for k in kwargs.keys()])
-            values = list(kwargs.values()) + [user_id]
+            values = list(kwargs.values())
             
             cursor.execute(f'''
                 UPDATE users SET {set_clause}, last_active = ? 
                 WHERE id = ?
-            ''', values + [datetime.now()])
-            
-            self.connection.commit()
+            ''', values + [datetime.now(), user_id])
+            self.invalidate(f"user:{user_id}")
             
             if kwargs:
                 self.add_log(user_id, "profile_update", "Обновление профиля")
@@ -547,6 +1597,7 @@ class Database:
             logger.error(f"Ошибка обновления пользователя: {e}")
             return False
     
+    @writes
     def update_user_balance(self, user_id: int, amount: float, 
                           transaction_type: str, description: str = None,
                           booking_id: int = None, payment_id: int = None) -> bool:
@@ -558,6 +1609,7 @@ class Database:
             cursor.execute('''
                 UPDATE users SET balance = balance + ? WHERE id = ?
             ''', (amount, user_id))
+            self.invalidate(f"user:{user_id}")
             
             # Записываем транзакцию
             cursor.execute('''
@@ -566,13 +1618,14 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (user_id, amount, transaction_type, description, booking_id, payment_id))
             
-            self.connection.commit()
             self.add_log(user_id, "balance_update", f"{transaction_type}: {amount} руб.")
             return True
         except Exception as e:
             logger.error(f"Ошибка обновления баланса: {e}")
+            self._rollback_only()
             return False
     
+    @reads
     def get_user_balance(self, user_id: int) -> float:
         """Получение баланса пользователя"""
         try:
@@ -584,8 +1637,31 @@ class Database:
             logger.error(f"Ошибка получения баланса: {e}")
             return 0.0
     
+    def _keyset(self, table: str, after_id: Optional[int], before_id: Optional[int],
+                alias: str = "") -> Tuple[str, List, str]:
+        """Условие страницы по курсору: строки после after_id или перед before_id.
+        
+        Списки упорядочены по (created_at, id) от новых к старым; курсор -
+        id крайней строки соседней страницы. Его created_at читается по
+        первичному ключу, дальше страница идет по индексу с границы, и
+        глубокая страница стоит столько же, сколько первая. Возвращает
+        условие, его параметры и направление сортировки: страница назад
+        выбирается по возрастанию и разворачивается keyset_page. Если
+        строки-курсора уже нет (удалена очисткой), граница - только id.
+        """
+        anchor_id = after_id if after_id is not None else before_id
+        if anchor_id is None:
+            return "", [], "DESC"
+        sign, direction = ("<", "DESC") if after_id is not None else (">", "ASC")
+        row = self.connection.execute(f"SELECT created_at FROM {table} WHERE id = ?", (anchor_id,)).fetchone()
+        if row is None or row['created_at'] is None:
+            return f" AND {alias}id {sign} ?", [anchor_id], direction
+        return f" AND ({alias}created_at, {alias}id) {sign} (?, ?)", [row['created_at'], anchor_id], direction
+    
+    @reads
     def get_all_users(self, limit: int = 100, offset: int = 0, 
-                     is_admin: bool = None, is_blocked: bool = None) -> List[Dict]:
+                     is_admin: bool = None, is_blocked: bool = None,
+                     after_id: int = None, before_id: int = None) -> List[Dict]:
         """Получение списка всех пользователей (для админа)"""
         try:
             cursor = self.connection.cursor()
@@ -600,15 +1676,67 @@ class Database:
                 query += " AND is_blocked = ?"
                 params.append(1 if is_blocked else 0)
             
-            query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            keyset, keyset_params, direction = self._keyset('users', after_id, before_id)
+            query += keyset + f" ORDER BY created_at {direction}, id {direction} LIMIT ? OFFSET ?"
+            params.extend(keyset_params + [limit, offset])
             
             cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            return keyset_page([dict(row) for row in cursor.fetchall()], before_id)
         except Exception as e:
             logger.error(f"Ошибка получения пользователей: {e}")
             return []
     
+    @reads
+    def search_users(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Поиск пользователей по имени, username, фрагменту телефона, email и номеру авто.
+        
+        Результаты упорядочены по релевантности; каждое слово запроса
+        должно встретиться хотя бы в одном из полей.
+        """
+        try:
+            cursor = self.connection.cursor()
+            terms = user_search_terms(query)
+            long_terms = [term for term in terms if len(term) >= USER_SEARCH_MIN_TERM]
+            
+            if self.user_search_fts:
+                # Только короткие фрагменты: без индекса пришлось бы читать всю таблицу
+                if not long_terms:
+                    return []
+                match = " ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+                cursor.execute(f'''
+                    SELECT u.* FROM users_fts
+                    JOIN users u ON u.id = users_fts.rowid
+                    WHERE users_fts MATCH ?
+                    ORDER BY bm25(users_fts, {', '.join(map(str, USER_SEARCH_WEIGHTS))}), u.id
+                    LIMIT ? OFFSET ?
+                ''', (match, limit, offset))
+                return [dict(row) for row in cursor.fetchall()]
+            
+            if not terms:
+                return []
+            
+            # Без FTS5: перебор таблицы через LIKE
+            conditions = []
+            params = []
+            for term in terms:
+                pattern = f"%{term}%"
+                conditions.append("(" + " OR ".join(
+                    f"{expr.format(r='users')} LIKE ?" for _, expr in USER_SEARCH_COLUMNS
+                ) + ")")
+                params.extend([pattern] * len(USER_SEARCH_COLUMNS))
+            
+            cursor.execute(f'''
+                SELECT * FROM users
+                WHERE {' AND '.join(conditions)}
+                ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
+            ''', params + [limit, offset])
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка поиска пользователей: {e}")
+            return []
+    
+    @writes
     def set_admin(self, user_id: int, is_admin: bool = True) -> bool:
         """Назначение/снятие прав администратора"""
         try:
@@ -616,8 +1744,8 @@ class Database:
             cursor.execute('''
                 UPDATE users SET is_admin = ? WHERE id = ?
             ''', (is_admin, user_id))
+            self.invalidate(f"user:{user_id}")
             
-            self.connection.commit()
             self.add_log(user_id, "admin_change", 
                         f"Права админа {'выданы' if is_admin else 'сняты'}")
             return cursor.rowcount > 0
@@ -625,6 +1753,7 @@ class Database:
             logger.error(f"Ошибка изменения прав админа: {e}")
             return False
     
+    @writes
     def block_user(self, user_id: int, is_blocked: bool = True) -> bool:
         """Блокировка/разблокировка пользователя"""
         try:
@@ -632,8 +1761,8 @@ class Database:
             cursor.execute('''
                 UPDATE users SET is_blocked = ? WHERE id = ?
             ''', (is_blocked, user_id))
+            self.invalidate(f"user:{user_id}")
             
-            self.connection.commit()
             self.add_log(user_id, "block_change", 
                         f"Пользователь {'заблокирован' if is_blocked else 'разблокирован'}")
             return cursor.rowcount > 0
@@ -643,6 +1772,7 @@ class Database:
     
     # ==================== ПАРКОВОЧНЫЕ МЕСТА ====================
     
+    @writes
     def add_parking_spot(self, owner_id: int, spot_number: str, address: str,
                         price_per_hour: float, price_per_day: float,
                         description: str = None, latitude: float = None,
@@ -683,8 +1813,6 @@ class Database:
                     VALUES (?, ?, '00:00', '23:59')
                 ''', (spot_id, day))
             
-            self.connection.commit()
-            
             self.add_log(owner_id, "spot_added", f"Добавлено место #{spot_number}")
             self.notify_admins("Новое парковочное место", 
                              f"Пользователь добавил новое место: {address} (#{spot_number})")
@@ -699,6 +1827,8 @@ class Database:
             logger.error(f"Ошибка добавления места: {e}")
             return None
     
+    @cached(tags=lambda spot, spot_id: (f"spot:{spot_id}", f"user:{spot['owner_id']}"))
+    @reads
     def get_parking_spot(self, spot_id: int) -> Optional[Dict]:
         """Получение информации о месте"""
         try:
@@ -717,6 +1847,7 @@ class Database:
             logger.error(f"Ошибка получения места: {e}")
             return None
     
+    @reads
     def get_user_spots(self, owner_id: int) -> List[Dict]:
         """Получение мест пользователя"""
         try:
@@ -725,8 +1856,13 @@ class Database:
                 SELECT ps.*, 
                        (SELECT COUNT(*) FROM bookings b 
                         WHERE b.spot_id = ps.id AND b.status IN ('confirmed', 'active')) as active_bookings,
-                       (SELECT SUM(total_price) FROM bookings b 
-                        WHERE b.spot_id = ps.id AND b.payment_status = 'paid') as total_earnings
+                       (SELECT SUM(total_price) FROM (
+                            SELECT total_price FROM bookings b
+                            WHERE b.spot_id = ps.id AND b.payment_status = 'paid'
+                            UNION ALL
+                            SELECT total_price FROM cold.bookings b
+                            WHERE b.spot_id = ps.id AND b.payment_status = 'paid'
+                        )) as total_earnings
                 FROM parking_spots ps
                 WHERE ps.owner_id = ? AND ps.is_active = 1
                 ORDER BY ps.created_at DESC
@@ -737,15 +1873,18 @@ class Database:
             logger.error(f"Ошибка получения мест пользователя: {e}")
             return []
     
+    @reads
     def get_available_spots(self, start_time: datetime, end_time: datetime,
                           limit: int = 50) -> List[Dict]:
         """Поиск доступных мест на указанный период"""
         try:
+            self._ensure_availability()
             cursor = self.connection.cursor()
             
             # Получаем день недели для проверки расписания
             day_of_week = start_time.weekday()  # 0-6
             
+            # Расписание и исключения проверяет SQL, занятость - индекс броней
             cursor.execute('''
                 SELECT ps.*, u.full_name as owner_name, u.rating as owner_rating
                 FROM parking_spots ps
@@ -767,27 +1906,24 @@ class Database:
                     WHERE ae.exception_date = DATE(?)
                     AND ae.is_available = 0
                 )
-                AND ps.id NOT IN (
-                    -- Исключаем места с активными бронированиями в этот период
-                    SELECT b.spot_id FROM bookings b
-                    WHERE b.status IN ('confirmed', 'active')
-                    AND (
-                        (b.start_time <= ? AND b.end_time >= ?) OR
-                        (b.start_time <= ? AND b.end_time >= ?) OR
-                        (b.start_time >= ? AND b.end_time <= ?)
-                    )
-                )
                 ORDER BY ps.price_per_hour
-                LIMIT ?
-            ''', (day_of_week, start_time.time(), end_time.time(), 
-                  start_time.date(), start_time, start_time, end_time, end_time,
-                  start_time, end_time, limit))
-            
-            return [dict(row) for row in cursor.fetchall()]
+            ''', (day_of_week, start_time.strftime('%H:%M:%S'), end_time.strftime('%H:%M:%S'),
+                  start_time.date()))
+            
+            spots = []
+            for row in cursor:
+                if self.availability.is_free(row['id'], start_time, end_time):
+                    spots.append(dict(row))
+                    if len(spots) >= limit:
+                        break
+            cursor.close()
+            
+            return spots
         except Exception as e:
             logger.error(f"Ошибка поиска доступных мест: {e}")
             return []
     
+    @writes
     def update_spot(self, spot_id: int, **kwargs) -> bool:
         """Обновление информации о месте"""
         try:
@@ -798,8 +1934,7 @@ class Database:
             cursor.execute(f'''
                 UPDATE parking_spots SET {set_clause} WHERE id = ?
             ''', values)
-            
-            self.connection.commit()
+            self.invalidate(f"spot:{spot_id}")
             
             # Получаем владельца для логирования
             cursor.execute("SELECT owner_id FROM parking_spots WHERE id = ?", (spot_id,))
@@ -812,6 +1947,7 @@ class Database:
             logger.error(f"Ошибка обновления места: {e}")
             return False
     
+    @writes
     def delete_spot(self, spot_id: int) -> bool:
         """Удаление места (мягкое удаление)"""
         try:
@@ -819,8 +1955,7 @@ class Database:
             cursor.execute('''
                 UPDATE parking_spots SET is_active = 0 WHERE id = ?
             ''', (spot_id,))
-            
-            self.connection.commit()
+            self.invalidate(f"spot:{spot_id}")
             
             # Получаем владельца для логирования
             cursor.execute("SELECT owner_id FROM parking_spots WHERE id = ?", (spot_id,))
@@ -833,6 +1968,7 @@ class Database:
             logger.error(f"Ошибка удаления места: {e}")
             return False
     
+    @reads
     def get_spot_availability(self, spot_id: int, date: datetime = None) -> List[Dict]:
         """Получение расписания доступности места"""
         try:
@@ -867,6 +2003,60 @@ class Database:
             logger.error(f"Ошибка получения расписания: {e}")
             return []
     
+    @reads
+    def get_free_slots(self, spot_ids: List[int], start_date: datetime,
+                       days: int = 1) -> Dict[int, Dict[date, List[Dict[str, datetime]]]]:
+        """Свободные интервалы нескольких мест по дням с учетом расписания и исключений"""
+        try:
+            self._ensure_availability()
+            if not spot_ids:
+                return {}
+            
+            first_day = start_date.date() if isinstance(start_date, datetime) else start_date
+            dates = [first_day + timedelta(days=i) for i in range(days)]
+            range_start = datetime.combine(first_day, time.min)
+            range_end = range_start + timedelta(days=days)
+            
+            cursor = self.connection.cursor()
+            placeholders = ", ".join("?" * len(spot_ids))
+            
+            # Расписание и исключения всех мест - двумя запросами
+            cursor.execute(f'''
+                SELECT spot_id, day_of_week, start_time, end_time, is_available
+                FROM availability
+                WHERE spot_id IN ({placeholders})
+            ''', list(spot_ids))
+            schedules = {(row['spot_id'], row['day_of_week']): dict(row) for row in cursor.fetchall()}
+            
+            cursor.execute(f'''
+                SELECT spot_id, exception_date, is_available
+                FROM availability_exceptions
+                WHERE spot_id IN ({placeholders})
+                AND exception_date BETWEEN ? AND ?
+            ''', list(spot_ids) + [dates[0], dates[-1]])
+            exceptions = {(row['spot_id'], date.fromisoformat(row['exception_date'])): dict(row)
+                          for row in cursor.fetchall()}
+            
+            min_duration = timedelta(hours=Config.MIN_BOOKING_HOURS)
+            result = {}
+            for spot_id in spot_ids:
+                windows = []
+                for day in dates:
+                    windows.extend(open_windows(day, schedules.get((spot_id, day.weekday())),
+                                                exceptions.get((spot_id, day))))
+                
+                busy = self.availability.busy_intervals(spot_id, range_start, range_end)
+                days_slots = {day: [] for day in dates}
+                for slot_start, slot_end in subtract_busy(windows, busy, min_duration):
+                    days_slots[slot_start.date()].append({'start': slot_start, 'end': slot_end})
+                result[spot_id] = days_slots
+            
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка расчета свободных слотов: {e}")
+            return {}
+    
+    @writes
     def set_spot_availability(self, spot_id: int, day_of_week: int, 
                              start_time: str, end_time: str, is_available: bool = True) -> bool:
         """Установка расписания доступности"""
@@ -885,12 +2075,12 @@ class Database:
                 VALUES (?, ?, ?, ?, ?)
             ''', (spot_id, day_of_week, start_time, end_time, is_available))
             
-            self.connection.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка установки расписания: {e}")
             return False
     
+    @writes
     def add_availability_exception(self, spot_id: int, exception_date: datetime,
                                  is_available: bool = True, reason: str = None) -> bool:
         """Добавление исключения в расписание"""
@@ -903,7 +2093,6 @@ class Database:
                 VALUES (?, ?, ?, ?)
             ''', (spot_id, exception_date.date(), is_available, reason))
             
-            self.connection.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления исключения: {e}")
@@ -911,14 +2100,31 @@ class Database:
     
     # ==================== БРОНИРОВАНИЯ ====================
     
+    @writes
     def create_booking(self, user_id: int, spot_id: int, start_time: datetime,
                       end_time: datetime, notes: str = None) -> Optional[int]:
         """Создание бронирования"""
         try:
+            if end_time <= start_time:
+                raise ValueError("Время окончания должно быть позже начала")
+            
             # Проверяем доступность
             if not self.is_spot_available(spot_id, start_time, end_time):
                 raise ValueError("Место недоступно на выбранное время")
             
+            cursor = self.connection.cursor()
+            
+            # Повторная проверка по таблице внутри транзакции: индекс в памяти
+            # не видит брони, созданные другими процессами
+            cursor.execute(f'''
+                SELECT 1 FROM bookings
+                WHERE spot_id = ? AND {BUSY_CONDITION}
+                AND start_time < ? AND end_time > ?
+                LIMIT 1
+            ''', (spot_id, end_time, start_time))
+            if cursor.fetchone():
+                raise ValueError("Место недоступно на выбранное время")
+            
             # Получаем информацию о месте для расчета цены
             spot = self.get_parking_spot(spot_id)
             if not spot:
@@ -928,22 +2134,26 @@ class Database:
             duration_hours = (end_time - start_time).total_seconds() / 3600
             total_price = duration_hours * spot['price_per_hour']
             
-            # Генерируем код бронирования
-            import random
-            booking_code = f"BK{datetime.now().strftime('%y%m%d')}{random.randint(1000, 9999)}"
+            # Генерируем код бронирования из счетчика: коды не повторяются
+            cursor.execute('''
+                UPDATE sequences SET value = value + 1 WHERE name = 'booking'
+                RETURNING value
+            ''')
+            booking_code = make_booking_code(cursor.fetchone()['value'])
             
-            cursor = self.connection.cursor()
             cursor.execute('''
                 INSERT INTO bookings 
                 (booking_code, user_id, spot_id, start_time, end_time, 
                  total_hours, total_price, notes)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING id, status, payment_status, created_at
             ''', (booking_code, user_id, spot_id, start_time, end_time,
                  duration_hours, total_price, notes))
             
-            booking_id = cursor.lastrowid
-            
-            self.connection.commit()
+            created = dict(cursor.fetchone())
+            booking_id = created['id']
+            self._track_booking({**created, 'spot_id': spot_id,
+                                 'start_time': start_time, 'end_time': end_time})
             
             # Отправляем уведомления
             self.add_notification(
@@ -967,28 +2177,19 @@ class Database:
             return booking_id
         except Exception as e:
             logger.error(f"Ошибка создания бронирования: {e}")
+            self._rollback_only()
             return None
     
+    @reads
     def is_spot_available(self, spot_id: int, start_time: datetime, 
                          end_time: datetime) -> bool:
         """Проверка доступности места на указанный период"""
         try:
             cursor = self.connection.cursor()
             
-            # Проверяем активные бронирования
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM bookings
-                WHERE spot_id = ? 
-                AND status IN ('confirmed', 'active')
-                AND (
-                    (start_time < ? AND end_time > ?) OR
-                    (start_time < ? AND end_time > ?) OR
-                    (start_time >= ? AND end_time <= ?)
-                )
-            ''', (spot_id, end_time, start_time, end_time, start_time, start_time, end_time))
-            
-            overlapping_bookings = cursor.fetchone()['count']
-            if overlapping_bookings > 0:
+            # Проверяем активные бронирования по индексу занятости
+            self._ensure_availability()
+            if not self.availability.is_free(spot_id, start_time, end_time):
                 return False
             
             # Проверяем расписание
@@ -1000,7 +2201,7 @@ class Database:
                     (start_time IS NULL AND end_time IS NULL) OR
                     (TIME(?) >= start_time AND TIME(?) <= end_time)
                 )
-            ''', (spot_id, day_of_week, start_time.time(), end_time.time()))
+            ''', (spot_id, day_of_week, start_time.strftime('%H:%M:%S'), end_time.strftime('%H:%M:%S')))
             
             blocked_schedule = cursor.fetchone()['count']
             if blocked_schedule > 0:
@@ -1022,6 +2223,7 @@ class Database:
             logger.error(f"Ошибка проверки доступности: {e}")
             return False
     
+    @reads
     def get_booking(self, booking_id: int = None, booking_code: str = None) -> Optional[Dict]:
         """Получение информации о бронировании"""
         try:
@@ -1034,7 +2236,7 @@ class Database:
                            u1.full_name as user_name, u1.phone as user_phone,
                            u1.car_plate as user_car_plate,
                            u2.full_name as owner_name, u2.phone as owner_phone
-                    FROM bookings b
+                    FROM bookings_all b
                     JOIN parking_spots ps ON b.spot_id = ps.id
                     JOIN users u1 ON b.user_id = u1.id
                     JOIN users u2 ON ps.owner_id = u2.id
@@ -1047,7 +2249,7 @@ class Database:
                            u1.full_name as user_name, u1.phone as user_phone,
                            u1.car_plate as user_car_plate,
                            u2.full_name as owner_name, u2.phone as owner_phone
-                    FROM bookings b
+                    FROM bookings_all b
                     JOIN parking_spots ps ON b.spot_id = ps.id
                     JOIN users u1 ON b.user_id = u1.id
                     JOIN users u2 ON ps.owner_id = u2.id
@@ -1062,14 +2264,16 @@ class Database:
             logger.error(f"Ошибка получения бронирования: {e}")
             return None
     
+    @reads
     def get_user_bookings(self, user_id: int, status: str = None, 
-                         limit: int = 50, offset: int = 0) -> List[Dict]:
+                         limit: int = 50, offset: int = 0,
+                         after_id: int = None, before_id: int = None) -> List[Dict]:
         """Получение бронирований пользователя"""
         try:
             cursor = self.connection.cursor()
             query = '''
                 SELECT b.*, ps.spot_number, ps.address, u.full_name as owner_name
-                FROM bookings b
+                FROM bookings_all b
                 JOIN parking_spots ps ON b.spot_id = ps.id
                 JOIN users u ON ps.owner_id = u.id
                 WHERE b.user_id = ?
@@ -1080,24 +2284,27 @@ class Database:
                 query += " AND b.status = ?"
                 params.append(status)
             
-            query += " ORDER BY b.created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            keyset, keyset_params, direction = self._keyset('bookings_all', after_id, before_id, "b.")
+            query += keyset + f" ORDER BY b.created_at {direction}, b.id {direction} LIMIT ? OFFSET ?"
+            params.extend(keyset_params + [limit, offset])
             
             cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            return keyset_page([dict(row) for row in cursor.fetchall()], before_id)
         except Exception as e:
             logger.error(f"Ошибка получения бронирований: {e}")
             return []
     
+    @reads
     def get_owner_bookings(self, owner_id: int, status: str = None,
-                          limit: int = 50, offset: int = 0) -> List[Dict]:
+                          limit: int = 50, offset: int = 0,
+                          after_id: int = None, before_id: int = None) -> List[Dict]:
         """Получение бронирований владельца мест"""
         try:
             cursor = self.connection.cursor()
             query = '''
                 SELECT b.*, ps.spot_number, ps.address, u.full_name as user_name,
                        u.phone as user_phone, u.car_plate as user_car_plate
-                FROM bookings b
+                FROM {bookings} b
                 JOIN parking_spots ps ON b.spot_id = ps.id
                 JOIN users u ON b.user_id = u.id
                 WHERE ps.owner_id = ?
@@ -1108,15 +2315,21 @@ class Database:
                 query += " AND b.status = ?"
                 params.append(status)
             
-            query += " ORDER BY b.created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            keyset, keyset_params, direction = self._keyset('bookings_all', after_id, before_id, "b.")
+            query += keyset
+            params.extend(keyset_params)
+            
+            # Соединение с местами владельца идет отдельно по каждому слою
+            query = both_tiers(query) + f" ORDER BY created_at {direction}, id {direction} LIMIT ? OFFSET ?"
+            params = params * 2 + [limit, offset]
             
             cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            return keyset_page([dict(row) for row in cursor.fetchall()], before_id)
         except Exception as e:
             logger.error(f"Ошибка получения бронирований владельца: {e}")
             return []
     
+    @writes
     def update_booking_status(self, booking_id: int, status: str, 
                              cancelled_by: int = None, reason: str = None) -> bool:
         """Обновление статуса бронирования"""
@@ -1134,11 +2347,11 @@ class Database:
                     UPDATE bookings SET status = ? WHERE id = ?
                 ''', (status, booking_id))
             
-            self.connection.commit()
-            
             # Получаем информацию о бронировании для уведомлений
             booking = self.get_booking(booking_id)
             if booking:
+                self._track_booking(booking)
+                
                 # Уведомляем пользователя
                 self.add_notification(
                     booking['user_id'],
@@ -1164,8 +2377,10 @@ class Database:
             return True
         except Exception as e:
             logger.error(f"Ошибка обновления статуса брони: {e}")
+            self._rollback_only()
             return False
     
+    @writes
     def confirm_booking(self, booking_id: int, owner_id: int) -> bool:
         """Подтверждение бронирования владельцем"""
         try:
@@ -1186,6 +2401,7 @@ class Database:
             logger.error(f"Ошибка подтверждения брони: {e}")
             return False
     
+    @writes
     def complete_booking(self, booking_id: int) -> bool:
         """Завершение бронирования"""
         try:
@@ -1202,6 +2418,7 @@ class Database:
             logger.error(f"Ошибка завершения брони: {e}")
             return False
     
+    @reads
     def get_active_bookings(self) -> List[Dict]:
         """Получение активных бронирований"""
         try:
@@ -1222,8 +2439,150 @@ class Database:
             logger.error(f"Ошибка получения активных бронирований: {e}")
             return []
     
+    def _transition_bookings(self, booking_ids: List[int], status: str, condition: str,
+                             params: tuple = (), reason: str = None) -> List[Dict]:
+        """Смена статуса группы броней одним UPDATE ... RETURNING на порцию"""
+        cursor = self.connection.cursor()
+        changed = []
+        
+        # Порции не упираются в лимит параметров SQLite
+        for i in range(0, len(booking_ids), BULK_CHUNK_SIZE):
+            chunk = booking_ids[i:i + BULK_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(f'''
+                UPDATE bookings
+                SET status = ?,
+                    cancelled_at = CASE WHEN ? = 'cancelled' THEN ? ELSE cancelled_at END,
+                    cancellation_reason = COALESCE(?, cancellation_reason)
+                WHERE id IN ({placeholders}) AND {condition}
+                RETURNING id, booking_code, user_id, spot_id, start_time, end_time,
+                          status, payment_status, created_at
+            ''', (status, status, datetime.now(), reason, *chunk, *params))
+            changed.extend(dict(row) for row in cursor.fetchall())
+        
+        if not changed:
+            return []
+        
+        # Владельцы и номера мест - одним запросом
+        spot_ids = list({booking['spot_id'] for booking in changed})
+        placeholders = ", ".join("?" * len(spot_ids))
+        cursor.execute(f'''
+            SELECT id, owner_id, spot_number FROM parking_spots WHERE id IN ({placeholders})
+        ''', spot_ids)
+        spots = {row['id']: dict(row) for row in cursor.fetchall()}
+        for booking in changed:
+            spot = spots.get(booking['spot_id'], {})
+            booking['owner_id'] = spot.get('owner_id')
+            booking['spot_number'] = spot.get('spot_number')
+            self._track_booking(booking)
+        
+        return changed
+    
+    @writes
+    def complete_expired_bookings(self, booking_ids: List[int]) -> Optional[List[Dict]]:
+        """Массовое завершение активных броней с истекшим временем; None при ошибке"""
+        try:
+            completed = self._transition_bookings(
+                booking_ids, 'completed', "status = 'active' AND end_time <= ?", (datetime.now(),)
+            )
+            
+            notifications = []
+            logs = []
+            for booking in completed:
+                end_time = datetime.fromisoformat(booking['end_time']).strftime('%d.%m.%Y %H:%M')
+                notifications.append((
+                    booking['user_id'], "booking_completed", "Бронирование завершено",
+                    f"Ваше бронирование #{booking['booking_code']} завершено.\n"
+                    f"Место: #{booking['spot_number']}\n"
+                    f"Время истекло: {end_time}"
+                ))
+                if booking['owner_id']:
+                    notifications.append((
+                        booking['owner_id'], "booking_status_changed", "Статус бронирования изменен",
+                        f"Статус бронирования #{booking['booking_code']} изменен на: completed"
+                    ))
+                logs.append((booking['user_id'], "booking_status_changed",
+                             f"Бронирование #{booking['booking_code']}: completed"))
+            
+            self.add_notifications(notifications)
+            self.add_logs(logs)
+            return completed
+        except Exception as e:
+            logger.error(f"Ошибка массового завершения броней: {e}")
+            self._rollback_only()
+            return None
+    
+    @writes
+    def cancel_unpaid_bookings(self, booking_ids: List[int], reason: str) -> Optional[List[Dict]]:
+        """Массовая отмена неоплаченных заявок; None при ошибке"""
+        try:
+            cancelled = self._transition_bookings(
+                booking_ids, 'cancelled', "status = 'pending' AND payment_status = 'pending'",
+                reason=reason
+            )
+            
+            notifications = []
+            logs = []
+            for booking in cancelled:
+                notifications.append((
+                    booking['user_id'], "booking_cancelled", "Бронирование отменено",
+                    f"Ваше бронирование #{booking['booking_code']} отменено.\n"
+                    f"Причина: {reason}"
+                ))
+                if booking['owner_id']:
+                    notifications.append((
+                        booking['owner_id'], "booking_status_changed", "Статус бронирования изменен",
+                        f"Статус бронирования #{booking['booking_code']} изменен на: cancelled"
+                    ))
+                logs.append((booking['user_id'], "booking_status_changed",
+                             f"Бронирование #{booking['booking_code']}: cancelled"))
+            
+            self.add_notifications(notifications)
+            self.add_logs(logs)
+            return cancelled
+        except Exception as e:
+            logger.error(f"Ошибка массовой отмены броней: {e}")
+            self._rollback_only()
+            return None
+    
+    @reads
+    def get_booking_deadlines(self) -> List[Dict]:
+        """Незавершенные бронирования для восстановления очереди сроков"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f'''
+                SELECT id, spot_id, start_time, end_time, status, payment_status, created_at
+                FROM bookings
+                WHERE {BUSY_CONDITION}
+            ''')
+            
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения сроков бронирований: {e}")
+            return []
+    
+    @reads
+    def get_user_booking_totals(self, user_id: int) -> Dict[str, Any]:
+        """Количество бронирований пользователя и потраченная сумма"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                SELECT 
+                    COUNT(*) as total_bookings,
+                    SUM(total_price) as total_spent
+                FROM bookings_all
+                WHERE user_id = ?
+            ''', (user_id,))
+            
+            result = cursor.fetchone()
+            return dict(result) if result else {}
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики бронирований: {e}")
+            return {}
+    
     # ==================== ПЛАТЕЖИ ====================
     
+    @writes
     def create_payment(self, booking_id: int, user_id: int, amount: float,
                       payment_method: str, description: str = None) -> Optional[int]:
         """Создание платежа"""
@@ -1239,14 +2598,17 @@ class Database:
             ''', (booking_id, user_id, amount, payment_method, transaction_id, description))
             
             payment_id = cursor.lastrowid
-            self.connection.commit()
             
             # Обновляем статус бронирования
             cursor.execute('''
                 UPDATE bookings SET payment_status = 'paid' WHERE id = ?
             ''', (booking_id,))
             
-            self.connection.commit()
+            # Оплаченная заявка больше не отменяется по сроку: сообщаем
+            # планировщику и другим процессам
+            booking = self.get_booking(booking_id)
+            if booking:
+                self._track_booking(booking)
             
             self.add_log(user_id, "payment_created", 
                         f"Создан платеж {amount} руб. за бронирование #{booking_id}")
@@ -1256,17 +2618,19 @@ class Database:
             logger.error(f"Ошибка создания платежа: {e}")
             return None
     
+    @reads
     def get_payment(self, payment_id: int) -> Optional[Dict]:
         """Получение информации о платеже"""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('''
+            # Платеж лежит в том же слое, что и его бронь
+            cursor.execute(both_tiers('''
                 SELECT p.*, b.booking_code, u.full_name as user_name
-                FROM payments p
-                JOIN bookings b ON p.booking_id = b.id
+                FROM {payments} p
+                JOIN {bookings} b ON p.booking_id = b.id
                 JOIN users u ON p.user_id = u.id
                 WHERE p.id = ?
-            ''', (payment_id,))
+            '''), (payment_id, payment_id))
             
             payment = cursor.fetchone()
             return dict(payment) if payment else None
@@ -1274,6 +2638,7 @@ class Database:
             logger.error(f"Ошибка получения платежа: {e}")
             return None
     
+    @writes
     def update_payment_status(self, payment_id: int, status: str) -> bool:
         """Обновление статуса платежа"""
         try:
@@ -1290,14 +2655,53 @@ class Database:
                     UPDATE payments SET status = ? WHERE id = ?
                 ''', (status, payment_id))
             
-            self.connection.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка обновления статуса платежа: {e}")
             return False
     
+    @reads
+    def get_payment_stats(self, since: datetime) -> Dict[str, Any]:
+        """Сводная статистика платежей с указанной даты"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                SELECT 
+                    COUNT(*) as total_payments,
+                    SUM(amount) as total_amount,
+                    AVG(amount) as avg_amount,
+                    SUM(CASE WHEN status = 'completed' THEN amount ELSE 0 END) as completed_amount,
+                    SUM(CASE WHEN status = 'pending' THEN amount ELSE 0 END) as pending_amount
+                FROM payments_all
+                WHERE created_at > ?
+            ''', (since,))
+            
+            result = cursor.fetchone()
+            return dict(result) if result else {}
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики платежей: {e}")
+            return {}
+    
+    @reads
+    def get_recent_payments(self, limit: int = 5) -> List[Dict]:
+        """Последние платежи"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(both_tiers('''
+                SELECT p.*, u.full_name as user_name, b.booking_code
+                FROM {payments} p
+                LEFT JOIN users u ON p.user_id = u.id
+                LEFT JOIN {bookings} b ON p.booking_id = b.id
+            ''') + " ORDER BY created_at DESC LIMIT ?", (limit,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения платежей: {e}")
+            return []
+    
     # ==================== УВЕДОМЛЕНИЯ ====================
     
+    @writes
     def add_notification(self, user_id: int, notification_type: str,
                         title: str, message: str, data: dict = None) -> Optional[int]:
         """Добавление уведомления"""
@@ -1312,14 +2716,73 @@ class Database:
             ''', (user_id, notification_type, title, message, data_json))
             
             notification_id = cursor.lastrowid
-            self.connection.commit()
+            self._track_notifications()
             return notification_id
         except Exception as e:
             logger.error(f"Ошибка добавления уведомления: {e}")
             return None
     
+    @writes
+    def add_notifications(self, notifications: List[tuple]) -> int:
+        """Пакетное добавление уведомлений (user_id, type, title, message)"""
+        try:
+            if not notifications:
+                return 0
+            cursor = self.connection.cursor()
+            cursor.executemany('''
+                INSERT INTO notifications (user_id, notification_type, title, message)
+                VALUES (?, ?, ?, ?)
+            ''', notifications)
+            self._track_notifications()
+            return len(notifications)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного добавления уведомлений: {e}")
+            self._rollback_only()
+            return 0
+    
+    @reads
+    def get_undelivered_notifications(self, after_id: int = 0, limit: int = 500) -> List[Dict]:
+        """Недоставленные уведомления по возрастанию id (частичный индекс)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                SELECT n.id, n.user_id, n.notification_type, n.title, n.message,
+                       u.telegram_id
+                FROM notifications n
+                JOIN users u ON u.id = n.user_id
+                WHERE n.delivered_at IS NULL AND n.id > ?
+                ORDER BY n.id
+                LIMIT ?
+            ''', (after_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения недоставленных уведомлений: {e}")
+            return []
+    
+    @writes
+    def mark_notifications_delivered(self, notification_ids: List[int]) -> int:
+        """Пакетная отметка уведомлений доставленными"""
+        try:
+            cursor = self.connection.cursor()
+            updated = 0
+            for start in range(0, len(notification_ids), BULK_CHUNK_SIZE):
+                chunk = notification_ids[start:start + BULK_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(f'''
+                    UPDATE notifications SET delivered_at = CURRENT_TIMESTAMP
+                    WHERE id IN ({placeholders}) AND delivered_at IS NULL
+                ''', chunk)
+                updated += cursor.rowcount
+            return updated
+        except Exception as e:
+            logger.error(f"Ошибка отметки доставки уведомлений: {e}")
+            self._rollback_only()
+            return 0
+    
+    @reads
     def get_user_notifications(self, user_id: int, unread_only: bool = False,
-                              limit: int = 50, offset: int = 0) -> List[Dict]:
+                              limit: int = 50, offset: int = 0,
+                              after_id: int = None, before_id: int = None) -> List[Dict]:
         """Получение уведомлений пользователя"""
         try:
             cursor = self.connection.cursor()
@@ -1329,8 +2792,9 @@ class Database:
             if unread_only:
                 query += " AND is_read = 0"
             
-            query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            keyset, keyset_params, direction = self._keyset('notifications', after_id, before_id)
+            query += keyset + f" ORDER BY created_at {direction}, id {direction} LIMIT ? OFFSET ?"
+            params.extend(keyset_params + [limit, offset])
             
             cursor.execute(query, params)
             notifications = []
@@ -1344,11 +2808,12 @@ class Database:
                         notification['data'] = None
                 notifications.append(notification)
             
-            return notifications
+            return keyset_page(notifications, before_id)
         except Exception as e:
             logger.error(f"Ошибка получения уведомлений: {e}")
             return []
     
+    @writes
     def mark_notification_read(self, notification_id: int) -> bool:
         """Пометить уведомление как прочитанное"""
         try:
@@ -1359,12 +2824,12 @@ class Database:
                 WHERE id = ?
             ''', (datetime.now(), notification_id))
             
-            self.connection.commit()
             return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"Ошибка пометки уведомления: {e}")
             return False
     
+    @writes
     def mark_all_notifications_read(self, user_id: int) -> bool:
         """Пометить все уведомления как прочитанные"""
         try:
@@ -1375,12 +2840,12 @@ class Database:
                 WHERE user_id = ? AND is_read = 0
             ''', (datetime.now(), user_id))
             
-            self.connection.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка пометки уведомлений: {e}")
             return False
     
+    @reads
     def count_unread_notifications(self, user_id: int) -> int:
         """Подсчет непрочитанных уведомлений"""
         try:
@@ -1396,6 +2861,7 @@ class Database:
             logger.error(f"Ошибка подсчета уведомлений: {e}")
             return 0
     
+    @writes
     def notify_admins(self, title: str, message: str) -> int:
         """Отправка уведомления всем администраторам"""
         try:
@@ -1423,6 +2889,7 @@ class Database:
     
     # ==================== ОТЗЫВЫ ====================
     
+    @writes
     def add_review(self, booking_id: int, reviewer_id: int, spot_id: int,
                   rating: int, comment: str = None) -> Optional[int]:
         """Добавление отзыва"""
@@ -1473,12 +2940,12 @@ class Database:
             if spot:
                 self.update_user_rating(spot['owner_id'])
             
-            self.connection.commit()
             return review_id
         except Exception as e:
             logger.error(f"Ошибка добавления отзыва: {e}")
             return None
     
+    @reads
     def get_spot_reviews(self, spot_id: int, limit: int = 50, offset: int = 0) -> List[Dict]:
         """Получение отзывов о месте"""
         try:
@@ -1497,6 +2964,7 @@ class Database:
             logger.error(f"Ошибка получения отзывов: {e}")
             return []
     
+    @reads
     def get_user_reviews(self, user_id: int, as_reviewer: bool = True,
                         limit: int = 50, offset: int = 0) -> List[Dict]:
         """Получение отзывов пользователя"""
@@ -1528,6 +2996,7 @@ class Database:
             logger.error(f"Ошибка получения отзывов пользователя: {e}")
             return []
     
+    @writes
     def update_spot_rating(self, spot_id: int) -> bool:
         """Обновление рейтинга места"""
         try:
@@ -1545,14 +3014,14 @@ class Database:
                     SET rating = ?, rating_count = ?
                     WHERE id = ?
                 ''', (result['avg_rating'], result['count'], spot_id))
+                self.invalidate(f"spot:{spot_id}")
                 
-                self.connection.commit()
-            
             return True
         except Exception as e:
             logger.error(f"Ошибка обновления рейтинга места: {e}")
             return False
     
+    @writes
     def update_user_rating(self, user_id: int) -> bool:
         """Обновление рейтинга пользователя"""
         try:
@@ -1572,9 +3041,8 @@ class Database:
                     SET rating = ?
                     WHERE id = ?
                 ''', (result['avg_rating'], user_id))
+                self.invalidate(f"user:{user_id}")
                 
-                self.connection.commit()
-            
             return True
         except Exception as e:
             logger.error(f"Ошибка обновления рейтинга пользователя: {e}")
@@ -1582,6 +3050,7 @@ class Database:
     
     # ==================== ЖАЛОБЫ ====================
     
+    @writes
     def add_report(self, reporter_id: int, report_type: str, description: str,
                   reported_user_id: int = None, reported_spot_id: int = None,
                   booking_id: int = None) -> Optional[int]:
@@ -1597,7 +3066,6 @@ class Database:
                  booking_id, report_type, description))
             
             report_id = cursor.lastrowid
-            self.connection.commit()
             
             # Уведомляем админов
             self.notify_admins(
@@ -1612,7 +3080,9 @@ class Database:
             logger.error(f"Ошибка добавления жалобы: {e}")
             return None
     
-    def get_reports(self, status: str = None, limit: int = 50, offset: int = 0) -> List[Dict]:
+    @reads
+    def get_reports(self, status: str = None, limit: int = 50, offset: int = 0,
+                    after_id: int = None, before_id: int = None) -> List[Dict]:
         """Получение списка жалоб (для админа)"""
         try:
             cursor = self.connection.cursor()
@@ -1633,15 +3103,17 @@ class Database:
                 query += " AND r.status = ?"
                 params.append(status)
             
-            query += " ORDER BY r.created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            keyset, keyset_params, direction = self._keyset('reports', after_id, before_id, "r.")
+            query += keyset + f" ORDER BY r.created_at {direction}, r.id {direction} LIMIT ? OFFSET ?"
+            params.extend(keyset_params + [limit, offset])
             
             cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            return keyset_page([dict(row) for row in cursor.fetchall()], before_id)
         except Exception as e:
             logger.error(f"Ошибка получения жалоб: {e}")
             return []
     
+    @writes
     def update_report_status(self, report_id: int, status: str, 
                             admin_notes: str = None, resolved_by: int = None) -> bool:
         """Обновление статуса жалобы"""
@@ -1661,8 +3133,6 @@ class Database:
                     WHERE id = ?
                 ''', (status, admin_notes, report_id))
             
-            self.connection.commit()
-            
             # Уведомляем автора жалобы
             cursor.execute('SELECT reporter_id FROM reports WHERE id = ?', (report_id,))
             report = cursor.fetchone()
@@ -1681,6 +3151,8 @@ class Database:
     
     # ==================== НАСТРОЙКИ СИСТЕМЫ ====================
     
+    @cached(tags=lambda value, *args, **kwargs: ("settings",))
+    @reads
     def get_setting(self, key: str, default: Any = None) -> Any:
         """Получение значения настройки"""
         try:
@@ -1695,6 +3167,7 @@ class Database:
             logger.error(f"Ошибка получения настройки: {e}")
             return default
     
+    @writes
     def set_setting(self, key: str, value: Any) -> bool:
         """Установка значения настройки"""
         try:
@@ -1703,13 +3176,14 @@ class Database:
                 INSERT OR REPLACE INTO system_settings (key, value, updated_at)
                 VALUES (?, ?, ?)
             ''', (key, str(value), datetime.now()))
+            self.invalidate("settings")
             
-            self.connection.commit()
             return True
         except Exception as e:
             logger.error(f"Ошибка установки настройки: {e}")
             return False
     
+    @reads
     def get_all_settings(self) -> Dict[str, str]:
         """Получение всех настроек"""
         try:
@@ -1725,26 +3199,54 @@ class Database:
     
     def add_log(self, user_id: int = None, action: str = "", 
                details: str = None, ip_address: str = None,
-               user_agent: str = None) -> Optional[int]:
-        """Добавление записи в лог"""
+               user_agent: str = None) -> bool:
+        """Добавление записи в лог (через буфер, запись пачкой)"""
+        return self.add_logs([(user_id, action, details, ip_address, user_agent)]) > 0
+    
+    def add_logs(self, entries: List[tuple]) -> int:
+        """Пакетное добавление записей в лог (user_id, action, details[, ip_address, user_agent]).
+        
+        Записи попадают в буфер audit_log и пишутся в таблицу фоновым потоком.
+        Записи, сделанные внутри транзакции, буферизуются только после ее
+        коммита: откат отменяет и их.
+        """
+        try:
+            if not entries:
+                return 0
+            created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            rows = [(tuple(entry) + (None, None))[:5] + (created_at,) for entry in entries]
+            self.after_commit(lambda: self.audit_log.extend(rows))
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного добавления логов: {e}")
+            return 0
+    
+    @writes
+    def _write_logs(self, rows: List[tuple]) -> bool:
+        """Запись пачки из буфера журнала одним executemany"""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('''
-                INSERT INTO logs (user_id, action, details, ip_address, user_agent)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, action, details, ip_address, user_agent))
-            
-            log_id = cursor.lastrowid
-            self.connection.commit()
-            return log_id
+            cursor.executemany('''
+                INSERT INTO logs (user_id, action, details, ip_address, user_agent, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            return True
         except Exception as e:
-            logger.error(f"Ошибка добавления лога: {e}")
-            return None
+            logger.error(f"Ошибка записи журнала ({len(rows)} записей): {e}")
+            self._rollback_only()
+            return False
+    
+    def flush_logs(self) -> int:
+        """Немедленная запись буфера журнала"""
+        return self.audit_log.flush()
     
+    @reads
     def get_logs(self, user_id: int = None, action: str = None,
-                limit: int = 100, offset: int = 0) -> List[Dict]:
+                limit: int = 100, offset: int = 0,
+                after_id: int = None, before_id: int = None) -> List[Dict]:
         """Получение логов"""
         try:
+            self.flush_logs()
             cursor = self.connection.cursor()
             query = "SELECT * FROM logs WHERE 1=1"
             params = []
@@ -1757,83 +3259,218 @@ class Database:
                 query += " AND action = ?"
                 params.append(action)
             
-            query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            keyset, keyset_params, direction = self._keyset('logs', after_id, before_id)
+            query += keyset + f" ORDER BY created_at {direction}, id {direction} LIMIT ? OFFSET ?"
+            params.extend(keyset_params + [limit, offset])
             
             cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+            return keyset_page([dict(row) for row in cursor.fetchall()], before_id)
         except Exception as e:
             logger.error(f"Ошибка получения логов: {e}")
             return []
     
+    # ==================== РАССЫЛКИ ====================
+    
+    def count_broadcast_recipients(self) -> int:
+        """Количество получателей рассылки (незаблокированные пользователи)"""
+        stats = self.get_system_stats()
+        return stats['total_users'] - stats['blocked_users']
+    
+    @writes
+    def create_broadcast(self, admin_chat_id: int, text: str) -> Optional[int]:
+        """Создание рассылки"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                INSERT INTO broadcasts (admin_chat_id, text, total)
+                VALUES (?, ?, ?)
+            ''', (admin_chat_id, text, self.count_broadcast_recipients()))
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Ошибка создания рассылки: {e}")
+            return None
+    
+    @reads
+    def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        """Получение рассылки"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения рассылки: {e}")
+            return None
+    
+    @reads
+    def get_running_broadcasts(self) -> List[Dict]:
+        """Незавершенные рассылки"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения незавершенных рассылок: {e}")
+            return []
+    
+    @reads
+    def get_broadcast_recipients(self, after_user_id: int = 0, limit: int = 100) -> List[Dict]:
+        """Следующая порция получателей рассылки по возрастанию id (keyset)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                SELECT id, telegram_id FROM users
+                WHERE id > ? AND is_blocked = 0
+                ORDER BY id
+                LIMIT ?
+            ''', (after_user_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения получателей рассылки: {e}")
+            return []
+    
+    @writes
+    def save_broadcast_progress(self, broadcast_id: int, last_user_id: int,
+                                sent: int = 0, failed: int = 0, blocked: int = 0) -> bool:
+        """Сохранение курсора рассылки и прибавка счетчиков; False - рассылка остановлена"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                UPDATE broadcasts
+                SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?
+                WHERE id = ? AND status = 'running'
+            ''', (last_user_id, sent, failed, blocked, broadcast_id))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Ошибка сохранения прогресса рассылки: {e}")
+            return False
+    
+    @writes
+    def finish_broadcast(self, broadcast_id: int, status: str = 'completed') -> bool:
+        """Завершение или отмена рассылки"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (status, broadcast_id))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Ошибка завершения рассылки: {e}")
+            return False
+    
+    # ==================== СОСТОЯНИЯ FSM ====================
+    
+    @reads
+    def get_fsm_record(self, key: str) -> Optional[Dict]:
+        """Сохраненное состояние FSM по ключу"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния FSM: {e}")
+            return None
+    
+    @writes
+    def save_fsm_records(self, rows: List[tuple], deleted: List[str] = None) -> bool:
+        """Пакетное сохранение состояний FSM (key, state, data, updated_at) и удаление пустых"""
+        try:
+            cursor = self.connection.cursor()
+            if rows:
+                cursor.executemany('''
+                    INSERT INTO fsm_states (key, state, data, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                ''', rows)
+            if deleted:
+                cursor.executemany('DELETE FROM fsm_states WHERE key = ?', [(key,) for key in deleted])
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояний FSM: {e}")
+            self._rollback_only()
+            return False
+    
+    @writes
+    def delete_expired_fsm_records(self, updated_before: float) -> int:
+        """Удаление состояний FSM, не менявшихся с updated_before (unix-время)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('DELETE FROM fsm_states WHERE updated_at < ?', (updated_before,))
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка удаления брошенных состояний FSM: {e}")
+            return 0
+    
     # ==================== СТАТИСТИКА ====================
     
+    @reads
     def get_statistics(self, period_days: int = 30) -> Dict[str, Any]:
-        """Получение статистики системы"""
+        """Получение статистики системы за период из суточных агрегатов"""
         stats = {}
-        cutoff_date = datetime.now() - timedelta(days=period_days)
+        cutoff_day = (date.today() - timedelta(days=period_days)).isoformat()
         
         try:
             cursor = self.connection.cursor()
             
             # Общая статистика
-            cursor.execute('SELECT COUNT(*) as count FROM users WHERE created_at > ?', (cutoff_date,))
-            stats['new_users'] = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) as count FROM parking_spots WHERE created_at > ?', (cutoff_date,))
-            stats['new_spots'] = cursor.fetchone()['count']
-            
-            cursor.execute('SELECT COUNT(*) as count FROM bookings WHERE created_at > ?', (cutoff_date,))
-            stats['new_bookings'] = cursor.fetchone()['count']
-            
-            cursor.execute('''
-                SELECT COUNT(*) as count, SUM(total_price) as revenue 
-                FROM bookings 
-                WHERE created_at > ? AND payment_status = 'paid'
-            ''', (cutoff_date,))
-            bookings_data = cursor.fetchone()
-            stats['paid_bookings'] = bookings_data['count']
-            stats['revenue'] = bookings_data['revenue'] or 0
-            
-            # Статистика по статусам бронирований
             cursor.execute('''
-                SELECT status, COUNT(*) as count 
-                FROM bookings 
-                WHERE created_at > ?
-                GROUP BY status
-            ''', (cutoff_date,))
-            stats['booking_statuses'] = {row['status']: row['count'] for row in cursor.fetchall()}
+                SELECT COALESCE(SUM(new_users), 0) as new_users,
+                       COALESCE(SUM(new_spots), 0) as new_spots,
+                       COALESCE(SUM(bookings), 0) as bookings,
+                       COALESCE(SUM(paid_bookings), 0) as paid_bookings,
+                       COALESCE(SUM(completed), 0) as completed,
+                       COALESCE(SUM(cancellations), 0) as cancellations,
+                       COALESCE(SUM(revenue), 0) as revenue,
+                       COALESCE(SUM(hours), 0) as hours
+                FROM rollup_daily
+                WHERE day > ?
+            ''', (cutoff_day,))
+            totals = cursor.fetchone()
+            stats['new_users'] = totals['new_users']
+            stats['new_spots'] = totals['new_spots']
+            stats['new_bookings'] = totals['bookings']
+            stats['paid_bookings'] = totals['paid_bookings']
+            stats['revenue'] = totals['revenue']
+            stats['avg_amount'] = totals['revenue'] / totals['paid_bookings'] if totals['paid_bookings'] else 0
+            stats['total_hours_booked'] = round(totals['hours'], 1)
+            stats['avg_duration'] = totals['hours'] / totals['bookings'] if totals['bookings'] else 0
+            
+            # Итоговые статусы; промежуточные (pending, active) меняются слишком часто
+            stats['booking_statuses'] = {
+                'completed': totals['completed'],
+                'cancelled': totals['cancellations']
+            }
             
             # Активные пользователи
             cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) as count 
-                FROM bookings 
-                WHERE created_at > ?
-            ''', (cutoff_date,))
+                SELECT COUNT(DISTINCT user_id) as count
+                FROM rollup_daily_users
+                WHERE day > ?
+            ''', (cutoff_day,))
             stats['active_users'] = cursor.fetchone()['count']
             
             # Популярные места
             cursor.execute('''
-                SELECT ps.spot_number, COUNT(b.id) as bookings_count
-                FROM bookings b
-                JOIN parking_spots ps ON b.spot_id = ps.id
-                WHERE b.created_at > ?
-                GROUP BY b.spot_id
+                SELECT ps.spot_number, SUM(r.bookings) as bookings_count
+                FROM rollup_spot_daily r
+                JOIN parking_spots ps ON r.spot_id = ps.id
+                WHERE r.day > ?
+                GROUP BY r.spot_id
                 ORDER BY bookings_count DESC
                 LIMIT 10
-            ''', (cutoff_date,))
+            ''', (cutoff_day,))
             stats['top_spots'] = [dict(row) for row in cursor.fetchall()]
             
             # Ежедневная статистика
             cursor.execute('''
-                SELECT DATE(created_at) as date, 
-                       COUNT(*) as bookings,
-                       SUM(total_price) as revenue
-                FROM bookings
-                WHERE created_at > ?
-                GROUP BY DATE(created_at)
-                ORDER BY date
-            ''', (cutoff_date,))
+                SELECT day as date, bookings, amount as revenue
+                FROM rollup_daily
+                WHERE day > ? AND bookings > 0
+                ORDER BY day
+            ''', (cutoff_day,))
             stats['daily_stats'] = [dict(row) for row in cursor.fetchall()]
             
             return stats
@@ -1841,8 +3478,172 @@ class Database:
             logger.error(f"Ошибка получения статистики: {e}")
             return {}
     
+    @reads
+    def get_hourly_stats(self, hours: int = 24) -> List[Dict]:
+        """Почасовая статистика броней за последние часы"""
+        try:
+            cursor = self.connection.cursor()
+            cutoff_hour = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:00')
+            cursor.execute('''
+                SELECT hour, bookings, paid_bookings, cancellations, revenue
+                FROM rollup_hourly
+                WHERE hour > ?
+                ORDER BY hour
+            ''', (cutoff_hour,))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения почасовой статистики: {e}")
+            return []
+    
+    @reads
+    def get_owner_income(self, owner_id: int, period_days: int = 30) -> List[Dict]:
+        """Доходы владельца по активным местам: за все время и за период"""
+        try:
+            cursor = self.connection.cursor()
+            cutoff_day = (date.today() - timedelta(days=period_days)).isoformat()
+            cursor.execute('''
+                SELECT ps.id, ps.spot_number, ps.address,
+                       COALESCE(r.bookings, 0) as total_bookings,
+                       COALESCE(r.earnings, 0) as total_earnings,
+                       COALESCE(r.period_earnings, 0) as period_earnings
+                FROM parking_spots ps
+                LEFT JOIN (
+                    SELECT spot_id,
+                           SUM(bookings) as bookings,
+                           SUM(revenue) as earnings,
+                           SUM(CASE WHEN day > ? THEN revenue ELSE 0 END) as period_earnings
+                    FROM rollup_spot_daily
+                    WHERE owner_id = ?
+                    GROUP BY spot_id
+                ) r ON r.spot_id = ps.id
+                WHERE ps.owner_id = ? AND ps.is_active = 1
+                ORDER BY total_earnings DESC, ps.created_at DESC
+            ''', (cutoff_day, owner_id, owner_id))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения доходов владельца: {e}")
+            return []
+    
+    @reads
+    def get_stats_counters(self) -> Dict[str, float]:
+        """Все счетчики статистики одним запросом"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT name, value FROM stats_counters')
+            return {row['name']: row['value'] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Ошибка получения счетчиков статистики: {e}")
+            return {}
+    
+    def get_system_stats(self) -> Dict[str, Any]:
+        """Сводная статистика системы из счетчиков, без обхода таблиц"""
+        counters = self.get_stats_counters()
+        count = lambda name: int(counters.get(name, 0))
+        active_spots = count('spots_active')
+        total_bookings = count('bookings_total')
+        
+        return {
+            'total_users': count('users_total'),
+            'admin_users': count('users_admins'),
+            'blocked_users': count('users_blocked'),
+            'total_spots': count('spots_total'),
+            'active_spots': active_spots,
+            'avg_hourly_price': counters.get('spots_active_price_sum', 0) / active_spots if active_spots else 0,
+            'avg_spot_rating': counters.get('spots_active_rating_sum', 0) / active_spots if active_spots else 0,
+            'total_bookings': total_bookings,
+            'pending_bookings': count('bookings_status:pending'),
+            'confirmed_bookings': count('bookings_status:confirmed'),
+            'active_bookings': count('bookings_status:active'),
+            'completed_bookings': count('bookings_status:completed'),
+            'cancelled_bookings': count('bookings_status:cancelled'),
+            'paid_bookings': count('bookings_paid'),
+            'avg_booking_price': counters.get('bookings_price_sum', 0) / total_bookings if total_bookings else 0,
+            'total_revenue': counters.get('bookings_revenue', 0),
+            'total_reports': count('reports_total'),
+            'pending_reports': count('reports_status:pending'),
+            'total_reviews': count('reviews_total'),
+            'pending_reviews': count('reviews_pending'),
+        }
+    
+    def count_users(self) -> int:
+        """Количество пользователей"""
+        return self.get_system_stats()['total_users']
+    
+    @reads
+    def count_spots(self, owner_id: int = None, is_active: bool = None) -> int:
+        """Количество мест: общие числа из счетчиков, по владельцу - запросом"""
+        try:
+            if owner_id is None:
+                stats = self.get_system_stats()
+                if is_active is None:
+                    return stats['total_spots']
+                return stats['active_spots'] if is_active else stats['total_spots'] - stats['active_spots']
+            
+            cursor = self.connection.cursor()
+            query = 'SELECT COUNT(*) as count FROM parking_spots WHERE owner_id = ?'
+            params = [owner_id]
+            if is_active is not None:
+                query += ' AND is_active = ?'
+                params.append(is_active)
+            cursor.execute(query, params)
+            return cursor.fetchone()['count']
+        except Exception as e:
+            logger.error(f"Ошибка подсчета мест: {e}")
+            return 0
+    
+    @reads
+    def count_bookings(self, user_id: int = None, status: str = None) -> int:
+        """Количество броней: общие числа из счетчиков, по пользователю - запросом"""
+        try:
+            if user_id is None:
+                counters = self.get_stats_counters()
+                name = f'bookings_status:{status}' if status else 'bookings_total'
+                return int(counters.get(name, 0))
+            
+            cursor = self.connection.cursor()
+            query = 'SELECT COUNT(*) as count FROM bookings_all WHERE user_id = ?'
+            params = [user_id]
+            if status:
+                query += ' AND status = ?'
+                params.append(status)
+            cursor.execute(query, params)
+            return cursor.fetchone()['count']
+        except Exception as e:
+            logger.error(f"Ошибка подсчета бронирований: {e}")
+            return 0
+    
+    @writes
+    def save_stats_snapshot(self) -> Optional[int]:
+        """Сохранение снимка счетчиков для истории"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                INSERT INTO stats_snapshots (data) VALUES (?)
+            ''', (json.dumps(self.get_system_stats()),))
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снимка статистики: {e}")
+            return None
+    
+    @reads
+    def get_stats_snapshots(self, limit: int = 30) -> List[Dict]:
+        """Последние снимки статистики, от старых к новым"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                SELECT created_at, data FROM stats_snapshots
+                ORDER BY id DESC LIMIT ?
+            ''', (limit,))
+            snapshots = [{'created_at': row['created_at'], **json.loads(row['data'])}
+                         for row in cursor.fetchall()]
+            return list(reversed(snapshots))
+        except Exception as e:
+            logger.error(f"Ошибка получения снимков статистики: {e}")
+            return []
+    
     # ==================== УТИЛИТЫ ====================
     
+    @reads
     def check_connection(self) -> bool:
         """Проверка соединения с БД"""
         try:
@@ -1852,56 +3653,274 @@ class Database:
         except:
             return False
     
-    def backup_database(self, backup_path: str) -> bool:
-        """Создание резервной копии БД"""
-        import shutil
+    def backup_database(self, backup_path: str, pages: int = None, pause_ms: int = None,
+                        schema: str = "main") -> bool:
+        """Онлайн-копия БД через backup API SQLite.
+        
+        Копия идет порциями по pages страниц с соединения-писателя: между
+        порциями блокировка записи отпускается на pause_ms, и записи этого
+        процесса попадают в копию сразу, не начиная ее заново. Записи
+        других процессов перезапускают копирование; после
+        BACKUP_MAX_RESTARTS перезапусков копия снимается одним шагом со
+        снимка читателя. schema - копируемая база: main или холодный слой.
+        Вызывать из отдельного потока, не из потока БД.
+        """
+        pages = pages or Config.BACKUP_PAGES_PER_STEP
+        pause = (Config.BACKUP_STEP_PAUSE_MS if pause_ms is None else pause_ms) / 1000
+        restarts = 0
+        copied_before = 0
+        
+        def progress(status: int, remaining: int, total: int):
+            nonlocal restarts, copied_before
+            copied = total - remaining
+            # После перезапуска копия снова начинается с первых страниц
+            if copied <= copied_before:
+                restarts += 1
+                if restarts > BACKUP_MAX_RESTARTS:
+                    raise BackupRestartedError(f"копирование перезапущено {restarts} раз")
+            copied_before = copied
+            self._write_lock.release()
+            try:
+                sleep(pause)
+            finally:
+                self._write_lock.acquire()
+        
+        target = sqlite3.connect(backup_path)
         try:
-            shutil.copy2(self.db_path, backup_path)
+            try:
+                with self.writer() as connection:
+                    connection.backup(target, pages=pages, progress=progress, name=schema)
+            except BackupRestartedError as e:
+                logger.warning(f"⚠️ Резервная копия: {e}, копируем снимок целиком")
+                source = self._open_connection(read_only=True)
+                try:
+                    source.backup(target, name=schema)
+                finally:
+                    source.close()
+            # Копия - один самодостаточный файл, без журнала WAL
+            target.execute("PRAGMA journal_mode = DELETE")
             logger.info(f"✅ Резервная копия создана: {backup_path}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка создания резервной копии: {e}")
             return False
+        finally:
+            target.close()
     
-    def cleanup_old_data(self, days: int = 90) -> bool:
-        """Очистка старых данных"""
+    # ==================== ПЛАНЫ ЗАПРОСОВ ====================
+    
+    @reads
+    def check_query_plans(self) -> List[Dict[str, Any]]:
+        """Горячие запросы с полным обходом таблицы в плане.
+        
+        Каждый запрос HOT_QUERIES разбирается EXPLAIN QUERY PLAN; шаг
+        SCAN без индекса - регрессия (индекс удален, запрос изменился
+        так, что индекс не подходит, или условие частичного индекса
+        больше не следует из запроса). Пустой список - все в порядке.
+        """
+        regressions = []
+        for name, query, params in HOT_QUERIES:
+            try:
+                plan = [row['detail'] for row in self.connection.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+            except Exception as e:
+                regressions.append({'query': name, 'plan': [], 'error': str(e)})
+                continue
+            scans = [step for step in plan if step.startswith("SCAN ") and " INDEX" not in step
+                     and not step.startswith(("SCAN CONSTANT ROW", "SCAN (subquery"))]
+            if scans:
+                regressions.append({'query': name, 'plan': plan, 'error': None})
+        return regressions
+    
+    # ==================== ХРАНЕНИЕ ДАННЫХ ====================
+    
+    @reads
+    def get_retention_chunk(self, table: str, condition: str, params: tuple,
+                            after_id: int = 0, limit: int = 500, columns: str = "id") -> List[Dict]:
+        """Порция строк под политику хранения: по возрастанию id после after_id"""
         try:
             cursor = self.connection.cursor()
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
-            # Удаляем старые логи
-            cursor.execute('DELETE FROM logs WHERE created_at < ?', (cutoff_date,))
-            
-            # Удаляем старые прочитанные уведомления
-            cursor.execute('''
-                DELETE FROM notifications 
-                WHERE is_read = 1 AND created_at < ?
-            ''', (cutoff_date,))
-            
-            # Удаляем старые админ-сессии
-            cursor.execute('DELETE FROM admin_sessions WHERE expires_at < ?', (datetime.now(),))
-            
-            # Архивируем завершенные бронирования старше N дней
-            cursor.execute('''
-                UPDATE bookings 
-                SET status = 'archived' 
-                WHERE status = 'completed' 
-                AND end_time < ?
-            ''', (cutoff_date,))
-            
-            self.connection.commit()
-            logger.info(f"✅ Очистка данных старше {days} дней выполнена")
+            cursor.execute(f'''
+                SELECT {columns} FROM {table}
+                WHERE id > ? AND ({condition})
+                ORDER BY id
+                LIMIT ?
+            ''', (after_id, *params, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка выбора строк {table} для очистки: {e}")
+            return []
+    
+    @writes
+    def apply_retention(self, table: str, ids: List[int], condition: str, params: tuple,
+                        assignments: str = None) -> Optional[int]:
+        """Удаление (или обновление assignments) строк порции.
+        
+        Условие политики проверяется повторно: между выбором и записью
+        строка могла измениться. Возвращает число затронутых строк или
+        None при ошибке.
+        """
+        if not ids:
+            return 0
+        try:
+            cursor = self.connection.cursor()
+            placeholders = ",".join("?" * len(ids))
+            action = f"UPDATE {table} SET {assignments}" if assignments else f"DELETE FROM {table}"
+            cursor.execute(f"{action} WHERE id IN ({placeholders}) AND ({condition})",
+                           (*ids, *params))
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки {table}: {e}")
+            return None
+    
+    def archive_bookings(self, booking_ids: List[int]) -> Optional[int]:
+        """Перенос архивных броней и их платежей в холодный слой.
+        
+        В режиме WAL транзакция по двум файлам не атомарна, поэтому копия
+        фиксируется отдельной транзакцией до удаления из горячего слоя:
+        при сбое между ними бронь временно окажется в обоих слоях
+        (следующий проход доделает перенос), но не потеряется. Счетчики
+        статистики не меняются: триггер удаления вычитает бронь, а
+        перенос возвращает ее вклад. Возвращает число перенесенных броней
+        или None при ошибке.
+        """
+        if not booking_ids:
+            return 0
+        placeholders = ",".join("?" * len(booking_ids))
+        selected = f"bookings.id IN ({placeholders}) AND ({ARCHIVE_BOOKING_CONDITION})"
+        try:
+            with self.transaction() as connection:
+                self._copy_to_archive(connection, selected, booking_ids)
+            
+            with self.transaction() as connection:
+                # Бронь могла измениться между транзакциями: отбираем заново
+                moved = [row['id'] for row in connection.execute(
+                    f"SELECT id FROM main.bookings AS bookings WHERE {selected}", booking_ids)]
+                if not moved:
+                    return 0
+                placeholders = ",".join("?" * len(moved))
+                chosen = f"bookings.id IN ({placeholders})"
+                self._copy_to_archive(connection, chosen, moved)
+                for name, delta in STATS_COUNTERS['bookings'][1]:
+                    connection.execute(_counter_upsert(
+                        name.format(r="bookings"), delta.format(r="bookings"),
+                        f"SELECT {{name}}, COALESCE(SUM({{delta}}), 0) FROM main.bookings AS bookings "
+                        f"WHERE {chosen} GROUP BY 1"
+                    ), moved)
+                connection.execute(f"DELETE FROM main.payments WHERE booking_id IN ({placeholders})", moved)
+                connection.execute(f"DELETE FROM main.bookings WHERE id IN ({placeholders})", moved)
+                return len(moved)
+        except Exception as e:
+            logger.error(f"❌ Ошибка переноса броней в архив: {e}")
+            return None
+    
+    def _copy_to_archive(self, connection: sqlite3.Connection, selected: str, booking_ids: List[int]):
+        """Копия отобранных броней и их платежей в холодный слой"""
+        for table, source in (
+            ('bookings', f"SELECT {{columns}} FROM main.bookings AS bookings WHERE {selected}"),
+            ('payments', f"SELECT {{columns}} FROM main.payments WHERE booking_id IN ("
+                         f"SELECT id FROM main.bookings AS bookings WHERE {selected})"),
+        ):
+            columns = ", ".join(row['name'] for row in connection.execute(f"PRAGMA main.table_info({table})"))
+            connection.execute(f"INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table} ({columns}) "
+                               f"{source.format(columns=columns)}", booking_ids)
+    
+    @reads
+    def get_vacuum_info(self) -> Dict[str, int]:
+        """Режим auto_vacuum и число свободных страниц файла БД"""
+        connection = self.connection
+        return {
+            'auto_vacuum': connection.execute("PRAGMA auto_vacuum").fetchone()[0],
+            'freelist_count': connection.execute("PRAGMA freelist_count").fetchone()[0],
+            'page_count': connection.execute("PRAGMA page_count").fetchone()[0],
+            'page_size': connection.execute("PRAGMA page_size").fetchone()[0]
+        }
+    
+    def incremental_vacuum(self, pages: int) -> int:
+        """Возврат до pages свободных страниц файловой системе; возвращает число возвращенных"""
+        try:
+            with self.writer() as connection:
+                before = connection.execute("PRAGMA freelist_count").fetchone()[0]
+                # execute() выполняет один шаг прагмы - одну страницу;
+                # executescript() доводит ее до конца в своей транзакции
+                connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+                return before - connection.execute("PRAGMA freelist_count").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Ошибка incremental_vacuum: {e}")
+            return 0
+    
+    def enable_incremental_vacuum(self) -> bool:
+        """Перевод существующей БД в auto_vacuum = INCREMENTAL полным VACUUM.
+        
+        VACUUM переписывает весь файл и держит блокировку записи до конца,
+        поэтому выполняется один раз при остановленном боте.
+        """
+        try:
+            with self.writer() as connection:
+                connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                connection.execute("VACUUM")
+            logger.info("✅ БД переведена в режим auto_vacuum = INCREMENTAL")
             return True
         except Exception as e:
-            logger.error(f"❌ Ошибка очистки данных: {e}")
+            logger.error(f"❌ Ошибка VACUUM: {e}")
             return False
     
     def close(self):
-        """Закрытие соединения с БД"""
-        if self.connection:
-            self.connection.close()
+        """Закрытие соединений с БД"""
+        # Остаток буфера журнала пишется до закрытия писателя
+        flushed = self.audit_log.close()
+        if flushed:
+            logger.info(f"✅ Записан остаток журнала: {flushed} записей")
+        self._close_connections()
+    
+    def _close_connections(self):
+        """Закрытие соединений; буфер журнала остается открытым для переподключения"""
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        
+        if self._writer:
+            self._writer.close()
+            self._writer = None
             logger.info("✅ Соединение с БД закрыто")
 
+class AsyncDatabase:
+    """Асинхронный фасад над Database.
+    
+    Каждый публичный метод Database доступен как корутина и выполняется
+    в выделенном потоке, поэтому запросы к SQLite не блокируют цикл событий.
+    """
+    
+    def __init__(self, database: Database, max_workers: int = 1):
+        self._db = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="database")
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение синхронной функции в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self._db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        
+        # Кэшируем обертку, чтобы не создавать ее при каждом вызове
+        self.__dict__[name] = method
+        return method
+    
+    async def close(self):
+        """Закрытие соединения и остановка потока БД"""
+        await self.run(self._db.close)
+        self._executor.shutdown(wait=True)
+
 # Глобальный экземпляр БД
 
-db = Database()
+db = Database(Config.DATABASE_PATH)
+# Потоков столько же, сколько соединений: читатели и один писатель
+adb = AsyncDatabase(db, max_workers=Config.DB_READER_CONNECTIONS + 1)
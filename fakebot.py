@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Bot для проверки отправки без обращения к Telegram
+"""
+import asyncio
+from collections import deque
+from time import monotonic
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+class FakeBot:
+    """Запоминает отправленные сообщения и воспроизводит ограничения Telegram.
+    
+    Превышение global_rate сообщений за секунду или отправка в один чат
+    чаще chat_rate раз в секунду завершается TelegramRetryAfter; чаты из
+    blocked_chats отвечают TelegramForbiddenError.
+    """
+    
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, latency: float = 0.0,
+                 blocked_chats: Iterable[int] = (), retry_after: int = 1):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.latency = latency
+        self.blocked_chats = set(blocked_chats)
+        self.retry_after = retry_after
+        self.sent: List[SimpleNamespace] = []
+        self.flood_errors = 0
+        self._recent = deque()
+        self._last_by_chat: Dict[int, float] = {}
+    
+    async def send_message(self, chat_id: int, text: str, reply_markup: Any = None, **kwargs) -> SimpleNamespace:
+        """Имитация Bot.send_message"""
+        method = SendMessage(chat_id=chat_id, text=text)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        if chat_id in self.blocked_chats:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        
+        now = monotonic()
+        while self._recent and now - self._recent[0] >= 1.0:
+            self._recent.popleft()
+        last = self._last_by_chat.get(chat_id)
+        if len(self._recent) >= self.global_rate or (last is not None and now - last < 1 / self.chat_rate):
+            self.flood_errors += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests",
+                                     retry_after=self.retry_after)
+        
+        self._recent.append(now)
+        self._last_by_chat[chat_id] = now
+        message = SimpleNamespace(message_id=len(self.sent) + 1, chat_id=chat_id, text=text,
+                                  reply_markup=reply_markup, date=now)
+        self.sent.append(message)
+        return message
+    
+    def messages_to(self, chat_id: int) -> List[str]:
+        """Тексты сообщений, отправленных в чат"""
+        return [message.text for message in self.sent if message.chat_id == chat_id]
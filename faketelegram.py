@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Локальный сервер Bot API для проверки режима нескольких процессов.
+
+Запуск проверки: сначала сервер, затем бот, направленный на него.
+
+    python faketelegram.py --chats 200 --messages 5
+    TELEGRAM_API_URL=http://127.0.0.1:8081 CLUSTER_WORKERS=4 \
+        WEBHOOK_URL=http://127.0.0.1:8080 python bot.py
+
+Сервер ждет регистрации webhook, отправляет боту сообщения от chats
+пользователей и печатает, сколько ответов получено и с какой задержкой.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+from time import monotonic, time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые отвечают сообщением; остальные отвечают True
+MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument', 'editMessageReplyMarkup'}
+
+class FakeTelegramServer:
+    """Сервер с подмножеством Bot API: запоминает вызовы и отправляет обновления на webhook"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081):
+        self.host = host
+        self.port = port
+        self.calls: List[Dict[str, Any]] = []
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_set = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._session = aiohttp.ClientSession()
+    
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+        if self._runner:
+            await self._runner.cleanup()
+    
+    # ==================== BOT API ====================
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls.append({'method': method, 'params': params, 'time': monotonic()})
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+    
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Parking Bot', 'username': 'parking_test_bot'}
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+            self.webhook_set.set()
+            return True
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get('chat_id', 0))
+            return {
+                'message_id': int(params.get('message_id') or next(self._message_ids)),
+                'date': int(time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', '')
+            }
+        return True
+    
+    def messages_to(self, chat_id: int) -> List[Dict[str, Any]]:
+        """Вызовы отправки сообщений в чат"""
+        return [call for call in self.calls
+                if call['method'] in MESSAGE_METHODS and int(call['params'].get('chat_id', 0)) == chat_id]
+    
+    # ==================== ОБНОВЛЕНИЯ ====================
+    
+    def message_update(self, chat_id: int, text: str) -> Dict[str, Any]:
+        """Обновление с текстовым сообщением пользователя"""
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User {chat_id}"}
+        return {
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time()),
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+                'from': user,
+                'text': text
+            }
+        }
+    
+    async def send_update(self, update: Dict[str, Any]) -> int:
+        """Отправка обновления на зарегистрированный webhook; возвращает HTTP-статус"""
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook_secret
+        async with self._session.post(self.webhook_url, data=json.dumps(update), headers=headers) as response:
+            return response.status
+
+async def simulate(server: FakeTelegramServer, chats: int, messages: int, timeout: float):
+    """Отправка сообщений от chats пользователей и сбор ответов"""
+    await server.webhook_set.wait()
+    print(f"Webhook зарегистрирован: {server.webhook_url}")
+    
+    first_chat = 1_000_000
+    sent_at: Dict[int, List[float]] = {}
+    for round_number in range(messages):
+        for chat_id in range(first_chat, first_chat + chats):
+            text = "/start" if round_number == 0 else f"сообщение {round_number}"
+            sent_at.setdefault(chat_id, []).append(monotonic())
+            await server.send_update(server.message_update(chat_id, text))
+    
+    deadline = monotonic() + timeout
+    total = chats * messages
+    while monotonic() < deadline:
+        answered = sum(1 for chat_id in sent_at if server.messages_to(chat_id))
+        if answered == chats and len(server.calls) >= total:
+            break
+        await asyncio.sleep(0.2)
+    
+    # Задержка до первого ответа на первое сообщение чата
+    latencies = sorted(replies[0]['time'] - sent_at[chat_id][0]
+                       for chat_id in sent_at
+                       for replies in [server.messages_to(chat_id)] if replies)
+    print(f"Отправлено обновлений: {total}, ответили чатов: {len(latencies)} из {chats}, "
+          f"вызовов API: {len(server.calls)}")
+    if latencies:
+        print(f"Задержка первого ответа: медиана {latencies[len(latencies) // 2] * 1000:.0f} мс, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} мс")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    
+    server = FakeTelegramServer(args.host, args.port)
+    await server.start()
+    print(f"Сервер Bot API: {server.url}")
+    try:
+        await simulate(server, args.chats, args.messages, args.timeout)
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Хранилище состояний FSM в SQLite
+"""
+import asyncio
+import json
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from time import monotonic
+from time import time as unix_time
+from typing import Any, Dict, List, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from config import Config
+from database import adb
+
+logger = logging.getLogger(__name__)
+
+# Как часто выгружать из памяти давно не использованные состояния
+SWEEP_INTERVAL_SECONDS = 60
+
+# Типы данных, которые обработчики кладут в данные состояния, помимо JSON
+_DECODERS = {
+    '$dt': datetime.fromisoformat,
+    '$d': date.fromisoformat,
+    '$t': time.fromisoformat,
+    '$dec': Decimal,
+}
+
+def _encode_value(value: Any) -> Dict[str, str]:
+    # datetime - подкласс date, поэтому проверяется первым
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, time):
+        return {'$t': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    raise TypeError(f"Тип {type(value).__name__} нельзя сохранить в данных состояния")
+
+def _decode_value(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        decoder = _DECODERS.get(tag)
+        if decoder is not None:
+            return decoder(value)
+    return obj
+
+def dump_data(data: Dict[str, Any]) -> Optional[str]:
+    """Компактная сериализация данных состояния; пустые данные - NULL"""
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_encode_value)
+
+def load_data(raw: Optional[str]) -> Dict[str, Any]:
+    """Разбор данных состояния"""
+    if not raw:
+        return {}
+    return json.loads(raw, object_hook=_decode_value)
+
+class FSMRecord:
+    """Состояние и данные одного ключа в памяти"""
+    
+    __slots__ = ('state', 'data', 'updated_at', 'used_at')
+    
+    def __init__(self, state: Optional[str] = None, data: Dict[str, Any] = None,
+                 updated_at: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at  # unix-время изменения, для срока жизни
+        self.used_at = monotonic()    # для выгрузки из памяти
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM с записью в SQLite в фоне.
+    
+    Чтение и запись идут в словарь в памяти; состояние читается из базы
+    только при первом обращении к ключу. Измененные ключи копятся и
+    пишутся одним запросом раз в flush_interval_ms миллисекунд и при
+    остановке бота, поэтому при аварийном завершении теряются изменения
+    не больше чем за один интервал. Состояния, не менявшиеся дольше ttl
+    секунд, считаются брошенными и удаляются.
+    """
+    
+    def __init__(self, flush_interval_ms: int = None, ttl: float = None,
+                 idle_seconds: float = None, key_builder: KeyBuilder = None):
+        self.flush_interval = (flush_interval_ms or Config.FSM_FLUSH_MS) / 1000
+        self.ttl = ttl or Config.FSM_STATE_TTL_HOURS * 3600
+        self.idle_seconds = idle_seconds or Config.FSM_CACHE_IDLE_SECONDS
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._records: Dict[str, FSMRecord] = {}
+        self._dirty: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._next_sweep = monotonic() + SWEEP_INTERVAL_SECONDS
+        self._closed = False
+        self.loads = 0
+        self.flushes = 0
+        self.written = 0
+        self.expired = 0
+    
+    # ==================== ЧТЕНИЕ И ЗАПИСЬ ====================
+    
+    async def _record(self, key: StorageKey) -> FSMRecord:
+        """Запись ключа из памяти или из базы"""
+        name = self.key_builder.build(key)
+        record = self._records.get(name)
+        if record is None:
+            row = await adb.get_fsm_record(name)
+            self.loads += 1
+            loaded = FSMRecord()
+            if row and unix_time() - row['updated_at'] < self.ttl:
+                try:
+                    loaded = FSMRecord(row['state'], load_data(row['data']), row['updated_at'])
+                except ValueError as e:
+                    logger.error(f"Ошибка чтения состояния {name}: {e}")
+            # Пока шло чтение, ключ мог загрузить и изменить другой обработчик
+            record = self._records.setdefault(name, loaded)
+        record.used_at = monotonic()
+        return record
+    
+    def _touch(self, key: StorageKey, record: FSMRecord):
+        """Отметка об изменении: запись уйдет в базу со следующей пачкой"""
+        record.updated_at = unix_time()
+        self._dirty.add(self.key_builder.build(key))
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._run())
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        self._touch(key, record)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+    
+    # ==================== ЗАПИСЬ В БАЗУ ====================
+    
+    async def flush(self) -> int:
+        """Запись измененных ключей; возвращает их количество"""
+        if not self._dirty:
+            return 0
+        names, self._dirty = self._dirty, set()
+        
+        rows: List[tuple] = []
+        deleted: List[str] = []
+        for name in names:
+            record = self._records.get(name)
+            if record is None:
+                continue
+            if record.state is None and not record.data:
+                deleted.append(name)
+                continue
+            try:
+                rows.append((name, record.state, dump_data(record.data), record.updated_at))
+            except (TypeError, ValueError) as e:
+                logger.error(f"Ошибка сохранения состояния {name}: {e}")
+        
+        if not await adb.save_fsm_records(rows, deleted):
+            # База недоступна: повторим со следующей пачкой
+            self._dirty.update(names)
+            return 0
+        self.flushes += 1
+        self.written += len(names)
+        return len(names)
+    
+    async def sweep(self) -> int:
+        """Удаление брошенных состояний и выгрузка неиспользуемых из памяти"""
+        now = monotonic()
+        expired_before = unix_time() - self.ttl
+        for name, record in list(self._records.items()):
+            if name in self._dirty:
+                continue
+            if now - record.used_at > self.idle_seconds or 0 < record.updated_at < expired_before:
+                del self._records[name]
+        
+        removed = await adb.delete_expired_fsm_records(expired_before)
+        self.expired += removed
+        return removed
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+                if monotonic() >= self._next_sweep:
+                    self._next_sweep = monotonic() + SWEEP_INTERVAL_SECONDS
+                    removed = await self.sweep()
+                    if removed:
+                        logger.info(f"🧹 Удалено брошенных состояний FSM: {removed}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи состояний FSM: {e}")
+    
+    async def close(self) -> None:
+        """Остановка фоновой записи и запись оставшихся изменений"""
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        flushed = await self.flush()
+        if flushed:
+            logger.info(f"💾 Сохранено состояний FSM при остановке: {flushed}")
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики хранилища"""
+        return {
+            'cached': len(self._records),
+            'dirty': len(self._dirty),
+            'loads': self.loads,
+            'flushes': self.flushes,
+            'written': self.written,
+            'expired': self.expired
+        }
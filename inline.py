@@ -1,16 +1,26 @@
+from typing import Optional, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 # ==================== ПАГИНАЦИЯ ====================
 
-def get_pagination_keyboard(page: int, total_pages: int, prefix: str):
-    """Клавиатура пагинации"""
+def get_pagination_keyboard(page: int, total_pages: int, prefix: str,
+                            first_id: int = None, last_id: int = None):
+    """Клавиатура пагинации.
+    
+    С first_id и last_id (id первой и последней строки страницы) кнопки
+    несут курсор - {prefix}_prev_<стр.>_<id> и {prefix}_next_<стр.>_<id>,
+    страница выбирается по нему (after_id / before_id списков БД) без
+    OFFSET. Без них - номер страницы {prefix}_page_<стр.>.
+    """
     builder = InlineKeyboardBuilder()
+    cursors = first_id is not None and last_id is not None
     
     if page > 1:
         builder.add(InlineKeyboardButton(
             text="◀️ Назад",
-            callback_data=f"{prefix}_page_{page-1}"
+            callback_data=f"{prefix}_prev_{page-1}_{first_id}" if cursors else f"{prefix}_page_{page-1}"
         ))
     
     builder.add(InlineKeyboardButton(
@@ -21,12 +31,26 @@ def get_pagination_keyboard(page: int, total_pages: int, prefix: str):
     if page < total_pages:
         builder.add(InlineKeyboardButton(
             text="Вперед ▶️",
-            callback_data=f"{prefix}_page_{page+1}"
+            callback_data=f"{prefix}_next_{page+1}_{last_id}" if cursors else f"{prefix}_page_{page+1}"
         ))
     
     builder.adjust(3)
     return builder.as_markup()
 
+def parse_pagination_callback(data: str, prefix: str) -> Optional[Tuple[int, Optional[int], Optional[int]]]:
+    """Разбор кнопки пагинации: (страница, after_id, before_id) или None"""
+    parts = data[len(prefix) + 1:].split("_") if data.startswith(prefix + "_") else []
+    try:
+        if len(parts) == 3 and parts[0] == "next":
+            return int(parts[1]), int(parts[2]), None
+        if len(parts) == 3 and parts[0] == "prev":
+            return int(parts[1]), None, int(parts[2])
+        if len(parts) == 2 and parts[0] == "page":
+            return int(parts[1]), None, None
+    except ValueError:
+        pass
+    return None
+
 # ==================== БЫСТРЫЕ ДЕЙСТВИЯ ====================
 
 def get_quick_actions_keyboard(user_id=None):
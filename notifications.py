@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Доставка уведомлений из БД в Telegram
+"""
+import asyncio
+import html
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import Config
+from database import db, adb
+from outbox import outbox, HIGH, NORMAL, LOW
+
+logger = logging.getLogger(__name__)
+
+# Приоритет отправки по типу уведомления
+NOTIFICATION_PRIORITIES = {
+    'new_booking': HIGH,
+    'new_booking_request': HIGH,
+    'booking_confirmed': HIGH,
+    'booking_cancelled': HIGH,
+    'admin_notification': LOW,
+}
+
+# Длина текста одного уведомления в сводке
+DIGEST_MESSAGE_LENGTH = 300
+
+def format_notifications(items: List[Dict]) -> str:
+    """Текст сообщения: одно уведомление целиком или сводка нескольких"""
+    if len(items) == 1:
+        return f"🔔 <b>{items[0]['title']}</b>\n{items[0]['message']}"
+    
+    text = f"🔔 <b>Новых уведомлений: {len(items)}</b>\n"
+    for item in items[:Config.NOTIFICATION_DIGEST_ITEMS]:
+        message = item['message']
+        if len(message) > DIGEST_MESSAGE_LENGTH:
+            # Обрезанный текст мог потерять закрывающий тег: показываем без разметки
+            message = html.escape(message[:DIGEST_MESSAGE_LENGTH]) + "..."
+        text += f"\n• <b>{item['title']}</b>\n{message}\n"
+    
+    rest = len(items) - Config.NOTIFICATION_DIGEST_ITEMS
+    if rest > 0:
+        text += f"\n<i>... и еще {rest}, все уведомления - в меню профиля</i>"
+    return text
+
+class NotificationDispatcher:
+    """Отправка недоставленных уведомлений порциями.
+    
+    Порция читается по частичному индексу delivered_at IS NULL, уведомления
+    одного пользователя объединяются в сводку и уходят через очередь
+    outbox. Отметки о доставке копятся и записываются одним запросом.
+    После перезапуска неотмеченные уведомления отправляются повторно.
+    """
+    
+    def __init__(self, batch_size: int = None, interval: float = None):
+        self.batch_size = batch_size or Config.NOTIFICATION_BATCH_SIZE
+        self.interval = interval or Config.NOTIFICATION_POLL_SECONDS
+        self._cursor = 0  # id последнего уведомления, переданного в очередь
+        self._done: List[int] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.delivered = 0
+        self.digests = 0
+    
+    def wake(self):
+        """Пробуждение цикла; безопасно вызывать из потока БД"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    async def start(self):
+        """Подписка на новые уведомления и запуск цикла"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._cursor = 0
+        db.add_notification_listener(self.wake)
+        self._wakeup.set()  # уведомления, накопившиеся до запуска
+        self._task = asyncio.create_task(self._run())
+        logger.info("🔔 Доставка уведомлений запущена")
+    
+    async def stop(self):
+        """Остановка: ждет отправки очереди и сохраняет отметки о доставке"""
+        db.remove_notification_listener(self.wake)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await outbox.drain()
+        await self._flush()
+    
+    def _on_done(self, notification_ids: List[int], delivered: bool):
+        """Результат отправки: отброшенное сообщение тоже не отправляется повторно"""
+        self._done.extend(notification_ids)
+        if delivered:
+            self.delivered += len(notification_ids)
+    
+    async def _flush(self):
+        """Запись накопленных отметок о доставке"""
+        if not self._done:
+            return
+        done, self._done = self._done, []
+        await adb.mark_notifications_delivered(done)
+    
+    async def dispatch(self) -> int:
+        """Передача всех недоставленных уведомлений в очередь отправки"""
+        queued = 0
+        while True:
+            rows = await adb.get_undelivered_notifications(self._cursor, self.batch_size)
+            if not rows:
+                return queued
+            
+            by_chat: "OrderedDict[int, List[Dict]]" = OrderedDict()
+            for row in rows:
+                by_chat.setdefault(row['telegram_id'], []).append(row)
+            
+            for chat_id, items in by_chat.items():
+                ids = [item['id'] for item in items]
+                outbox.send(
+                    chat_id,
+                    format_notifications(items),
+                    priority=min(NOTIFICATION_PRIORITIES.get(item['notification_type'], NORMAL)
+                                 for item in items),
+                    on_done=lambda delivered, ids=ids: self._on_done(ids, delivered)
+                )
+                if len(items) > 1:
+                    self.digests += 1
+            
+            self._cursor = rows[-1]['id']
+            queued += len(rows)
+            self.queued += len(rows)
+            if len(rows) < self.batch_size:
+                return queued
+    
+    async def _run(self):
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                
+                # Короткая пауза собирает серию изменений в одну сводку
+                await asyncio.sleep(Config.NOTIFICATION_DIGEST_WINDOW)
+                await self.dispatch()
+                await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка доставки уведомлений: {e}")
+                await asyncio.sleep(1)
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики доставки"""
+        return {
+            'queued': self.queued,
+            'delivered': self.delivered,
+            'digests': self.digests,
+            'awaiting_mark': len(self._done)
+        }
+
+dispatcher = NotificationDispatcher()
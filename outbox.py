@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Очередь исходящих сообщений Telegram
+"""
+import asyncio
+import itertools
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+
+from config import Config
+from ratelimit import KeyedBuckets, telegram_bucket
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше значение - раньше отправка
+HIGH = 0    # брони и платежи
+NORMAL = 1
+LOW = 2     # служебные сообщения администраторам
+
+# Ограничение Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+COALESCE_SEPARATOR = "\n\n"
+
+# Сколько ждать отправки оставшихся сообщений при остановке бота
+STOP_TIMEOUT_SECONDS = 10
+
+class OutboundMessage:
+    """Сообщение в очереди"""
+    
+    __slots__ = ('chat_id', 'text', 'priority', 'reply_markup', 'on_done', 'attempts', 'coalesce')
+    
+    def __init__(self, chat_id: int, text: str, priority: int = NORMAL, reply_markup: Any = None,
+                 on_done: Callable[[bool], Any] = None):
+        self.chat_id = chat_id
+        self.text = text
+        self.priority = priority
+        self.reply_markup = reply_markup
+        # Вызывается с True после отправки или с False, если сообщение отброшено
+        self.on_done = on_done
+        self.attempts = 0
+        # Сообщения с кнопками не объединяются: кнопки относятся к одному тексту
+        self.coalesce = reply_markup is None
+
+class OutboundQueue:
+    """Очередь отправки с приоритетами.
+    
+    В очереди стоят чаты, а не сообщения: пока чат ждет отправки, новые
+    сообщения в него копятся и уходят одним сообщением. Перед отправкой
+    берутся токены из ведра чата и общего ведра бота; если ведро чата
+    пусто, чат откладывается таймером и не занимает обработчик.
+    """
+    
+    def __init__(self, workers: int = None, chat_rate: float = None):
+        self.workers = workers or Config.OUTBOX_WORKERS
+        self.chat_buckets = KeyedBuckets(chat_rate or Config.TELEGRAM_CHAT_RATE, capacity=1)
+        self.bot = None
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._pending: Dict[int, List[OutboundMessage]] = {}
+        # Актуальная запись чата в очереди (приоритет, номер); остальные устарели
+        self._entries: Dict[int, Tuple[int, int]] = {}
+        self._waiting: Dict[int, asyncio.TimerHandle] = {}
+        self._in_flight: set = set()
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failed = 0
+    
+    # ==================== ПОСТАНОВКА В ОЧЕРЕДЬ ====================
+    
+    def send(self, chat_id: int, text: str, priority: int = NORMAL, reply_markup: Any = None,
+             on_done: Callable[[bool], Any] = None):
+        """Постановка сообщения в очередь; возвращается сразу"""
+        self._pending.setdefault(chat_id, []).append(
+            OutboundMessage(chat_id, text, priority, reply_markup, on_done)
+        )
+        self.enqueued += 1
+        self._schedule(chat_id)
+    
+    def _schedule(self, chat_id: int):
+        """Постановка чата в очередь с приоритетом его самого срочного сообщения"""
+        messages = self._pending.get(chat_id)
+        if not messages or chat_id in self._in_flight or chat_id in self._waiting:
+            return
+        priority = min(message.priority for message in messages)
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry[0] <= priority:
+            return
+        entry = (priority, next(self._seq))
+        self._entries[chat_id] = entry
+        self._queue.put_nowait((*entry, chat_id))
+    
+    def _delay(self, chat_id: int, seconds: float):
+        """Откладывание чата: вернется в очередь через seconds секунд"""
+        if chat_id in self._waiting:
+            return
+        loop = asyncio.get_running_loop()
+        self._waiting[chat_id] = loop.call_later(seconds, self._wake, chat_id)
+    
+    def _wake(self, chat_id: int):
+        self._waiting.pop(chat_id, None)
+        self._schedule(chat_id)
+    
+    def _take(self, chat_id: int) -> List[OutboundMessage]:
+        """Извлечение сообщений чата, которые уйдут одним сообщением"""
+        messages = self._pending.get(chat_id, [])
+        batch = messages[:1]
+        length = len(batch[0].text) if batch else 0
+        if batch and batch[0].coalesce:
+            for message in messages[1:]:
+                length += len(COALESCE_SEPARATOR) + len(message.text)
+                if not message.coalesce or length > MAX_MESSAGE_LENGTH:
+                    break
+                batch.append(message)
+        
+        rest = messages[len(batch):]
+        if rest:
+            self._pending[chat_id] = rest
+        else:
+            self._pending.pop(chat_id, None)
+        return batch
+    
+    def _return(self, chat_id: int, batch: List[OutboundMessage], delay: float):
+        """Возврат сообщений в начало очереди чата для повторной отправки"""
+        self._pending[chat_id] = batch + self._pending.get(chat_id, [])
+        self._delay(chat_id, delay)
+    
+    # ==================== ОТПРАВКА ====================
+    
+    def _finish(self, batch: List[OutboundMessage], delivered: bool):
+        """Учет результата и вызов on_done сообщений"""
+        if delivered:
+            self.sent += len(batch)
+        else:
+            self.failed += len(batch)
+        for message in batch:
+            if message.on_done is not None:
+                try:
+                    message.on_done(delivered)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика отправки сообщения: {e}")
+    
+    async def _worker(self):
+        while True:
+            priority, seq, chat_id = await self._queue.get()
+            try:
+                if self._entries.get(chat_id) != (priority, seq):
+                    continue  # чат переставлен с другим приоритетом
+                del self._entries[chat_id]
+                
+                bucket = self.chat_buckets.get(chat_id)
+                wait = bucket.delay()
+                if wait > 0:
+                    self._delay(chat_id, wait)
+                    continue
+                
+                batch = self._take(chat_id)
+                if not batch:
+                    continue
+                self._in_flight.add(chat_id)
+                try:
+                    # Ведро чата последним: между его токеном и отправкой нет ожидания
+                    await telegram_bucket.acquire()
+                    await bucket.acquire()
+                    await self._deliver(chat_id, batch)
+                finally:
+                    self._in_flight.discard(chat_id)
+                    self._schedule(chat_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка очереди сообщений: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def _deliver(self, chat_id: int, batch: List[OutboundMessage]):
+        """Отправка пачки сообщений чата одним сообщением"""
+        text = COALESCE_SEPARATOR.join(message.text for message in batch)
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, reply_markup=batch[0].reply_markup)
+            self.coalesced += len(batch) - 1
+            self._finish(batch, True)
+        except TelegramRetryAfter as e:
+            # Лимит общий для бота: останавливаем все отправки
+            telegram_bucket.pause(e.retry_after)
+            self.retries += 1
+            self._return(chat_id, batch, e.retry_after)
+            logger.warning(f"⏳ Flood control, пауза отправки {e.retry_after} с")
+        except TelegramForbiddenError:
+            self._finish(batch, False)
+            logger.debug(f"Чат {chat_id} недоступен, сообщений отброшено: {len(batch)}")
+        except TelegramBadRequest as e:
+            if len(batch) > 1:
+                # Ошибка в одном из объединенных сообщений: отправляем их по отдельности
+                for message in batch:
+                    message.coalesce = False
+                self._return(chat_id, batch, 0)
+                return
+            self._finish(batch, False)
+            logger.warning(f"⚠️ Сообщение в чат {chat_id} отклонено: {e}")
+        except (TelegramNetworkError, TelegramServerError) as e:
+            retry = [message for message in batch if message.attempts + 1 < Config.OUTBOX_MAX_ATTEMPTS]
+            for message in retry:
+                message.attempts += 1
+            self._finish([message for message in batch if message not in retry], False)
+            if retry:
+                self.retries += 1
+                attempt = max(message.attempts for message in retry)
+                self._return(chat_id, retry, min(60, 2 ** attempt))
+            logger.warning(f"⚠️ Ошибка отправки в чат {chat_id}: {e}")
+        except Exception as e:
+            self._finish(batch, False)
+            logger.error(f"❌ Ошибка отправки сообщения в чат {chat_id}: {e}")
+    
+    # ==================== ЗАПУСК И ОСТАНОВКА ====================
+    
+    def start(self, bot):
+        """Запуск обработчиков; bot - aiogram Bot или FakeBot"""
+        self.bot = bot
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"📨 Очередь сообщений запущена, обработчиков: {self.workers}")
+    
+    def pending(self) -> int:
+        """Количество неотправленных сообщений"""
+        return sum(len(messages) for messages in self._pending.values())
+    
+    async def drain(self, timeout: float = STOP_TIMEOUT_SECONDS) -> bool:
+        """Ожидание отправки всех сообщений"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._pending or self._in_flight:
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+    
+    async def stop(self, timeout: float = STOP_TIMEOUT_SECONDS):
+        """Остановка с отправкой накопленных сообщений"""
+        if not await self.drain(timeout):
+            logger.warning(f"⚠️ Очередь остановлена, не отправлено сообщений: {self.pending()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for handle in self._waiting.values():
+            handle.cancel()
+        self._waiting.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики очереди"""
+        return {
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retries': self.retries,
+            'failed': self.failed,
+            'pending': self.pending(),
+            'chats': len(self._pending)
+        }
+
+outbox = OutboundQueue()
@@ -9,7 +9,7 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database import db
+from database import adb
 from keyboards import main as kb_main
 from keyboards import inline as kb_inline
 from handlers.utils import (
@@ -39,7 +39,7 @@ async def profile_menu(message: Message, state: FSMContext):
     """Меню профиля пользователя"""
     await state.clear()
     
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Нажмите /start")
         return
@@ -57,7 +57,7 @@ async def profile_menu(message: Message, state: FSMContext):
 @router.message(F.text == "✏️ Редактировать профиль")
 async def edit_profile_menu(message: Message):
     """Меню редактирования профиля"""
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы")
         return
@@ -112,8 +112,8 @@ async def edit_phone_process(message: Message, state: FSMContext):
         formatted_phone = format_phone(phone)
         
         # Проверяем, не занят ли телефон другим пользователем
-        existing_user = db.get_user_by_phone(formatted_phone)
-        current_user = db.get_user(telegram_id=message.from_user.id)
+        existing_user = await adb.get_user_by_phone(formatted_phone)
+        current_user = await adb.get_user(telegram_id=message.from_user.id)
         
         if existing_user and existing_user['id'] != current_user['id']:
             await message.answer(
@@ -124,11 +124,11 @@ async def edit_phone_process(message: Message, state: FSMContext):
             return
         
         # Обновляем телефон в базе
-        success = db.update_user(current_user['id'], phone=formatted_phone)
+        success = await adb.update_user(current_user['id'], phone=formatted_phone)
         
         if success:
             # Логируем действие
-            log_user_action(current_user['id'], "phone_updated", f"Телефон изменен на: {formatted_phone}")
+            await log_user_action(current_user['id'], "phone_updated", f"Телефон изменен на: {formatted_phone}")
             
             await message.answer(
                 f"✅ <b>Номер телефона изменен!</b>\n\n"
@@ -192,13 +192,13 @@ async def edit_email_process(message: Message, state: FSMContext):
                 return
         
         # Обновляем email в базе
-        user = db.get_user(telegram_id=message.from_user.id)
-        success = db.update_user(user['id'], email=email)
+        user = await adb.get_user(telegram_id=message.from_user.id)
+        success = await adb.update_user(user['id'], email=email)
         
         if success:
             # Логируем действие
             action = "удален" if email is None else f"изменен на: {email}"
-            log_user_action(user['id'], "email_updated", f"Email {action}")
+            await log_user_action(user['id'], "email_updated", f"Email {action}")
             
             if email:
                 await message.answer(
@@ -235,7 +235,7 @@ async def edit_email_process(message: Message, state: FSMContext):
 @router.callback_query(F.data == "edit_car")
 async def edit_car_menu(callback: CallbackQuery):
     """Меню редактирования автомобиля"""
-    user = db.get_user(telegram_id=callback.from_user.id)
+    user = await adb.get_user(telegram_id=callback.from_user.id)
     if not user:
         await callback.answer("❌ Вы не зарегистрированы")
         return
@@ -369,8 +369,8 @@ async def process_car_data(message: Message, state: FSMContext):
                 car_model = None
         
         # Обновляем данные в базе
-        user = db.get_user(telegram_id=message.from_user.id)
-        success = db.update_user(
+        user = await adb.get_user(telegram_id=message.from_user.id)
+        success = await adb.update_user(
             user['id'],
             car_plate=car_plate,
             car_brand=car_brand,
@@ -380,7 +380,7 @@ async def process_car_data(message: Message, state: FSMContext):
         if success:
             # Логируем действие
             if car_plate is None:
-                log_user_action(user['id'], "car_deleted", "Автомобиль удален")
+                await log_user_action(user['id'], "car_deleted", "Автомобиль удален")
                 await message.answer(
                     "✅ <b>Автомобиль удален!</b>\n\n"
                     "Данные об автомобиле были удалены из вашего профиля.",
@@ -395,7 +395,7 @@ async def process_car_data(message: Message, state: FSMContext):
                         car_info += f" {car_model}"
                     car_info += f" ({car_plate})"
                 
-                log_user_action(user['id'], "car_updated", f"Автомобиль обновлен: {car_info}")
+                await log_user_action(user['id'], "car_updated", f"Автомобиль обновлен: {car_info}")
                 
                 await message.answer(
                     f"✅ <b>Данные автомобиля обновлены!</b>\n\n"
@@ -445,12 +445,12 @@ async def delete_car_confirm(callback: CallbackQuery):
 @router.callback_query(F.data == "confirm_delete_car")
 async def confirm_delete_car(callback: CallbackQuery):
     """Подтвержденное удаление автомобиля"""
-    user = db.get_user(telegram_id=callback.from_user.id)
+    user = await adb.get_user(telegram_id=callback.from_user.id)
     if not user:
         await callback.answer("❌ Вы не зарегистрированы")
         return
     
-    success = db.update_user(
+    success = await adb.update_user(
         user['id'],
         car_plate=None,
         car_brand=None,
@@ -458,7 +458,7 @@ async def confirm_delete_car(callback: CallbackQuery):
     )
     
     if success:
-        log_user_action(user['id'], "car_deleted", "Автомобиль удален")
+        await log_user_action(user['id'], "car_deleted", "Автомобиль удален")
         
         await callback.message.edit_text(
             "✅ <b>Автомобиль удален!</b>\n\n"
@@ -541,8 +541,8 @@ async def edit_card_process(message: Message, state: FSMContext):
             return
         
         # Обновляем данные в базе
-        user = db.get_user(telegram_id=message.from_user.id)
-        success = db.update_user(
+        user = await adb.get_user(telegram_id=message.from_user.id)
+        success = await adb.update_user(
             user['id'],
             card_number=card_number,
             bank=bank
@@ -551,14 +551,14 @@ async def edit_card_process(message: Message, state: FSMContext):
         if success:
             # Логируем действие
             if card_number is None:
-                log_user_action(user['id'], "card_deleted", "Банковская карта удалена")
+                await log_user_action(user['id'], "card_deleted", "Банковская карта удалена")
                 await message.answer(
                     "✅ <b>Банковская карта удалена!</b>\n\n"
                     "Данные карты были удалены из вашего профиля.",
                     reply_markup=kb_main.get_profile_menu()
                 )
             else:
-                log_user_action(user['id'], "card_updated", f"Карта обновлена: {masked_card}")
+                await log_user_action(user['id'], "card_updated", f"Карта обновлена: {masked_card}")
                 await message.answer(
                     f"✅ <b>Банковская карта обновлена!</b>\n\n"
                     f"Карта: {masked_card}\n"
@@ -595,15 +595,15 @@ async def process_bank(message: Message, state: FSMContext):
             return
         
         # Обновляем данные в базе
-        user = db.get_user(telegram_id=message.from_user.id)
-        success = db.update_user(
+        user = await adb.get_user(telegram_id=message.from_user.id)
+        success = await adb.update_user(
             user['id'],
             card_number=masked_card,
             bank=bank
         )
         
         if success:
-            log_user_action(user['id'], "card_updated", f"Карта обновлена: {masked_card}, банк: {bank}")
+            await log_user_action(user['id'], "card_updated", f"Карта обновлена: {masked_card}, банк: {bank}")
             
             await message.answer(
                 f"✅ <b>Банковская карта обновлена!</b>\n\n"
@@ -634,13 +634,13 @@ async def process_bank(message: Message, state: FSMContext):
 @router.message(F.text == "💰 Баланс")
 async def balance_menu(message: Message):
     """Меню баланса"""
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы")
         return
     
     # Получаем историю транзакций
-    transactions = db.get_user_payments(user['id'], as_payer=True, limit=5)
+    transactions = await adb.get_user_payments(user['id'], as_payer=True, limit=5)
     
     balance_text = f"💰 <b>Ваш баланс:</b> {format_price(user['balance'])} ₽\n\n"
     
@@ -758,13 +758,13 @@ async def add_money_process(message: Message, state: FSMContext):
 @router.message(F.text == "⭐ Мои отзывы")
 async def my_reviews(message: Message):
     """Мои отзывы"""
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы")
         return
     
     # Получаем отзывы пользователя
-    reviews = db.get_user_reviews(user['id'], as_reviewer=True, limit=10)
+    reviews = await adb.get_user_reviews(user['id'], as_reviewer=True, limit=10)
     
     if not reviews:
         await message.answer(
@@ -816,7 +816,7 @@ async def settings_menu(message: Message):
 @router.callback_query(F.data == "back_to_profile")
 async def back_to_profile(callback: CallbackQuery):
     """Вернуться к профилю"""
-    user = db.get_user(telegram_id=callback.from_user.id)
+    user = await adb.get_user(telegram_id=callback.from_user.id)
     if not user:
         await callback.answer("❌ Вы не зарегистрированы")
         return
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Ограничение частоты отправки сообщений
+"""
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+
+from config import Config
+
+class TokenBucket:
+    """Асинхронное ведро токенов.
+    
+    Токены пополняются со скоростью rate в секунду, но не больше capacity.
+    Ожидающие получают токены по очереди (FIFO через блокировку).
+    pause() останавливает выдачу целиком - так обрабатывается RetryAfter,
+    который Telegram возвращает на весь бот, а не на один запрос.
+    """
+    
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.pauses = 0
+    
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def delay(self, tokens: float = 1.0) -> float:
+        """Сколько секунд ждать, пока будут доступны tokens токенов"""
+        now = monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now + tokens / self.rate
+        self._refill(now)
+        return max(0.0, (tokens - self._tokens) / self.rate)
+    
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Получение токенов без ожидания"""
+        if self._lock.locked() or self.delay(tokens) > 0:
+            return False
+        self._tokens -= tokens
+        self.acquired += 1
+        return True
+    
+    async def acquire(self, tokens: float = 1.0):
+        """Ожидание и получение токенов"""
+        async with self._lock:
+            while True:
+                wait = self.delay(tokens)
+                if wait <= 0:
+                    self._tokens -= tokens
+                    self.acquired += 1
+                    return
+                await asyncio.sleep(wait)
+    
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов на seconds секунд"""
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+        self.pauses += 1
+
+class KeyedBuckets:
+    """Ведра токенов по ключу (например, по чату) с вытеснением давно неиспользуемых"""
+    
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+    
+    def get(self, key) -> TokenBucket:
+        """Ведро для ключа"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            # Вытесненное ведро было полным или почти полным: ключ давно не использовался
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+# Общий лимит Telegram на бота: его делят рассылки и очередь уведомлений
+telegram_bucket = TokenBucket(Config.TELEGRAM_GLOBAL_RATE, capacity=1)
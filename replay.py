@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение записанных обновлений через webhook для замера задержки обработки.
+
+Запись: бот в режиме webhook с WEBHOOK_RECORD_PATH дописывает каждое
+принятое обновление в файл JSON Lines. Воспроизведение идет по петле
+127.0.0.1: обновления отправляются HTTP-запросами на WebhookServer, ответы
+бота принимает faketelegram.FakeTelegramServer, в Telegram ничего не уходит.
+Запускать на копии базы данных:
+
+    DATABASE_PATH=/tmp/parking_copy.db python replay.py data/updates.jsonl --speed 0
+"""
+import argparse
+import asyncio
+import json
+import logging
+from time import monotonic
+from typing import Any, Dict, List
+
+import aiohttp
+
+from config import Config
+from bot import create_bot, create_dispatcher
+from faketelegram import FakeTelegramServer
+from webhook import UpdateRunner, WebhookServer
+
+logger = logging.getLogger(__name__)
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    """Чтение записанных обновлений"""
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def update_time(update: Dict[str, Any]) -> int:
+    """Время события обновления (секунды) для воспроизведения в исходном темпе"""
+    for event in update.values():
+        if isinstance(event, dict):
+            if 'date' in event:
+                return event['date']
+            message = event.get('message')
+            if isinstance(message, dict) and 'date' in message:
+                return message['date']
+    return 0
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль отсортированного списка"""
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+async def replay(updates: List[Dict[str, Any]], speed: float, api_port: int, webhook_port: int):
+    """Отправка обновлений на webhook и сбор времени обработки"""
+    fake = FakeTelegramServer(port=api_port)
+    await fake.start()
+    # Запросы бота идут на локальный сервер
+    Config.TELEGRAM_API_URL = fake.url
+    bot = create_bot()
+    dp = create_dispatcher()
+    runner = UpdateRunner(dp, bot)
+    server = WebhookServer(runner, host="127.0.0.1", port=webhook_port, path="/webhook", secret="")
+    
+    sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    handler_times: List[float] = []
+    
+    def on_done(update: Dict[str, Any], seconds: float):
+        handler_times.append(seconds)
+        started = sent_at.pop(update.get('update_id'), None)
+        if started is not None:
+            latencies.append(monotonic() - started)
+    
+    runner.on_done = on_done
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    await server.start()
+    
+    # Telegram держит не больше max_connections запросов к webhook одновременно
+    connections = asyncio.Semaphore(Config.WEBHOOK_MAX_CONNECTIONS)
+    url = f"http://127.0.0.1:{webhook_port}/webhook"
+    started = monotonic()
+    
+    async with aiohttp.ClientSession() as session:
+        async def post(update: Dict[str, Any]):
+            async with connections:
+                sent_at[update.get('update_id')] = monotonic()
+                async with session.post(url, json=update) as response:
+                    if response.status != 200:
+                        logger.warning(f"Обновление {update.get('update_id')}: HTTP {response.status}")
+        
+        requests = []
+        first_time = update_time(updates[0]) if updates else 0
+        for update in updates:
+            if speed > 0:
+                # Исходный темп: пауза до момента события с учетом ускорения
+                delay = (update_time(update) - first_time) / speed - (monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            requests.append(asyncio.create_task(post(update)))
+        await asyncio.gather(*requests)
+    
+    await server.stop()
+    elapsed = monotonic() - started
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    await bot.session.close()
+    await fake.stop()
+    
+    print(f"Обновлений: {len(updates)}, обработано {runner.processed}, ошибок {runner.failed}, "
+          f"за {elapsed:.2f} с ({len(updates) / elapsed:.0f} обн./с)")
+    print(f"Вызовов Bot API: {len(fake.calls)}")
+    for name, values in (("От запроса до конца обработки", latencies), ("Обработка", handler_times)):
+        if values:
+            values.sort()
+            print(f"{name}: p50 {percentile(values, 0.5) * 1000:.1f} мс, "
+                  f"p95 {percentile(values, 0.95) * 1000:.1f} мс, "
+                  f"p99 {percentile(values, 0.99) * 1000:.1f} мс, "
+                  f"макс {values[-1] * 1000:.1f} мс")
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    parser.add_argument("path", help="файл JSON Lines из WEBHOOK_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="ускорение относительно записи; 0 - без пауз")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    args = parser.parse_args()
+    
+    updates = load_updates(args.path)
+    asyncio.run(replay(updates, args.speed, args.api_port, args.webhook_port))
+
+if __name__ == "__main__":
+    main()
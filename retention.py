@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Хранение данных: удаление устаревших строк порциями по политикам таблиц
+и перенос архивных броней в холодный слой.
+
+Проход выполняет ведущий процесс бота раз в RETENTION_INTERVAL_HOURS.
+Вручную (при остановленном боте - перевод БД в инкрементальный VACUUM):
+
+    python retention.py run
+    python retention.py vacuum
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+from database import ARCHIVE_BOOKING_CONDITION, db, adb
+
+logger = logging.getLogger(__name__)
+
+# Настройка с временем последнего прохода: переживает перезапуск бота
+LAST_RUN_SETTING = "retention_last_run"
+
+# auto_vacuum = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+class RetentionPolicy:
+    """Политика хранения строк одной таблицы.
+    
+    Строка подпадает под политику, если выполняется condition; первый
+    параметр условия - граница cutoff() (по умолчанию сейчас минус days
+    дней, days = 0 отключает политику). Строки удаляются, а если задано
+    assignments - обновляются (так бронирования переводятся в архив, а
+    не удаляются). При archive удаляемые строки перед удалением
+    дописываются в сжатый файл. С utc граница считается от текущего
+    времени UTC: так хранится created_at (CURRENT_TIMESTAMP), а end_time
+    и expires_at - в местном времени.
+    """
+    
+    __slots__ = ('table', 'condition', 'days', 'assignments', 'archive', 'cutoff')
+    
+    def __init__(self, table: str, condition: str, days: float = None, assignments: str = None,
+                 archive: bool = False, cutoff: Callable[[], datetime] = None, utc: bool = False):
+        self.table = table
+        self.condition = condition
+        self.days = days
+        self.assignments = assignments
+        self.archive = archive and not assignments
+        clock = datetime.utcnow if utc else datetime.now
+        self.cutoff = cutoff or (lambda: clock() - timedelta(days=self.days))
+
+def default_policies() -> List[RetentionPolicy]:
+    """Политики по настройкам Config; срок 0 отключает политику"""
+    policies = [
+        RetentionPolicy('logs', "created_at < ?", Config.RETENTION_LOGS_DAYS, archive=True, utc=True),
+        # Непрочитанные и не доставленные уведомления не удаляются
+        RetentionPolicy('notifications', "(is_read = 1 OR delivered_at IS NOT NULL) AND created_at < ?",
+                        Config.RETENTION_NOTIFICATIONS_DAYS, archive=True, utc=True),
+        RetentionPolicy('bookings', "status = 'completed' AND end_time < ?",
+                        Config.RETENTION_BOOKINGS_DAYS, assignments="status = 'archived'"),
+        RetentionPolicy('stats_snapshots', "created_at < ?", Config.RETENTION_SNAPSHOTS_DAYS,
+                        archive=True, utc=True),
+        RetentionPolicy('admin_sessions', "expires_at < ?", cutoff=datetime.now),
+    ]
+    return [policy for policy in policies if policy.days != 0]
+
+class RetentionEngine:
+    """Проход по политикам хранения порциями.
+    
+    Каждая порция - не больше chunk_size строк: выбор идет на читателе
+    по возрастанию id (ключ предыдущей порции, без OFFSET), запись -
+    короткой транзакцией, между порциями цикл событий свободен pause_ms
+    миллисекунд. Так блокировка записи держится миллисекунды, а не
+    секунды, как при одном DELETE по всей таблице. Освободившиеся
+    страницы возвращаются файловой системе incremental_vacuum теми же
+    порциями, если БД в режиме auto_vacuum = INCREMENTAL.
+    
+    После политик архивные брони (status = 'archived', без ссылок из
+    отзывов, жалоб и движений баланса) вместе с платежами переносятся
+    в холодный слой теми же порциями.
+    """
+    
+    def __init__(self, policies: List[RetentionPolicy] = None, chunk_size: int = None,
+                 pause_ms: int = None, archive_dir: str = None):
+        self.policies = policies
+        self.chunk_size = chunk_size or Config.RETENTION_CHUNK_SIZE
+        self.pause = (Config.RETENTION_PAUSE_MS if pause_ms is None else pause_ms) / 1000
+        self.archive_dir = Path(archive_dir) if archive_dir else (
+            Path(Config.RETENTION_ARCHIVE_DIR) if Config.RETENTION_ARCHIVE_DIR else None)
+        self._lock = asyncio.Lock()
+        self._vacuum_warned = False
+        self.runs = 0
+        self.last: Optional[Dict[str, Any]] = None
+    
+    # ==================== ПРОХОД ====================
+    
+    async def run(self) -> Dict[str, Any]:
+        """Проход по всем политикам и возврат свободного места"""
+        async with self._lock:
+            started = monotonic()
+            tables = {}
+            for policy in self.policies or default_policies():
+                tables[policy.table] = await self._apply(policy)
+            tables['cold_bookings'] = await self._move_to_archive()
+            vacuumed = await self.vacuum()
+            await adb.set_setting(LAST_RUN_SETTING, datetime.now().isoformat())
+            
+            report = {
+                'tables': tables,
+                'vacuumed_pages': vacuumed,
+                'duration': monotonic() - started
+            }
+            self.runs += 1
+            self.last = report
+        summary = ", ".join(f"{table} {count}" for table, count in tables.items() if count)
+        logger.info(f"🧹 Очистка данных за {report['duration']:.1f} с: {summary or 'нечего удалять'}"
+                    f"{f', возвращено страниц {vacuumed}' if vacuumed else ''}")
+        return report
+    
+    async def _apply(self, policy: RetentionPolicy) -> int:
+        """Применение политики порциями; возвращает число затронутых строк"""
+        params = (policy.cutoff(),)
+        columns = "*" if policy.archive and self.archive_dir else "id"
+        after_id = 0
+        affected = 0
+        while True:
+            rows = await adb.get_retention_chunk(policy.table, policy.condition, params,
+                                                 after_id, self.chunk_size, columns)
+            if not rows:
+                break
+            after_id = rows[-1]['id']
+            if columns == "*":
+                await asyncio.to_thread(self._archive, policy.table, rows)
+            
+            count = await adb.apply_retention(policy.table, [row['id'] for row in rows],
+                                              policy.condition, params, policy.assignments)
+            if count is None:
+                break
+            affected += count
+            await asyncio.sleep(self.pause)
+        return affected
+    
+    async def _move_to_archive(self) -> int:
+        """Перенос архивных броней в холодный слой порциями; возвращает их число"""
+        after_id = 0
+        moved = 0
+        while True:
+            rows = await adb.get_retention_chunk('bookings', ARCHIVE_BOOKING_CONDITION, (),
+                                                 after_id, self.chunk_size)
+            if not rows:
+                break
+            after_id = rows[-1]['id']
+            count = await adb.archive_bookings([row['id'] for row in rows])
+            if count is None:
+                break
+            moved += count
+            await asyncio.sleep(self.pause)
+        return moved
+    
+    def _archive(self, table: str, rows: List[Dict[str, Any]]):
+        """Дописывание строк в архив таблицы за текущий день (JSON Lines, gzip).
+        
+        Каждая порция - отдельный член gzip: файл читается целиком обычным
+        gzip. Архив пишется до удаления: при сбое строка может попасть в
+        него дважды, но не потеряется.
+        """
+        directory = self.archive_dir / table
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{table}_{datetime.now().strftime('%Y%m%d')}.jsonl.gz"
+        lines = "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows)
+        with gzip.open(path, "ab", compresslevel=Config.BACKUP_COMPRESSION_LEVEL) as file:
+            file.write(lines.encode("utf-8"))
+    
+    # ==================== СВОБОДНОЕ МЕСТО ====================
+    
+    async def vacuum(self) -> int:
+        """Возврат свободных страниц порциями; возвращает их количество"""
+        info = await adb.get_vacuum_info()
+        if info['auto_vacuum'] != AUTO_VACUUM_INCREMENTAL:
+            if info['freelist_count'] >= Config.RETENTION_VACUUM_MIN_PAGES and not self._vacuum_warned:
+                self._vacuum_warned = True
+                logger.warning(f"⚠️ В БД {info['freelist_count']} свободных страниц, но auto_vacuum выключен: "
+                               f"выполните python retention.py vacuum при остановленном боте")
+            return 0
+        if info['freelist_count'] < Config.RETENTION_VACUUM_MIN_PAGES:
+            return 0
+        
+        freed = 0
+        while True:
+            pages = await adb.incremental_vacuum(Config.RETENTION_VACUUM_PAGES)
+            freed += pages
+            if pages < Config.RETENTION_VACUUM_PAGES:
+                break
+            await asyncio.sleep(self.pause)
+        return freed
+    
+    async def is_due(self, interval_hours: float = None) -> bool:
+        """Пора ли выполнять проход: по времени прошлого прохода в настройках"""
+        interval_hours = Config.RETENTION_INTERVAL_HOURS if interval_hours is None else interval_hours
+        if interval_hours <= 0:
+            return False
+        last_run = await adb.get_setting(LAST_RUN_SETTING)
+        if not last_run:
+            return True
+        try:
+            return datetime.now() - datetime.fromisoformat(last_run) >= timedelta(hours=interval_hours)
+        except ValueError:
+            return True
+    
+    def stats(self) -> Dict[str, Any]:
+        """Итоги последнего прохода"""
+        return {
+            'runs': self.runs,
+            'last_duration': self.last['duration'] if self.last else None,
+            'last_tables': self.last['tables'] if self.last else {}
+        }
+
+retention = RetentionEngine()
+
+def main():
+    parser = argparse.ArgumentParser(description="Очистка устаревших данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="выполнить проход по политикам хранения")
+    commands.add_parser("vacuum", help="перевести БД в auto_vacuum = INCREMENTAL (бот должен быть остановлен)")
+    args = parser.parse_args()
+    
+    if args.command == "run":
+        report = asyncio.run(retention.run())
+        for table, count in report['tables'].items():
+            print(f"{table}: {count}")
+        print(f"Возвращено страниц: {report['vacuumed_pages']}, за {report['duration']:.2f} с")
+    elif args.command == "vacuum":
+        if not db.enable_incremental_vacuum():
+            raise SystemExit("VACUUM не выполнен")
+        print("БД переведена в auto_vacuum = INCREMENTAL")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Планировщик сроков бронирований
+"""
+import asyncio
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from database import db, adb
+from availability import to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Типы сроков
+COMPLETE = "complete"        # завершение активной брони в end_time
+AUTO_CANCEL = "auto_cancel"  # отмена неоплаченной заявки
+
+# Верхняя граница сна: защита от перевода системных часов
+MAX_SLEEP_SECONDS = 60
+
+# Повтор сроков, которые обработчик не выполнил: пауза удваивается от
+# первой до последней, после RETRY_MAX_ATTEMPTS попыток срок вернет resync()
+RETRY_FIRST_SECONDS = 5
+RETRY_MAX_SECONDS = 300
+RETRY_MAX_ATTEMPTS = 6
+
+def booking_deadlines(booking: Dict) -> Dict[str, datetime]:
+    """Сроки, которые действуют для брони в ее текущем состоянии"""
+    deadlines = {}
+    if booking['status'] == 'active':
+        deadlines[COMPLETE] = to_datetime(booking['end_time'])
+    if booking['status'] == 'pending' and booking.get('payment_status') == 'pending':
+        deadlines[AUTO_CANCEL] = (to_datetime(booking['created_at'])
+                                  + timedelta(hours=int(Config.AUTO_CANCEL_HOURS)))
+    return deadlines
+
+class BookingScheduler:
+    """Очередь сроков на куче.
+    
+    Сроки загружаются из БД при старте, затем обновляются подпиской на
+    изменения бронирований. Устаревшие записи кучи не удаляются сразу,
+    а пропускаются при извлечении (сверка со словарем _due).
+    
+    Обработчик возвращает id броней, которые он перевел, или None при
+    ошибке. Остальные сроки пачки ставятся заново с нарастающей паузой:
+    временная ошибка БД (занятая блокировка записи) не теряет срок до
+    перезапуска. resync() периодически сверяет очередь с БД.
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str, int]] = []
+        self._due: Dict[Tuple[str, int], datetime] = {}
+        self._handlers: Dict[str, Callable[[List[int]], Awaitable[Optional[List[int]]]]] = {}
+        self._attempts: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+        self.retried = 0
+    
+    def register(self, kind: str, handler: Callable[[List[int]], Awaitable[Optional[List[int]]]]):
+        """Регистрация обработчика срока: получает список наступивших броней,
+        возвращает id выполненных или None при ошибке"""
+        self._handlers[kind] = handler
+    
+    def schedule(self, kind: str, booking_id: int, due: datetime):
+        """Постановка или перенос срока"""
+        with self._lock:
+            if self._due.get((kind, booking_id)) == due:
+                return
+            self._due[(kind, booking_id)] = due
+            heapq.heappush(self._heap, (due, kind, booking_id))
+        self._notify()
+    
+    def cancel(self, kind: str, booking_id: int):
+        """Отмена срока"""
+        with self._lock:
+            self._due.pop((kind, booking_id), None)
+            self._attempts.pop((kind, booking_id), None)
+    
+    def _retry(self, kind: str, booking_ids: List[int]):
+        """Повторная постановка невыполненных сроков с нарастающей паузой"""
+        now = datetime.now()
+        dropped = 0
+        with self._lock:
+            for booking_id in booking_ids:
+                key = (kind, booking_id)
+                # Срок уже поставлен заново изменением брони
+                if key in self._due:
+                    continue
+                attempt = self._attempts.get(key, 0) + 1
+                if attempt > RETRY_MAX_ATTEMPTS:
+                    self._attempts.pop(key, None)
+                    dropped += 1
+                    continue
+                self._attempts[key] = attempt
+                delay = min(RETRY_FIRST_SECONDS * 2 ** (attempt - 1), RETRY_MAX_SECONDS)
+                due = now + timedelta(seconds=delay)
+                self._due[key] = due
+                heapq.heappush(self._heap, (due, kind, booking_id))
+                self.retried += 1
+        if dropped:
+            logger.warning(f"⚠️ Сроки {kind} не выполнены после {RETRY_MAX_ATTEMPTS} попыток: "
+                           f"{dropped} броней, их вернет сверка с БД")
+    
+    def _done(self, kind: str, booking_ids: List[int]):
+        """Сброс счетчиков попыток выполненных сроков"""
+        with self._lock:
+            for booking_id in booking_ids:
+                self._attempts.pop((kind, booking_id), None)
+    
+    def on_booking_changed(self, booking: Dict):
+        """Пересчет сроков брони; вызывается из потока БД после коммита"""
+        deadlines = booking_deadlines(booking)
+        for kind in (COMPLETE, AUTO_CANCEL):
+            if kind in deadlines:
+                self.schedule(kind, booking['id'], deadlines[kind])
+            else:
+                self.cancel(kind, booking['id'])
+    
+    def _notify(self):
+        """Пробуждение цикла: ближайший срок мог измениться"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def _next_due(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+    
+    def _pop_due(self, now: datetime) -> Dict[str, List[int]]:
+        """Извлечение всех наступивших сроков, сгруппированных по типу"""
+        result = defaultdict(list)
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, kind, booking_id = heapq.heappop(self._heap)
+                if self._due.get((kind, booking_id)) != due:
+                    continue  # срок отменен или перенесен
+                del self._due[(kind, booking_id)]
+                result[kind].append(booking_id)
+        return result
+    
+    def pending(self) -> int:
+        """Количество запланированных сроков"""
+        with self._lock:
+            return len(self._due)
+    
+    async def start(self):
+        """Восстановление очереди из БД и запуск цикла"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        
+        # Подписка раньше загрузки: изменения во время загрузки не потеряются
+        db.add_booking_listener(self.on_booking_changed)
+        await self.resync()
+        
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"⏰ Планировщик запущен, сроков в очереди: {self.pending()}")
+    
+    async def resync(self) -> int:
+        """Сверка очереди с БД: сроки незавершенных броней ставятся заново.
+        
+        Уже запланированные сроки не меняются; срок, потерянный после
+        сбоев обработчика, возвращается, и если он прошел - выполняется
+        сразу. Возвращает количество возвращенных сроков.
+        """
+        bookings = await adb.get_booking_deadlines()
+        restored = 0
+        for booking in bookings:
+            for kind, due in booking_deadlines(booking).items():
+                with self._lock:
+                    if (kind, booking['id']) in self._due:
+                        continue
+                self.schedule(kind, booking['id'], due)
+                restored += 1
+        return restored
+    
+    async def stop(self):
+        """Остановка цикла; при следующем запуске сроки загрузятся заново"""
+        db.remove_booking_listener(self.on_booking_changed)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            self._heap = []
+            self._due = {}
+            self._attempts = {}
+    
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                next_due = self._next_due()
+                timeout = MAX_SLEEP_SECONDS
+                if next_due is not None:
+                    timeout = min(timeout, max(0.0, (next_due - datetime.now()).total_seconds()))
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                
+                # После простоя наступившие сроки приходят пачкой
+                for kind, booking_ids in self._pop_due(datetime.now()).items():
+                    handler = self._handlers.get(kind)
+                    if handler is None:
+                        continue
+                    try:
+                        done = await handler(booking_ids)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка обработки сроков {kind} ({len(booking_ids)} броней): {e}")
+                        done = None
+                    done = set(done or ())
+                    self.fired += len(done)
+                    self._done(kind, list(done))
+                    # Невыполненные сроки - повторно, пока бронь не изменится
+                    self._retry(kind, [booking_id for booking_id in booking_ids if booking_id not in done])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка в планировщике: {e}")
+                await asyncio.sleep(1)
+
+scheduler = BookingScheduler()
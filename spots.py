@@ -9,7 +9,7 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database import db
+from database import adb
 from keyboards import main as kb_main
 from keyboards import inline as kb_inline
 from handlers.utils import (
@@ -41,13 +41,13 @@ async def my_spots(message: Message, state: FSMContext):
     """Показать меню мест пользователя"""
     await state.clear()
     
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Нажмите /start")
         return
     
     # Получаем места пользователя
-    spots = db.get_user_spots(user['id'])
+    spots = await adb.get_user_spots(user['id'])
     
     if not spots:
         await message.answer(
@@ -89,13 +89,13 @@ async def my_spots(message: Message, state: FSMContext):
 @router.message(F.text == "➕ Добавить место")
 async def add_spot_start(message: Message, state: FSMContext):
     """Начало добавления нового места"""
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Нажмите /start")
         return
     
     # Проверяем лимит мест
-    spots_count = db.count_spots(owner_id=user['id'], is_active=True)
+    spots_count = await adb.count_spots(owner_id=user['id'], is_active=True)
     if spots_count >= 10:
         await message.answer(
             "❌ <b>Достигнут лимит мест!</b>\n\n"
@@ -313,7 +313,7 @@ async def toggle_feature(callback: CallbackQuery, state: FSMContext):
 async def finish_spot_creation(callback: CallbackQuery, state: FSMContext):
     """Завершение создания места"""
     try:
-        user = db.get_user(telegram_id=callback.from_user.id)
+        user = await adb.get_user(telegram_id=callback.from_user.id)
         if not user:
             await callback.answer("❌ Ошибка: пользователь не найден")
             return
@@ -333,7 +333,7 @@ async def finish_spot_creation(callback: CallbackQuery, state: FSMContext):
         price_per_day = price_per_hour * 24
         
         # Добавляем место в базу
-        spot_id = db.add_parking_spot(
+        spot_id = await adb.add_parking_spot(
             owner_id=user['id'],
             spot_number=data['spot_number'],
             address=data['address'],
@@ -363,7 +363,7 @@ async def finish_spot_creation(callback: CallbackQuery, state: FSMContext):
             )
             
             # Логируем действие
-            log_user_action(user['id'], "spot_created", f"Создано место #{data['spot_number']}")
+            await log_user_action(user['id'], "spot_created", f"Создано место #{data['spot_number']}")
             
             # Показываем меню мест
             await callback.message.answer(
@@ -397,14 +397,14 @@ async def view_spot(callback: CallbackQuery):
     """Просмотр детальной информации о месте"""
     try:
         spot_id = int(callback.data.split("_")[2])
-        spot = db.get_parking_spot(spot_id)
+        spot = await adb.get_parking_spot(spot_id)
         
         if not spot:
             await callback.answer("❌ Место не найдено")
             return
         
         # Проверяем, владелец ли это места
-        user = db.get_user(telegram_id=callback.from_user.id)
+        user = await adb.get_user(telegram_id=callback.from_user.id)
         is_owner = user and spot['owner_id'] == user['id']
         
         if not is_owner:
@@ -434,12 +434,12 @@ async def view_spot(callback: CallbackQuery):
 @router.message(F.text == "📅 Управление расписанием")
 async def manage_schedule_menu(message: Message):
     """Меню управления расписанием"""
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы")
         return
     
-    spots = db.get_user_spots(user['id'])
+    spots = await adb.get_user_spots(user['id'])
     
     if not spots:
         await message.answer(
@@ -470,19 +470,19 @@ async def spot_schedule(callback: CallbackQuery):
     """Расписание конкретного места"""
     spot_id = int(callback.data.split("_")[2])
     
-    spot = db.get_parking_spot(spot_id)
+    spot = await adb.get_parking_spot(spot_id)
     if not spot:
         await callback.answer("❌ Место не найдено")
         return
     
     # Проверяем права доступа
-    user = db.get_user(telegram_id=callback.from_user.id)
+    user = await adb.get_user(telegram_id=callback.from_user.id)
     if not user or spot['owner_id'] != user['id']:
         await callback.answer("❌ Нет доступа")
         return
     
     # Получаем расписание
-    schedule = db.get_spot_availability(spot_id)
+    schedule = await adb.get_spot_availability(spot_id)
     
     # Создаем клавиатуру для управления расписанием
     keyboard = kb_inline.InlineKeyboardBuilder()
@@ -535,12 +535,12 @@ async def spot_schedule(callback: CallbackQuery):
 @router.message(F.text == "💰 Статистика доходов")
 async def income_stats(message: Message):
     """Статистика доходов от всех мест"""
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы")
         return
     
-    spots = db.get_user_spots(user['id'])
+    spots = await adb.get_owner_income(user['id'], period_days=30)
     
     if not spots:
         await message.answer(
@@ -552,26 +552,28 @@ async def income_stats(message: Message):
     
     # Считаем общую статистику
     total_spots = len(spots)
-    total_earnings = sum(spot.get('total_earnings', 0) for spot in spots)
-    total_bookings = sum(spot.get('total_bookings', 0) for spot in spots)
+    total_earnings = sum(spot['total_earnings'] for spot in spots)
+    total_bookings = sum(spot['total_bookings'] for spot in spots)
+    period_earnings = sum(spot['period_earnings'] for spot in spots)
     
     # Формируем отчет
     text = f"💰 <b>Статистика доходов</b>\n\n"
     text += f"👤 Владелец: {user['full_name']}\n"
     text += f"🏠 Всего мест: {total_spots}\n"
     text += f"📊 Всего бронирований: {total_bookings}\n"
-    text += f"💵 Общий доход: {format_price(total_earnings)} ₽\n\n"
+    text += f"💵 Общий доход: {format_price(total_earnings)} ₽\n"
+    text += f"📅 За 30 дней: {format_price(period_earnings)} ₽\n\n"
     
     # Добавляем статистику по каждому месту
     text += "<b>📈 По местам:</b>\n\n"
     
     for spot in spots[:10]:  # Ограничиваем 10 местами
-        earnings = spot.get('total_earnings', 0)
+        earnings = spot['total_earnings']
         if earnings > 0:
             text += f"🏠 <b>#{spot['spot_number']}</b>\n"
             text += f"   📍 {spot['address'][:40]}...\n"
             text += f"   💰 {format_price(earnings)} ₽\n"
-            text += f"   📊 {spot.get('total_bookings', 0)} бронирований\n\n"
+            text += f"   📊 {spot['total_bookings']} бронирований\n\n"
     
     if total_spots > 10:
         text += f"\n<i>... и еще {total_spots - 10} мест</i>\n"
@@ -588,13 +590,13 @@ async def delete_spot_confirm(callback: CallbackQuery):
     """Подтверждение удаления места"""
     spot_id = int(callback.data.split("_")[2])
     
-    spot = db.get_parking_spot(spot_id)
+    spot = await adb.get_parking_spot(spot_id)
     if not spot:
         await callback.answer("❌ Место не найдено")
         return
     
     # Проверяем права доступа
-    user = db.get_user(telegram_id=callback.from_user.id)
+    user = await adb.get_user(telegram_id=callback.from_user.id)
     if not user or spot['owner_id'] != user['id']:
         await callback.answer("❌ Нет доступа")
         return
@@ -627,19 +629,19 @@ async def confirm_delete_spot(callback: CallbackQuery):
     """Подтвержденное удаление места"""
     spot_id = int(callback.data.split("_")[2])
     
-    spot = db.get_parking_spot(spot_id)
+    spot = await adb.get_parking_spot(spot_id)
     if not spot:
         await callback.answer("❌ Место не найдено")
         return
     
     # Проверяем права доступа
-    user = db.get_user(telegram_id=callback.from_user.id)
+    user = await adb.get_user(telegram_id=callback.from_user.id)
     if not user or spot['owner_id'] != user['id']:
         await callback.answer("❌ Нет доступа")
         return
     
     # Удаляем место (мягкое удаление)
-    success = db.delete_spot(spot_id)
+    success = await adb.delete_spot(spot_id)
     
     if success:
         await callback.message.edit_text(
@@ -649,7 +651,7 @@ async def confirm_delete_spot(callback: CallbackQuery):
         )
         
         # Логируем действие
-        log_user_action(user['id'], "spot_deleted", f"Удалено место #{spot['spot_number']}")
+        await log_user_action(user['id'], "spot_deleted", f"Удалено место #{spot['spot_number']}")
         
         # Показываем меню мест
         await callback.message.answer(
@@ -12,7 +12,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from config import Config
-from database import db
+from database import adb
 from keyboards import main as kb_main
 from handlers.utils import (
     validate_phone, format_phone, validate_email, validate_card_number,
@@ -52,7 +52,7 @@ async def cmd_start(message: Message, state: FSMContext):
         logger.info(f"Пользователь {user_id} ({full_name}) начал работу с ботом")
         
         # Проверяем, зарегистрирован ли пользователь
-        user = db.get_user(telegram_id=user_id)
+        user = await adb.get_user(telegram_id=user_id)
         
         if user:
             # Пользователь уже зарегистрирован
@@ -126,7 +126,7 @@ async def process_phone(message: Message, state: FSMContext):
         formatted_phone = format_phone(phone)
         
         # Проверяем, не занят ли телефон
-        existing_user = db.get_user_by_phone(formatted_phone)
+        existing_user = await adb.get_user_by_phone(formatted_phone)
         if existing_user:
             await message.answer(
                 "❌ <b>Этот телефон уже зарегистрирован!</b>\n\n"
@@ -219,7 +219,7 @@ async def process_bank(message: Message, state: FSMContext):
         user_data = await state.get_data()
         
         # Регистрируем пользователя
-        user_id = db.register_user(
+        user_id = await adb.register_user(
             telegram_id=user_data['telegram_id'],
             full_name=user_data['full_name'],
             phone=user_data['phone'],
@@ -250,7 +250,7 @@ async def complete_registration(message: Message, state: FSMContext, user_id: in
     """Завершение регистрации"""
     try:
         # Получаем полную информацию о пользователе
-        user = db.get_user(user_id=user_id)
+        user = await adb.get_user(user_id=user_id)
         
         # Формируем сообщение о успешной регистрации
         success_text = (
@@ -276,7 +276,7 @@ async def complete_registration(message: Message, state: FSMContext, user_id: in
         )
         
         # Логируем регистрацию
-        log_user_action(user_id, "registration_complete", f"Пользователь зарегистрирован: {user['full_name']}")
+        await log_user_action(user_id, "registration_complete", f"Пользователь зарегистрирован: {user['full_name']}")
         
         # Уведомляем администраторов
         await notify_admins_about_event(
@@ -317,7 +317,7 @@ async def show_main_menu(message: Message = None):
         user_id = message.from_user.id
         
         # Получаем информацию о пользователе
-        user = db.get_user(telegram_id=user_id)
+        user = await adb.get_user(telegram_id=user_id)
         
         if not user:
             # Пользователь не найден, предлагаем зарегистрироваться
@@ -337,7 +337,7 @@ async def show_main_menu(message: Message = None):
             return
         
         # Обновляем время последней активности
-        db.update_user(user['id'], last_active=datetime.now())
+        await adb.update_user(user['id'], last_active=datetime.now())
         
         # Формируем приветственное сообщение
         welcome_text = (
@@ -346,12 +346,12 @@ async def show_main_menu(message: Message = None):
         )
         
         # Добавляем информацию о бронированиях
-        active_bookings = db.count_bookings(user_id=user['id'], status='active')
+        active_bookings = await adb.count_bookings(user_id=user['id'], status='active')
         if active_bookings > 0:
             welcome_text += f"📋 Активных бронирований: <b>{active_bookings}</b>\n"
         
         # Добавляем информацию о местах
-        user_spots = db.get_user_spots(user['id'])
+        user_spots = await adb.get_user_spots(user['id'])
         if user_spots:
             welcome_text += f"🏠 Ваших мест: <b>{len(user_spots)}</b>\n"
         
@@ -360,7 +360,7 @@ async def show_main_menu(message: Message = None):
         # Отправляем сообщение с динамической клавиатурой
         await message.answer(
             welcome_text,
-            reply_markup=kb_main.get_main_menu(telegram_id=user_id, is_admin=db.is_admin_user(user_id))
+            reply_markup=kb_main.get_main_menu(telegram_id=user_id, is_admin=await adb.is_admin_user(user_id))
         )
         
     except Exception as e:
@@ -379,7 +379,7 @@ async def cmd_admin(message: Message, state: FSMContext, command: CommandObject)
         user_id = message.from_user.id
         
         # Проверяем, не является ли пользователь уже админом
-        if db.is_admin_user(user_id):
+        if await adb.is_admin_user(user_id):
             await message.answer(
                 "👑 <b>Вы уже администратор!</b>\n\n"
                 "Используйте кнопку '⚙️ Админ-панель' в главном меню.",
@@ -388,7 +388,7 @@ async def cmd_admin(message: Message, state: FSMContext, command: CommandObject)
             return
         
         # Если пользователь не зарегистрирован
-        user = db.get_user(telegram_id=user_id)
+        user = await adb.get_user(telegram_id=user_id)
         if not user:
             await message.answer(
                 "❌ <b>Для входа в админ-панель нужно быть зарегистрированным пользователем!</b>\n\n"
@@ -397,7 +397,7 @@ async def cmd_admin(message: Message, state: FSMContext, command: CommandObject)
             return
         
         # Проверяем активную сессию
-        session = db.get_admin_session(user['id'])
+        session = await adb.get_admin_session(user['id'])
         if session and datetime.fromisoformat(session['expires_at']) > datetime.now():
             await message.answer(
                 "✅ <b>У вас уже есть активная админ-сессия!</b>\n\n"
@@ -435,9 +435,9 @@ async def process_admin_password_with_args(message: Message, state: FSMContext,
     """Обработка пароля из аргументов команды /admin"""
     try:
         # Проверяем пароль
-        if db.check_admin_password(password):
+        if await adb.check_admin_password(password):
             # Создаем админ-сессию на 24 часа
-            session_token = db.create_admin_session(user['id'], expires_hours=24)
+            session_token = await adb.create_admin_session(user['id'], expires_hours=24)
             
             if session_token:
                 await message.answer(
@@ -448,13 +448,13 @@ async def process_admin_password_with_args(message: Message, state: FSMContext,
                 )
                 
                 # Логируем вход
-                log_user_action(user['id'], "admin_login", f"Вход в админ-панель по паролю (аргументы)")
+                await log_user_action(user['id'], "admin_login", f"Вход в админ-панель по паролю (аргументы)")
                 
                 # Уведомляем всех постоянных админов
-                admins = db.get_all_users(is_admin=True)
+                admins = await adb.get_all_users(is_admin=True)
                 for admin in admins:
                     if admin['telegram_id'] != message.from_user.id:
-                        db.add_notification(
+                        await adb.add_notification(
                             admin['id'],
                             "admin_login",
                             "📢 Вход в админ-панель",
@@ -506,7 +506,7 @@ async def process_admin_password(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        user = db.get_user(user_id=user_id)
+        user = await adb.get_user(user_id=user_id)
         if not user:
             await message.answer(
                 "❌ Пользователь не найден.",
@@ -516,9 +516,9 @@ async def process_admin_password(message: Message, state: FSMContext):
             return
         
         # Проверяем пароль
-        if db.check_admin_password(password):
+        if await adb.check_admin_password(password):
             # Создаем админ-сессию на 24 часа
-            session_token = db.create_admin_session(user_id, expires_hours=24)
+            session_token = await adb.create_admin_session(user_id, expires_hours=24)
             
             if session_token:
                 await message.answer(
@@ -529,13 +529,13 @@ async def process_admin_password(message: Message, state: FSMContext):
                 )
                 
                 # Логируем вход
-                log_user_action(user_id, "admin_login", f"Вход в админ-панель по паролю")
+                await log_user_action(user_id, "admin_login", f"Вход в админ-панель по паролю")
                 
                 # Уведомляем всех постоянных админов
-                admins = db.get_all_users(is_admin=True)
+                admins = await adb.get_all_users(is_admin=True)
                 for admin in admins:
                     if admin['telegram_id'] != message.from_user.id:
-                        db.add_notification(
+                        await adb.add_notification(
                             admin['id'],
                             "admin_login",
                             "📢 Вход в админ-панель",
@@ -574,13 +574,13 @@ async def process_admin_password(message: Message, state: FSMContext):
 async def cmd_admin_logout(message: Message):
     """Выход из админ-панели (завершение сессии)"""
     try:
-        user = db.get_user(telegram_id=message.from_user.id)
+        user = await adb.get_user(telegram_id=message.from_user.id)
         if not user:
             await message.answer("❌ Вы не зарегистрированы.")
             return
         
         # Удаляем сессию
-        success = db.delete_admin_session(user['id'])
+        success = await adb.delete_admin_session(user['id'])
         
         if success:
             await message.answer(
@@ -591,7 +591,7 @@ async def cmd_admin_logout(message: Message):
             )
             
             # Логируем выход
-            log_user_action(user['id'], "admin_logout", "Выход из админ-панели")
+            await log_user_action(user['id'], "admin_logout", "Выход из админ-панели")
         else:
             await message.answer(
                 "ℹ️ <b>У вас нет активной админ-сессии</b>\n\n"
@@ -631,7 +631,7 @@ async def cancel_button(message: Message, state: FSMContext):
 async def handle_unknown(message: Message, state: FSMContext):
     """Обработчик неизвестных сообщений"""
     # Проверяем, зарегистрирован ли пользователь
-    user = db.get_user(telegram_id=message.from_user.id)
+    user = await adb.get_user(telegram_id=message.from_user.id)
     
     if not user:
         # Пользователь не зарегистрирован
@@ -656,5 +656,5 @@ async def handle_unknown(message: Message, state: FSMContext):
         "/start - Главное меню\n"
         "/admin - Вход в админ-панель\n"
         "/admin_logout - Выход из админ-панели",
-        reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, is_admin=db.is_admin_user(message.from_user.id))
+        reply_markup=kb_main.get_main_menu(telegram_id=message.from_user.id, is_admin=await adb.is_admin_user(message.from_user.id))
     )
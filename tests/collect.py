@@ -0,0 +1,15 @@
+"""
+Сбор тестов из корня репозитория
+"""
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collect_directory(path, parent):
+    """Корень - каталог, а не пакет: его __init__.py импортирует отсутствующие модули"""
+    if path == ROOT:
+        return pytest.Dir.from_parent(parent, path=path)
+    return None
@@ -0,0 +1,34 @@
+"""
+Общие настройки тестов: база данных во временном каталоге
+"""
+import os
+import tempfile
+
+import pytest
+
+# Глобальный db создается при импорте database: до импорта направляем его
+# во временный файл, чтобы тесты не трогали рабочую базу
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="parking_tests_"), "global.db")
+
+@pytest.fixture
+def database(tmp_path):
+    """Отдельная пустая БД на тест"""
+    from database import Database
+    instance = Database(str(tmp_path / "test.db"))
+    yield instance
+    instance.close()
+
+def add_user(connection, telegram_id: int) -> int:
+    """Пользователь с минимальным набором полей"""
+    return connection.execute(
+        "INSERT INTO users (telegram_id, full_name, phone) VALUES (?, ?, ?)",
+        (telegram_id, f"User {telegram_id}", f"+7900{telegram_id:07d}")
+    ).lastrowid
+
+def add_spot(connection, owner_id: int) -> int:
+    """Место с ценами по умолчанию"""
+    return connection.execute(
+        "INSERT INTO parking_spots (owner_id, spot_number, address, price_per_hour, price_per_day) "
+        "VALUES (?, 'A1', 'Test street 1', 100, 1000)",
+        (owner_id,)
+    ).lastrowid
@@ -0,0 +1,50 @@
+"""
+Буфер журнала действий: неудачная запись не теряет записи
+"""
+import sqlite3
+
+from auditlog import AuditLogBuffer
+
+def test_writer_exception_requeues_batch():
+    written = []
+    calls = []
+    
+    def writer(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        written.extend(rows)
+        return True
+    
+    buffer = AuditLogBuffer(writer, capacity=100)
+    buffer._closed = True  # без фонового потока: пишем только вручную
+    buffer.extend([(n,) for n in range(3)])
+    
+    assert buffer.flush() == 0
+    assert len(buffer) == 3
+    buffer.append((3,))
+    assert buffer.flush() == 4
+    assert written == [(0,), (1,), (2,), (3,)]
+    stats = buffer.stats()
+    assert (stats['failures'], stats['dropped'], stats['written']) == (1, 0, 4)
+
+def test_locked_database_keeps_entries(database):
+    # Фоновый поток остановлен: записи пишутся только вызовами flush_logs
+    database.audit_log.close()
+    before = database.audit_log.stats()['written']
+    competitor = sqlite3.connect(str(database.db_path), isolation_level=None)
+    try:
+        with database.writer() as connection:
+            connection.execute("PRAGMA busy_timeout = 50")
+        competitor.execute("BEGIN IMMEDIATE")
+        database.add_log(None, "locked", "запись при занятой БД")
+        assert database.flush_logs() == 0
+        assert len(database.audit_log) == 1
+    finally:
+        competitor.execute("ROLLBACK")
+        competitor.close()
+    
+    assert database.flush_logs() == 1
+    stats = database.audit_log.stats()
+    assert stats['written'] - before == 1 and stats['dropped'] == 0 and stats['failures'] >= 1
+    assert [row['action'] for row in database.get_logs(action="locked")] == ["locked"]
@@ -0,0 +1,73 @@
+"""
+Конкурентное бронирование одного места через AsyncDatabase
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from database import AsyncDatabase
+
+from conftest import add_spot, add_user
+
+RENTERS = 30
+
+def seed(database):
+    """Владелец, место и арендаторы; у каждого арендатора свой период с общим часом"""
+    with database.transaction() as connection:
+        owner_id = add_user(connection, 100000)
+        spot_id = add_spot(connection, owner_id)
+        renters = [add_user(connection, 100001 + i) for i in range(RENTERS)]
+    start = (datetime.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    periods = [(start + timedelta(minutes=i), start + timedelta(hours=1, minutes=i)) for i in range(RENTERS)]
+    return owner_id, spot_id, renters, periods
+
+def snapshot(database, spot_id: int, owner_id: int):
+    """Брони места и запросы владельцу одним запросом: один снимок читателя"""
+    with database.reader() as connection:
+        row = connection.execute('''
+            SELECT (SELECT COUNT(*) FROM bookings WHERE spot_id = ?) as bookings,
+                   (SELECT COUNT(*) FROM notifications
+                    WHERE user_id = ? AND notification_type = 'new_booking_request') as requests
+        ''', (spot_id, owner_id)).fetchone()
+        return row['bookings'], row['requests']
+
+def test_overlapping_bookings_single_winner(database):
+    owner_id, spot_id, renters, periods = seed(database)
+    adb = AsyncDatabase(database, max_workers=database.readers_count + RENTERS)
+    seen = []
+    
+    async def read_until(done: asyncio.Event):
+        while not done.is_set():
+            seen.append(await adb.run(snapshot, database, spot_id, owner_id))
+    
+    async def main():
+        done = asyncio.Event()
+        readers = [asyncio.create_task(read_until(done)) for _ in range(database.readers_count)]
+        try:
+            return await asyncio.gather(*(
+                adb.create_booking(renter_id, spot_id, start_time, end_time)
+                for renter_id, (start_time, end_time) in zip(renters, periods)
+            ))
+        finally:
+            done.set()
+            await asyncio.gather(*readers)
+    
+    try:
+        results = asyncio.run(main())
+    finally:
+        adb._executor.shutdown(wait=True)
+    
+    created = [booking_id for booking_id in results if booking_id]
+    assert len(created) == 1
+    assert snapshot(database, spot_id, owner_id) == (1, 1)
+    # Бронь и уведомление владельцу пишутся одной транзакцией: читатель
+    # не может увидеть одно без другого
+    assert seen and all(bookings == requests for bookings, requests in seen)
+    assert {bookings for bookings, _ in seen} <= {0, 1}
+
+def test_busy_slot_rejected_after_commit(database):
+    owner_id, spot_id, renters, periods = seed(database)
+    start_time, end_time = periods[0]
+    assert database.create_booking(renters[0], spot_id, start_time, end_time)
+    assert database.create_booking(renters[1], spot_id, start_time + timedelta(minutes=30),
+                                   end_time + timedelta(minutes=30)) is None
+    assert database.create_booking(renters[2], spot_id, end_time, end_time + timedelta(hours=1))
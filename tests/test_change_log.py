@@ -0,0 +1,92 @@
+"""
+Журнал изменений между процессами: чтение чужих изменений и пропуски после очистки
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database
+
+from conftest import add_user
+
+@pytest.fixture
+def processes(tmp_path):
+    """Два экземпляра Database на одном файле, как два процесса бота"""
+    first = Database(str(tmp_path / "shared.db"))
+    second = Database(str(tmp_path / "shared.db"))
+    first.enable_change_log("first")
+    second.enable_change_log("second")
+    yield first, second
+    second.close()
+    first.close()
+
+def cached_user(database, telegram_id: int) -> int:
+    """Пользователь, прочитанный в кэш процесса"""
+    with database.transaction() as connection:
+        user_id = add_user(connection, telegram_id)
+    database.sync_external_changes()
+    assert database.get_user(user_id)
+    assert len(database.cache) == 1
+    return user_id
+
+def test_foreign_invalidation_applied(processes):
+    first, second = processes
+    user_id = cached_user(first, 300001)
+    
+    second.update_user_balance(user_id, 100, "deposit")
+    assert first.sync_external_changes() == 1
+    assert first.get_user(user_id)['balance'] == 100
+    assert first.sync_external_changes() == 0
+
+def test_commit_without_log_keeps_cache_after_prune(processes):
+    first, second = processes
+    user_id = cached_user(first, 300004)
+    second.update_user_balance(user_id, 100, "deposit")
+    first.sync_external_changes()
+    first.get_user(user_id)
+    start = datetime.now() + timedelta(days=1)
+    first.is_spot_available(1, start, start + timedelta(hours=1))
+
+    # Журнал прочитан и очищен целиком, затем чужой коммит без записи в журнал
+    assert second.prune_change_log(-60) > 0
+    first.sync_external_changes()
+    assert second.acquire_lease("leader", "second", 15)
+    assert first.sync_external_changes() == 0
+
+    assert len(first.cache) == 1
+    assert first.availability.loaded
+
+def test_pruned_log_resets_cache(processes):
+    first, second = processes
+    user_id = cached_user(first, 300002)
+    start = datetime.now() + timedelta(days=1)
+    first.is_spot_available(1, start, start + timedelta(hours=1))
+    assert first.availability.loaded
+    
+    second.update_user_balance(user_id, 100, "deposit")
+    assert second.prune_change_log(-60) > 0
+    first.sync_external_changes()
+    
+    assert len(first.cache) == 0
+    assert not first.availability.loaded
+    assert first._change_cursor == 1
+    assert first.get_user(user_id)['balance'] == 100
+
+def test_restarted_log_numbering_resets_cache(processes):
+    first, second = processes
+    user_id = cached_user(first, 300003)
+    second.update_user_balance(user_id, 100, "deposit")
+    second.update_user_balance(user_id, 100, "deposit")
+    first.sync_external_changes()
+    first.get_user(user_id)
+    cursor = first._change_cursor
+    
+    # Журнал очищен и нумерация начата заново: новая запись ниже курсора
+    with second.transaction() as connection:
+        connection.execute("DELETE FROM change_log")
+        connection.execute("DELETE FROM sqlite_sequence WHERE name = 'change_log'")
+    second.update_user_balance(user_id, 100, "deposit")
+    first.sync_external_changes()
+    
+    assert first._change_cursor < cursor
+    assert first.get_user(user_id)['balance'] == 300
@@ -0,0 +1,24 @@
+"""
+Планы горячих запросов: без полного обхода таблиц на свежей БД
+"""
+import pytest
+
+from database import HOT_QUERIES
+
+def scans_without_index(connection, query, params):
+    """Шаги SCAN плана, не покрытые индексом"""
+    plan = [row['detail'] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    return [step for step in plan if step.startswith("SCAN ") and " INDEX" not in step
+            and not step.startswith(("SCAN CONSTANT ROW", "SCAN (subquery"))]
+
+@pytest.mark.parametrize("name, query, params", HOT_QUERIES, ids=[entry[0] for entry in HOT_QUERIES])
+def test_hot_query_uses_index(database, name, query, params):
+    assert scans_without_index(database.connection, query, params) == []
+
+def test_check_query_plans_clean(database):
+    assert database.check_query_plans() == []
+
+def test_check_query_plans_reports_dropped_index(database):
+    database.connection.execute("DROP INDEX idx_bookings_status_end")
+    regressions = database.check_query_plans()
+    assert "get_active_bookings" in {regression['query'] for regression in regressions}
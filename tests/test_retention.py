@@ -0,0 +1,31 @@
+"""
+Политики хранения: граница по created_at в UTC, по срокам броней и сессий - в местном времени
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from retention import default_policies
+
+@pytest.fixture
+def local_zone(monkeypatch):
+    """Местное время на 9 часов впереди UTC"""
+    monkeypatch.setenv("TZ", "Asia/Tokyo")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_cutoff_clocks(local_zone):
+    policies = {policy.table: policy for policy in default_policies()}
+    utc_now = datetime.utcnow()
+    local_now = datetime.now()
+    assert local_now - utc_now > timedelta(hours=8)
+    
+    for table in ('logs', 'notifications', 'stats_snapshots'):
+        policy = policies[table]
+        assert abs(policy.cutoff() - (utc_now - timedelta(days=policy.days))) < timedelta(minutes=1)
+    bookings = policies['bookings']
+    assert abs(bookings.cutoff() - (local_now - timedelta(days=bookings.days))) < timedelta(minutes=1)
+    assert abs(policies['admin_sessions'].cutoff() - local_now) < timedelta(minutes=1)
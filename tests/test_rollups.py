@@ -0,0 +1,63 @@
+"""
+Агрегаты статистики: архивные брони остаются завершенными
+"""
+from datetime import datetime, timedelta
+
+from database import Database
+
+from conftest import add_spot, add_user
+
+ROLLUP_QUERIES = {
+    'rollup_daily': "SELECT SUM(completed) FROM rollup_daily",
+    'rollup_spot_daily': "SELECT SUM(completed) FROM rollup_spot_daily",
+    'rollup_hourly': "SELECT SUM(completed) FROM rollup_hourly",
+}
+
+def completed_counts(database):
+    """Число завершенных броней в каждом агрегате"""
+    with database.reader() as connection:
+        return {table: connection.execute(query).fetchone()[0] for table, query in ROLLUP_QUERIES.items()}
+
+def add_booking(database, status: str) -> int:
+    with database.transaction() as connection:
+        user_id = add_user(connection, 200001)
+        spot_id = add_spot(connection, user_id)
+        now = datetime.now()
+        return connection.execute(
+            "INSERT INTO bookings (booking_code, user_id, spot_id, start_time, end_time, "
+            "total_hours, total_price, status) VALUES ('R-1', ?, ?, ?, ?, 1, 100, ?)",
+            (user_id, spot_id, now - timedelta(days=2), now - timedelta(days=1), status)
+        ).lastrowid
+
+def set_status(database, booking_id: int, status: str):
+    with database.transaction() as connection:
+        connection.execute("UPDATE bookings SET status = ? WHERE id = ?", (status, booking_id))
+
+def test_archiving_keeps_completed(database):
+    booking_id = add_booking(database, 'active')
+    set_status(database, booking_id, 'completed')
+    assert completed_counts(database) == dict.fromkeys(ROLLUP_QUERIES, 1)
+    
+    set_status(database, booking_id, 'archived')
+    assert completed_counts(database) == dict.fromkeys(ROLLUP_QUERIES, 1)
+    
+    assert database.rebuild_rollups()
+    assert completed_counts(database) == dict.fromkeys(ROLLUP_QUERIES, 1)
+
+def test_outdated_trigger_replaced_and_rollups_rebuilt(database):
+    booking_id = add_booking(database, 'completed')
+    # Триггер из прежней версии: архивация вычитала бронь из завершенных
+    with database.transaction() as connection:
+        connection.execute("DROP TRIGGER trg_rollup_bookings_update")
+        connection.execute("CREATE TRIGGER trg_rollup_bookings_update AFTER UPDATE OF status ON bookings "
+                           "BEGIN UPDATE rollup_daily SET completed = completed - 1; END")
+    set_status(database, booking_id, 'archived')
+    database.close()
+    
+    reopened = Database(str(database.db_path))
+    try:
+        assert completed_counts(reopened) == dict.fromkeys(ROLLUP_QUERIES, 1)
+        set_status(reopened, booking_id, 'completed')
+        assert completed_counts(reopened) == dict.fromkeys(ROLLUP_QUERIES, 1)
+    finally:
+        reopened.close()
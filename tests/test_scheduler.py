@@ -0,0 +1,135 @@
+"""
+Планировщик сроков: повтор невыполненных сроков и сверка с БД
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import scheduler as scheduler_module
+from database import db
+from scheduler import AUTO_CANCEL, BookingScheduler, COMPLETE
+
+from conftest import add_spot, add_user
+
+def run_scheduler(handler, prepare=None, seconds: float = 1.0) -> BookingScheduler:
+    """Запуск планировщика с обработчиком COMPLETE на seconds секунд"""
+    async def main():
+        scheduler = BookingScheduler()
+        scheduler.register(COMPLETE, handler)
+        await scheduler.start()
+        if prepare is not None:
+            await prepare(scheduler)
+        await asyncio.sleep(seconds)
+        await scheduler.stop()
+        return scheduler
+    return asyncio.run(main())
+
+def test_failed_deadlines_are_retried(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RETRY_FIRST_SECONDS", 0.05)
+    calls = []
+    
+    async def handler(booking_ids):
+        calls.append(list(booking_ids))
+        if len(calls) == 1:
+            return None  # ошибка БД: вся пачка не выполнена
+        if len(calls) == 2:
+            return booking_ids[:1]  # выполнена часть пачки
+        return booking_ids
+    
+    async def prepare(scheduler):
+        past = datetime.now() - timedelta(seconds=1)
+        for booking_id in (1, 2):
+            scheduler.schedule(COMPLETE, booking_id, past)
+    
+    scheduler = run_scheduler(handler, prepare)
+    assert calls == [[1, 2], [1, 2], [2]]
+    assert scheduler.fired == 2
+    assert scheduler.retried == 3
+
+def test_retries_stop_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RETRY_FIRST_SECONDS", 0.01)
+    monkeypatch.setattr(scheduler_module, "RETRY_MAX_ATTEMPTS", 2)
+    calls = []
+    
+    async def handler(booking_ids):
+        calls.append(list(booking_ids))
+        raise RuntimeError("database is locked")
+    
+    async def prepare(scheduler):
+        scheduler.schedule(COMPLETE, 7, datetime.now() - timedelta(seconds=1))
+    
+    scheduler = run_scheduler(handler, prepare, seconds=0.5)
+    assert calls == [[7], [7], [7]]
+    assert scheduler.fired == 0
+
+def test_resync_restores_lost_deadline(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RETRY_MAX_ATTEMPTS", 0)
+    with db.transaction() as connection:
+        user_id = add_user(connection, 900001)
+        spot_id = add_spot(connection, user_id)
+        now = datetime.now()
+        booking_id = connection.execute(
+            "INSERT INTO bookings (booking_code, user_id, spot_id, start_time, end_time, "
+            "total_hours, total_price, status) VALUES ('T-1', ?, ?, ?, ?, 1, 100, 'active')",
+            (user_id, spot_id, now - timedelta(hours=2), now - timedelta(hours=1))
+        ).lastrowid
+    
+    calls = []
+    restored = []
+    
+    async def handler(booking_ids):
+        calls.append(list(booking_ids))
+        return None
+    
+    async def prepare(scheduler):
+        # Первый запуск из start() не удался, повторов нет: срок потерян
+        await asyncio.sleep(0.2)
+        restored.append(scheduler.pending())
+        restored.append(await scheduler.resync())
+    
+    try:
+        run_scheduler(handler, prepare, seconds=0.2)
+    finally:
+        with db.transaction() as connection:
+            connection.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+            connection.execute("DELETE FROM parking_spots WHERE id = ?", (spot_id,))
+            connection.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    
+    assert restored == [0, 1]
+    assert calls == [[booking_id], [booking_id]]
+
+def test_paid_booking_auto_cancel_dropped():
+    with db.transaction() as connection:
+        owner_id = add_user(connection, 900002)
+        renter_id = add_user(connection, 900003)
+        spot_id = add_spot(connection, owner_id)
+    start = datetime.now() + timedelta(days=2)
+    booking_id = db.create_booking(renter_id, spot_id, start, start + timedelta(hours=1))
+    calls = []
+    state = {}
+    
+    async def handler(booking_ids):
+        calls.append(list(booking_ids))
+        return []  # оплаченная бронь условной отменой не затрагивается
+    
+    async def main():
+        scheduler = BookingScheduler()
+        scheduler.register(AUTO_CANCEL, handler)
+        await scheduler.start()
+        # Срок отмены вот-вот наступит, и в этот момент приходит оплата
+        scheduler.schedule(AUTO_CANCEL, booking_id, datetime.now() + timedelta(seconds=0.3))
+        assert db.create_payment(booking_id, renter_id, 100, "card")
+        state['pending'] = scheduler.pending()
+        await asyncio.sleep(0.6)
+        state['retried'] = scheduler.retried
+        await scheduler.stop()
+    
+    try:
+        asyncio.run(main())
+    finally:
+        with db.transaction() as connection:
+            connection.execute("DELETE FROM payments WHERE booking_id = ?", (booking_id,))
+            connection.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+    
+    assert booking_id
+    assert state == {'pending': 0, 'retried': 0}
+    assert calls == []
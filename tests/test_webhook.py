@@ -0,0 +1,61 @@
+"""
+Обработка обновлений: очередь одного чата не занимает места других чатов
+"""
+import asyncio
+
+from webhook import UpdateRunner
+
+class FakeDispatcher:
+    """Диспетчер, который держит обновления чата 1 до сигнала"""
+    
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.handled = []
+        self.running = 0
+        self.max_running = 0
+    
+    async def feed_raw_update(self, bot, update):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if update['chat'] == 1:
+                await self.release.wait()
+            self.handled.append(update['update_id'])
+        finally:
+            self.running -= 1
+
+def test_burst_from_one_chat_keeps_slots_free():
+    async def main():
+        dp = FakeDispatcher()
+        runner = UpdateRunner(dp, bot=None, concurrency=2, queue_size=8)
+        for update_id in range(4):
+            await runner.submit({'update_id': update_id, 'chat': 1}, chat_id=1)
+        other = await runner.submit({'update_id': 100, 'chat': 2}, chat_id=2)
+        await asyncio.wait_for(other, timeout=1)
+        handled_before_release = list(dp.handled)
+        dp.release.set()
+        assert await runner.drain(timeout=1)
+        return dp, handled_before_release
+    
+    dp, handled_before_release = asyncio.run(main())
+    assert handled_before_release == [100]
+    assert dp.handled == [100, 0, 1, 2, 3]
+    assert dp.max_running == 2
+
+def test_full_queue_blocks_submit():
+    async def main():
+        dp = FakeDispatcher()
+        runner = UpdateRunner(dp, bot=None, concurrency=1, queue_size=2)
+        for update_id in range(2):
+            await runner.submit({'update_id': update_id, 'chat': 1}, chat_id=1)
+        blocked = asyncio.create_task(runner.submit({'update_id': 2, 'chat': 1}, chat_id=1))
+        await asyncio.sleep(0.05)
+        waiting = not blocked.done()
+        dp.release.set()
+        await blocked
+        assert await runner.drain(timeout=1)
+        return dp, waiting
+    
+    dp, waiting = asyncio.run(main())
+    assert waiting
+    assert dp.handled == [0, 1, 2]
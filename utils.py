@@ -6,7 +6,9 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
 from config import Config
-from database import db
+from database import db, adb
+from cache import TTLCache
+from retention import retention
 
 logger = logging.getLogger(__name__)
 
@@ -332,32 +334,32 @@ def calculate_net_amount(amount: float, commission_rate: float = None) -> float:
 
 # ==================== ПРОВЕРКИ ДОСТУПА ====================
 
-def is_admin(user_id: int) -> bool:
+async def is_admin(user_id: int) -> bool:
     """Проверка, является ли пользователь администратором"""
-    user = db.get_user(telegram_id=user_id)
+    user = await adb.get_user(telegram_id=user_id)
     return user and user['is_admin']
 
-def is_blocked(user_id: int) -> bool:
+async def is_blocked(user_id: int) -> bool:
     """Проверка, заблокирован ли пользователь"""
-    user = db.get_user(telegram_id=user_id)
+    user = await adb.get_user(telegram_id=user_id)
     return user and user['is_blocked']
 
-def is_spot_owner(user_id: int, spot_id: int) -> bool:
+async def is_spot_owner(user_id: int, spot_id: int) -> bool:
     """Проверка, является ли пользователь владельцем места"""
-    user = db.get_user(telegram_id=user_id)
+    user = await adb.get_user(telegram_id=user_id)
     if not user:
         return False
     
-    spot = db.get_parking_spot(spot_id)
+    spot = await adb.get_parking_spot(spot_id)
     return spot and spot['owner_id'] == user['id']
 
-def is_booking_owner(user_id: int, booking_id: int) -> bool:
+async def is_booking_owner(user_id: int, booking_id: int) -> bool:
     """Проверка, является ли пользователь владельцем бронирования"""
-    user = db.get_user(telegram_id=user_id)
+    user = await adb.get_user(telegram_id=user_id)
     if not user:
         return False
     
-    booking = db.get_booking(booking_id)
+    booking = await adb.get_booking(booking_id)
     return booking and booking['user_id'] == user['id']
 
 # ==================== УВЕДОМЛЕНИЯ ====================
@@ -366,11 +368,11 @@ async def notify_user(telegram_id: int, title: str, message: str,
                      notification_type: str = "system", data: dict = None):
     """Отправка уведомления пользователю"""
     try:
-        user = db.get_user(telegram_id=telegram_id)
+        user = await adb.get_user(telegram_id=telegram_id)
         if not user:
             return False
         
-        db.add_notification(
+        await adb.add_notification(
             user['id'],
             notification_type,
             title,
@@ -378,6 +380,8 @@ async def notify_user(telegram_id: int, title: str, message: str,
             data
         )
         
+        # В Telegram уведомление отправит notifications.dispatcher
+        
         logger.info(f"Уведомление отправлено пользователю {telegram_id}: {title}")
         return True
     except Exception as e:
@@ -387,11 +391,11 @@ async def notify_user(telegram_id: int, title: str, message: str,
 async def notify_spot_owners_new_booking(booking_id: int):
     """Уведомление владельцев мест о новом бронировании"""
     try:
-        booking = db.get_booking(booking_id)
+        booking = await adb.get_booking(booking_id)
         if not booking:
             return False
         
-        spot = db.get_parking_spot(booking['spot_id'])
+        spot = await adb.get_parking_spot(booking['spot_id'])
         if not spot:
             return False
         
@@ -412,11 +416,11 @@ async def notify_spot_owners_new_booking(booking_id: int):
 async def notify_user_booking_confirmed(booking_id: int):
     """Уведомление пользователя о подтверждении бронирования"""
     try:
-        booking = db.get_booking(booking_id)
+        booking = await adb.get_booking(booking_id)
         if not booking:
             return False
         
-        user = db.get_user(user_id=booking['user_id'])
+        user = await adb.get_user(user_id=booking['user_id'])
         if not user:
             return False
         
@@ -437,7 +441,7 @@ async def notify_user_booking_confirmed(booking_id: int):
 async def notify_admins_about_event(event_type: str, message: str, data: dict = None):
     """Уведомление всех администраторов о событии"""
     try:
-        admins = db.get_all_users(is_admin=True)
+        admins = await adb.get_all_users(is_admin=True)
         
         for admin in admins:
             await notify_user(
@@ -506,90 +510,21 @@ def parse_duration(duration_str: str) -> Optional[int]:
 def get_available_time_slots(spot_id: int, date: datetime) -> List[Dict[str, datetime]]:
     """Получение доступных временных слотов для места на указанную дату"""
     try:
-        # Начало и конец дня
-        start_of_day = datetime.combine(date.date(), datetime.min.time())
-        end_of_day = datetime.combine(date.date(), datetime.max.time())
-        
-        # Получаем бронирования на этот день
-        cursor = db.connection.cursor()
-        cursor.execute('''
-            SELECT start_time, end_time 
-            FROM bookings 
-            WHERE spot_id = ? 
-            AND status IN ('confirmed', 'active')
-            AND DATE(start_time) = DATE(?)
-            ORDER BY start_time
-        ''', (spot_id, date))
-        
-        bookings = cursor.fetchall()
-        
-        # Начинаем с начала дня
-        current_time = start_of_day
-        slots = []
-        
-        for booking in bookings:
-            booking_start = datetime.fromisoformat(booking['start_time'])
-            booking_end = datetime.fromisoformat(booking['end_time'])
-            
-            # Если есть промежуток до бронирования
-            if current_time < booking_start:
-                slots.append({
-                    'start': current_time,
-                    'end': booking_start
-                })
-            
-            current_time = booking_end
-        
-        # Добавляем слот от последнего бронирования до конца дня
-        if current_time < end_of_day:
-            slots.append({
-                'start': current_time,
-                'end': end_of_day
-            })
-        
-        # Фильтруем слоты по минимальной продолжительности
-        min_duration = timedelta(hours=Config.MIN_BOOKING_HOURS)
-        slots = [slot for slot in slots if (slot['end'] - slot['start']) >= min_duration]
-        
-        return slots
+        slots = db.get_free_slots([spot_id], date)
+        return slots.get(spot_id, {}).get(date.date(), [])
     except Exception as e:
         logger.error(f"Ошибка получения временных слотов: {e}")
         return []
 
+def get_available_time_slots_bulk(spot_ids: List[int], start_date: datetime,
+                                  days: int = 7) -> Dict[int, Dict[Any, List[Dict[str, datetime]]]]:
+    """Свободные слоты нескольких мест на несколько дней одним вызовом"""
+    return db.get_free_slots(spot_ids, start_date, days)
+
 # ==================== КЭШИРОВАНИЕ ====================
 
-class Cache:
-    """Простой кэш"""
-    _cache = {}
-    
-    @classmethod
-    def get(cls, key: str, default=None):
-        return cls._cache.get(key, default)
-    
-    @classmethod
-    def set(cls, key: str, value, ttl: int = 300):
-        """Установка значения с временем жизни (секунды)"""
-        expire_time = datetime.now() + timedelta(seconds=ttl)
-        cls._cache[key] = {
-            'value': value,
-            'expire': expire_time
-        }
-    
-    @classmethod
-    def delete(cls, key: str):
-        cls._cache.pop(key, None)
-    
-    @classmethod
-    def clear_expired(cls):
-        """Очистка просроченных записей"""
-        now = datetime.now()
-        expired_keys = [
-            key for key, data in cls._cache.items()
-            if data['expire'] < now
-        ]
-        
-        for key in expired_keys:
-            cls.delete(key)
+# Общий кэш обработчиков: ограничен по размеру, записи истекают при чтении
+Cache = TTLCache(max_size=1000, ttl=300, name="utils")
 
 # ==================== ЛОГГИРОВАНИЕ ====================
 
@@ -610,10 +545,10 @@ def setup_logging():
     import os
     os.makedirs('logs', exist_ok=True)
 
-def log_user_action(user_id: int, action: str, details: str = None):
+async def log_user_action(user_id: int, action: str, details: str = None):
     """Логирование действий пользователя"""
     try:
-        db.add_log(user_id, action, details)
+        await adb.add_log(user_id, action, details)
         logger.info(f"Действие пользователя {user_id}: {action} - {details}")
     except Exception as e:
         logger.error(f"Ошибка логирования действия: {e}")
@@ -623,25 +558,8 @@ def log_user_action(user_id: int, action: str, details: str = None):
 async def cleanup_old_data():
     """Очистка старых данных"""
     try:
-        # Очищаем старые бронирования
-        cutoff_date = datetime.now() - timedelta(days=90)
-        
-        cursor = db.connection.cursor()
-        cursor.execute('''
-            UPDATE bookings 
-            SET status = 'archived' 
-            WHERE status = 'completed' 
-            AND end_time < ?
-        ''', (cutoff_date,))
-        
-        # Очищаем старые уведомления
-        cursor.execute('''
-            DELETE FROM notifications 
-            WHERE is_read = 1 
-            AND created_at < ?
-        ''', (cutoff_date,))
-        
-        db.connection.commit()
+        # Порциями по политикам хранения, без долгой блокировки БД
+        await retention.run()
         
         # Очищаем кэш
         Cache.clear_expired()
@@ -663,55 +581,56 @@ def get_user_stats(user_id: int) -> Dict[str, Any]:
         if not user:
             return stats
         
-        cursor = db.connection.cursor()
-        
-        # Бронирования
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_bookings,
-                SUM(total_price) as total_spent,
-                AVG(total_price) as avg_booking_price,
-                SUM(total_hours) as total_hours
-            FROM bookings 
-            WHERE user_id = ?
-        ''', (user['id'],))
-        
-        booking_stats = cursor.fetchone()
-        if booking_stats:
-            stats['total_bookings'] = booking_stats['total_bookings'] or 0
-            stats['total_spent'] = booking_stats['total_spent'] or 0
-            stats['avg_booking_price'] = booking_stats['avg_booking_price'] or 0
-            stats['total_hours'] = booking_stats['total_hours'] or 0
-        
-        # Места
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_spots,
-                SUM(total_earnings) as total_earnings,
-                AVG(rating) as avg_spot_rating
-            FROM parking_spots 
-            WHERE owner_id = ? AND is_active = 1
-        ''', (user['id'],))
-        
-        spot_stats = cursor.fetchone()
-        if spot_stats:
-            stats['total_spots'] = spot_stats['total_spots'] or 0
-            stats['total_earnings'] = spot_stats['total_earnings'] or 0
-            stats['avg_spot_rating'] = spot_stats['avg_spot_rating'] or 0
-        
-        # Отзывы
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_reviews,
-                AVG(rating) as avg_review_rating
-            FROM reviews 
-            WHERE reviewee_id = ?
-        ''', (user['id'],))
-        
-        review_stats = cursor.fetchone()
-        if review_stats:
-            stats['total_reviews'] = review_stats['total_reviews'] or 0
-            stats['avg_review_rating'] = review_stats['avg_review_rating'] or 0
+        with db.reader() as connection:
+            cursor = connection.cursor()
+            
+            # Бронирования
+            cursor.execute('''
+                SELECT 
+                    COUNT(*) as total_bookings,
+                    SUM(total_price) as total_spent,
+                    AVG(total_price) as avg_booking_price,
+                    SUM(total_hours) as total_hours
+                FROM bookings_all 
+                WHERE user_id = ?
+            ''', (user['id'],))
+            
+            booking_stats = cursor.fetchone()
+            if booking_stats:
+                stats['total_bookings'] = booking_stats['total_bookings'] or 0
+                stats['total_spent'] = booking_stats['total_spent'] or 0
+                stats['avg_booking_price'] = booking_stats['avg_booking_price'] or 0
+                stats['total_hours'] = booking_stats['total_hours'] or 0
+            
+            # Места
+            cursor.execute('''
+                SELECT 
+                    COUNT(*) as total_spots,
+                    SUM(total_earnings) as total_earnings,
+                    AVG(rating) as avg_spot_rating
+                FROM parking_spots 
+                WHERE owner_id = ? AND is_active = 1
+            ''', (user['id'],))
+            
+            spot_stats = cursor.fetchone()
+            if spot_stats:
+                stats['total_spots'] = spot_stats['total_spots'] or 0
+                stats['total_earnings'] = spot_stats['total_earnings'] or 0
+                stats['avg_spot_rating'] = spot_stats['avg_spot_rating'] or 0
+            
+            # Отзывы
+            cursor.execute('''
+                SELECT 
+                    COUNT(*) as total_reviews,
+                    AVG(rating) as avg_review_rating
+                FROM reviews 
+                WHERE reviewee_id = ?
+            ''', (user['id'],))
+            
+            review_stats = cursor.fetchone()
+            if review_stats:
+                stats['total_reviews'] = review_stats['total_reviews'] or 0
+                stats['avg_review_rating'] = review_stats['avg_review_rating'] or 0
         
         return stats
     except Exception as e:
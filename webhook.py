@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Прием обновлений через webhook (aiohttp)
+"""
+import asyncio
+import json
+import logging
+import signal
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать обработки принятых обновлений при остановке
+DRAIN_TIMEOUT_SECONDS = 10
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """Чат обновления: обновления одного чата обрабатываются по порядку"""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get('chat') or (event.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+    return 0
+
+class UpdateRunner:
+    """Обработка обновлений диспетчером.
+    
+    Обновления одного чата идут строго по очереди (состояние FSM не
+    обгоняет само себя), разных чатов - параллельно, не больше
+    concurrency одновременно. Место обработки занимает только
+    обновление, дождавшееся предыдущих в своем чате, поэтому очередь
+    одного чата не держит места других. Принятых и еще не обработанных
+    обновлений не больше queue_size: когда очередь полна, submit() ждет,
+    и нагрузка доходит до Telegram, который держит не больше
+    max_connections запросов к webhook.
+    """
+    
+    def __init__(self, dp: Dispatcher, bot: Bot, concurrency: int = None,
+                 before_update: Callable[[], Awaitable] = None, queue_size: int = None):
+        self.dp = dp
+        self.bot = bot
+        self.concurrency = concurrency or Config.UPDATE_CONCURRENCY
+        self.queue_size = max(queue_size or Config.UPDATE_QUEUE_SIZE, self.concurrency)
+        self.before_update = before_update
+        # Вызывается с обновлением и временем его обработки в секундах
+        self.on_done: Optional[Callable[[Dict[str, Any], float], Any]] = None
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._queued = asyncio.Semaphore(self.queue_size)
+        self._tails: Dict[int, asyncio.Task] = {}
+        self.processed = 0
+        self.failed = 0
+    
+    async def submit(self, update: Dict[str, Any], chat_id: int = None) -> asyncio.Task:
+        """Постановка обновления в обработку; ждет, если очередь полна"""
+        if chat_id is None:
+            chat_id = update_chat_id(update)
+        await self._queued.acquire()
+        task = asyncio.create_task(self._handle(chat_id, update, self._tails.get(chat_id), monotonic()))
+        self._tails[chat_id] = task
+        return task
+    
+    async def _handle(self, chat_id: int, update: Dict[str, Any],
+                      previous: Optional[asyncio.Task], received: float):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with self._slots:
+                if self.before_update is not None:
+                    await self.before_update()
+                await self.dp.feed_raw_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            self._queued.release()
+            if self._tails.get(chat_id) is asyncio.current_task():
+                del self._tails[chat_id]
+            if self.on_done is not None:
+                self.on_done(update, monotonic() - received)
+    
+    def in_flight(self) -> int:
+        """Чатов с необработанными обновлениями"""
+        return len(self._tails)
+    
+    async def drain(self, timeout: float = DRAIN_TIMEOUT_SECONDS) -> bool:
+        """Ожидание обработки всех принятых обновлений"""
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()), timeout=timeout)
+        if self._tails:
+            logger.warning(f"⚠️ Не дождались обработки обновлений в {len(self._tails)} чатах")
+            return False
+        return True
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики обработки"""
+        return {
+            'processed': self.processed,
+            'failed': self.failed,
+            'in_flight': self.in_flight()
+        }
+
+class WebhookServer:
+    """HTTP-сервер webhook: принимает обновление, ставит в обработку и сразу отвечает.
+    
+    При остановке сначала закрывается прием (aiohttp дожидается текущих
+    запросов), затем дорабатываются принятые обновления. Если задан
+    record_path, каждое принятое обновление дописывается в файл JSON
+    Lines - по нему replay.py воспроизводит нагрузку.
+    """
+    
+    def __init__(self, runner: UpdateRunner, host: str = None, port: int = None,
+                 path: str = None, secret: str = None, record_path: str = None):
+        self.runner = runner
+        self.host = host or Config.WEBHOOK_HOST
+        self.port = port or Config.WEBHOOK_PORT
+        self.path = path or Config.WEBHOOK_PATH
+        self.secret = Config.WEBHOOK_SECRET if secret is None else secret
+        self.record_path = record_path
+        self._record = None
+        self._app_runner: Optional[web.AppRunner] = None
+        self.received = 0
+    
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Прием обновления от Telegram"""
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=401)
+        update = await request.json()
+        self.received += 1
+        if self._record is not None:
+            self._record.write(json.dumps(update, ensure_ascii=False) + "\n")
+        await self.runner.submit(update)
+        return web.Response()
+    
+    async def start(self):
+        """Запуск HTTP-сервера"""
+        if self.record_path:
+            self._record = open(self.record_path, "a", encoding="utf-8", buffering=1)
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        self._app_runner = web.AppRunner(app)
+        await self._app_runner.setup()
+        await web.TCPSite(self._app_runner, self.host, self.port).start()
+        logger.info(f"🌐 Прием webhook: {self.host}:{self.port}{self.path}, "
+                    f"одновременно обновлений: {self.runner.concurrency}")
+    
+    async def stop(self, timeout: float = DRAIN_TIMEOUT_SECONDS):
+        """Закрытие приема и обработка уже принятых обновлений"""
+        if self._app_runner:
+            await self._app_runner.cleanup()
+            self._app_runner = None
+        await self.runner.drain(timeout)
+        if self._record is not None:
+            self._record.close()
+            self._record = None
+        logger.info(f"✅ Прием webhook остановлен, принято обновлений: {self.received}")
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Работа бота через webhook до сигнала остановки"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    server = WebhookServer(UpdateRunner(dp, bot), record_path=Config.WEBHOOK_RECORD_PATH or None)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start()
+        await bot.set_webhook(
+            url=Config.WEBHOOK_URL + server.path,
+            secret_token=server.secret or None,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        await stop.wait()
+    finally:
+        logger.info("🛑 Остановка приема webhook...")
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()